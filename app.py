@@ -1,163 +1,258 @@
-from flask import Flask, render_template, Response, request, redirect, url_for, jsonify, send_from_directory, session
+from flask import Flask, abort, render_template, Response, request, redirect, url_for, jsonify, send_file, send_from_directory, session, stream_with_context
+import atexit
+import base64
 import cv2
+import csv
+import io
+import json
 import os
+import time
 from datetime import datetime
-import json
-import face_recognition
 import numpy as np
+from attendance_store import DEFAULT_STORE_PATH, SQLITE_BACKEND, open_attendance_store
+from attendance_writer import AttendanceWriter, SeenToday, seen_path
+from detectors import AdaptiveScaler, FaceLocator, RegionOfInterest, create_detector
+from encoder import LARGE_LANDMARKS, default_encoder
+from engine import AttendanceSink, LiveTemplateSink, RecognitionEngine, annotations, draw_faces, scene_summary
+from face_cache import CACHE_DIRECTORY, FACES_DIRECTORY, FaceEncodingCache, identity_name
+from gallery import MAX_TEMPLATES_PER_IDENTITY, FaceGallery
+from liveness import LivenessChecker
+from matcher import MIN_REDUCTION
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, log_event, render as render_metrics
+from pipeline import DROP_OLDEST, FramePipeline
+from profiler import SamplingProfiler
+from recognition_service import MAX_BATCH_FRAMES, Overloaded, RecognitionService, read_frame
+from scheduler import FrameScheduler
+from streaming import MULTIPART_BOUNDARY, StreamSettings, encode_jpeg, part_renderer
+from thumbnails import THUMBNAIL_DIRECTORY, ThumbnailCache
+from tracker import FaceTracker
+from warmup import Warmup
 
 # Constants
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
 FRAME_RESIZE_FACTOR = 0.25  # Reduced from 0.5 to 0.25 for faster processing
-FRAME_SCALE_FACTOR = 4      # Increased from 2 to 4 to match resize factor
-ATTENDANCE_CHECK_INTERVAL = 300  # seconds (5 minutes)
-FRAME_SKIP_RATE = 3         # Process every 3rd frame instead of every 2nd
-FACES_DIRECTORY = 'faces'
-ATTENDANCE_DIRECTORY = 'static/attendance'
-SUPPORTED_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
-RECTANGLE_COLOR = (0, 255, 0)  # Green
-RECTANGLE_THICKNESS = 2
-TEXT_COLOR = (255, 255, 255)  # White
-TEXT_SCALE = 0.5
+DETECTOR_BACKEND = 'hog'    # 'hog', 'cnn', 'haar' or 'dnn'; see detectors.py
+DETECTOR_OPTIONS = {}       # e.g. {'upsample': 2} for hog/cnn
+CAMERA_ROI = None           # list of polygons [[(x, y), ...], ...] in full-frame pixels
+ADAPTIVE_SCALING = True     # pick the resize factor from recent face sizes
+MIN_RESIZE_FACTOR = 0.25
+MAX_RESIZE_FACTOR = 0.5
+LIVENESS_CHECK = True       # require a blink before recording attendance
+# Recognition is scheduled by scene motion and load instead of every Nth
+# frame; see scheduler.py and /video_feed/scheduler
+RECOGNITION_ACTIVE_PERIOD = 0.1  # seconds between recognitions while people move or arrive
+RECOGNITION_IDLE_PERIOD = 2.0    # seconds between recognitions of a still scene
+MOTION_THRESHOLD = 1.5           # mean grey-level change between frames that counts as motion
+RECOGNITION_CPU_BUDGET = 0.6     # share of one core the camera's recognition may use
+RECOGNITION_LATENCY_TARGET = 0.5  # seconds per frame; slower frames make the scheduler back off
+RECOGNITION_WORKERS = 1
+RECOGNITION_QUEUE_SIZE = 1
+RECOGNITION_DROP_POLICY = DROP_OLDEST  # always recognize the freshest frame
+MAX_RECOGNITION_AGE = 1.0   # seconds; older frames are skipped by recognition workers
+TRACK_REVERIFY_INTERVAL = 5.0          # seconds before a recognized face is re-encoded
+TRACK_UNKNOWN_REVERIFY_INTERVAL = 1.0  # seconds between retries for unknown faces
+BROADCAST_BUFFER_SIZE = 8   # annotated frames kept for /video_feed viewers
+MAX_SUBSCRIBER_BACKLOG = 0  # slow viewers skip straight to the newest frame
+FACES_PAGE_SIZE = 60
+MAX_FACES_PAGE_SIZE = 500
+FACE_IMAGE_MAX_AGE = 300    # seconds browsers reuse a photo or thumbnail before revalidating
+TEMPLATE_REDUCTION = MIN_REDUCTION  # 'min', 'mean' or 'centroid'; see matcher.py
+LIVE_TEMPLATES = False           # also enroll confident, blink-verified faces from the camera
+ATTENDANCE_BACKEND = SQLITE_BACKEND
+ATTENDANCE_STORE_PATH = DEFAULT_STORE_PATH
+ATTENDANCE_SEEN_PATH = seen_path(ATTENDANCE_STORE_PATH)  # today's checked-in names, shared by workers
+ATTENDANCE_PAGE_SIZE = 50
+MAX_ATTENDANCE_PAGE_SIZE = 500
+CSV_EXPORT_CHUNK_SIZE = 500  # rows per streamed chunk
+PROFILER_ENDPOINTS = os.environ.get('PROFILER_ENDPOINTS') == '1'  # /debug/profiler routes
+WARMUP_MODE = os.environ.get('WARMUP_MODE', 'background')  # 'background', 'eager' or 'lazy'
+RECOGNIZE_RESIZE_FACTOR = 0.5    # client-pushed frames vary in size; detect at half resolution
+RECOGNIZE_DECODE_WORKERS = 2
+RECOGNIZE_WORKERS = 1
+RECOGNIZE_MAX_PENDING = 8        # frames queued for /recognize before clients get a 503
+RECOGNIZE_RETRY_AFTER = 1        # seconds, sent with 503 responses
+REGISTER_WARMUP_TIMEOUT = 30.0  # seconds /register waits for the models before giving up
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
 
-known_face_encodings = []
-known_face_names = []
+# /view_faces shows small cached copies of the photos; new enrollments get
+# theirs built in the background
+face_thumbnails = ThumbnailCache(FACES_DIRECTORY, THUMBNAIL_DIRECTORY)
+face_gallery = FaceGallery(FACES_DIRECTORY,
+                           FaceEncodingCache(FACES_DIRECTORY, CACHE_DIRECTORY),
+                           reduction=TEMPLATE_REDUCTION,
+                           max_templates=MAX_TEMPLATES_PER_IDENTITY,
+                           thumbnails=face_thumbnails)
 
 def load_known_faces():
-    global known_face_encodings, known_face_names
-    known_face_encodings = []
-    known_face_names = []
-    
-    if not os.path.exists(FACES_DIRECTORY):
-        os.makedirs(FACES_DIRECTORY)
-    
-    for filename in os.listdir(FACES_DIRECTORY):
-        if filename.endswith(SUPPORTED_IMAGE_EXTENSIONS):
-            name = filename[:-4]  # Remove extension
-            image_path = os.path.join(FACES_DIRECTORY, filename)
-            print(f"Loading face: {image_path}")
-            
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
-            
-            if face_encodings:
-                known_face_encodings.append(face_encodings[0])
-                known_face_names.append(name)
-                print(f"Successfully loaded face: {name}")
-            else:
-                print(f"No face detected in: {filename}")
-
-load_known_faces()
-
-video_capture = None
-last_attendance_check = {}
-
-def get_video_capture():
-    global video_capture
-    if video_capture is None:
-        video_capture = cv2.VideoCapture(0)
-        video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-        video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+    # Only new or changed images are re-encoded; the rest come from the
+    # memory-mapped cache shared by all workers.
+    start = time.perf_counter()
+    snapshot = face_gallery.load()
+    # The matcher (and its partition index on large galleries) is built
+    # lazily; building it here puts it in the master's memory before fork
+    snapshot.matcher
+    log_event('gallery_loaded', faces=len(snapshot),
+              seconds=round(time.perf_counter() - start, 3))
+
+face_locator = FaceLocator(create_detector(DETECTOR_BACKEND, **DETECTOR_OPTIONS),
+                           resize_factor=FRAME_RESIZE_FACTOR,
+                           roi=RegionOfInterest(CAMERA_ROI) if CAMERA_ROI else None,
+                           scaler=AdaptiveScaler(MIN_RESIZE_FACTOR, MAX_RESIZE_FACTOR)
+                           if ADAPTIVE_SCALING else None)
+face_encoder = default_encoder()
+face_tracker = FaceTracker(reverify_interval=TRACK_REVERIFY_INTERVAL,
+                           unknown_reverify_interval=TRACK_UNKNOWN_REVERIFY_INTERVAL)
+liveness_checker = LivenessChecker() if LIVENESS_CHECK else None
+attendance_store = open_attendance_store(ATTENDANCE_BACKEND, ATTENDANCE_STORE_PATH)
+# Check-ins are queued and written in batches by a background thread, so
+# storage speed never shows up in the video path
+attendance_seen = SeenToday(ATTENDANCE_SEEN_PATH)
+attendance_writer = AttendanceWriter(attendance_store, attendance_seen)
+
+def load_liveness_model():
+    # Only needed when the encoder's landmarks are not shared with the check
+    if liveness_checker is not None and face_encoder.landmark_model != LARGE_LANDMARKS:
+        liveness_checker.predictor
+
+# dlib's models and the gallery take seconds to load, so importing the app
+# only schedules them: pages that do not recognize faces are served at once,
+# and /ready reports when recognition is warm. With gunicorn's preload_app
+# (gunicorn.conf.py) the master warms up once before forking the workers.
+recognition_warmup = Warmup([('models', face_encoder.load),
+                             ('liveness', load_liveness_model),
+                             ('gallery', load_known_faces)])
+if WARMUP_MODE == 'background':
+    recognition_warmup.start()
+elif WARMUP_MODE == 'eager':
+    recognition_warmup.run()
+
+# Frames pushed to /recognize come from many clients, so they get their own
+# locator: no camera ROI and no adaptive scale learned from one camera
+recognize_locator = FaceLocator(create_detector(DETECTOR_BACKEND, **DETECTOR_OPTIONS),
+                                resize_factor=RECOGNIZE_RESIZE_FACTOR)
+
+def current_matcher():
+    return face_gallery.snapshot().matcher
+
+# One engine per kind of stream: the camera's keeps tracks, blink state and
+# records attendance; pushed frames come from unrelated clients, so theirs
+# only recognizes. Faces the tracker already identified skip the encoder.
+camera_engine = RecognitionEngine(current_matcher, face_locator, face_encoder,
+                                  tracker=face_tracker, liveness=liveness_checker,
+                                  sinks=[AttendanceSink(attendance_writer)] +
+                                  ([LiveTemplateSink(face_gallery)] if LIVE_TEMPLATES else []))
+pushed_engine = RecognitionEngine(current_matcher, recognize_locator, face_encoder)
+
+recognition_service = RecognitionService(pushed_engine.process,
+                                         decode_workers=RECOGNIZE_DECODE_WORKERS,
+                                         recognition_workers=RECOGNIZE_WORKERS,
+                                         max_pending=RECOGNIZE_MAX_PENDING)
+
+def open_video_capture():
+    video_capture = cv2.VideoCapture(0)
+    video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+    video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
     return video_capture
 
-def generate_frames():
-    global video_capture
-    frame_count = 0
-    while True:
-        # Check if video_capture is None (manually stopped) before trying to get it
-        if video_capture is None:
-            break
-            
-        if not video_capture.isOpened():
-            break
-            
-        ret, frame = video_capture.read()
-        if not ret:
-            break
-            
-        frame_count += 1
-        # Process every 3rd frame instead of every 2nd to reduce processing load
-        if frame_count % FRAME_SKIP_RATE != 0:
-            # Still yield frames for display even when not processing faces
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            continue
-            
-        # Only do face recognition processing on every 3rd frame
-        small_frame = cv2.resize(frame, (0, 0), fx=FRAME_RESIZE_FACTOR, fy=FRAME_RESIZE_FACTOR)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-        
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            top *= FRAME_SCALE_FACTOR
-            right *= FRAME_SCALE_FACTOR
-            bottom *= FRAME_SCALE_FACTOR
-            left *= FRAME_SCALE_FACTOR
-            
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-            name = "Unknown"
-            
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = known_face_names[first_match_index]
-                
-                current_time = datetime.now()
-                if name not in last_attendance_check or \
-                   (current_time - last_attendance_check[name]).total_seconds() > ATTENDANCE_CHECK_INTERVAL:
-                    record_attendance(name)
-                    last_attendance_check[name] = current_time
-                    print(f"Recording attendance for {name}")
-            
-            cv2.rectangle(frame, (left, top), (right, bottom), RECTANGLE_COLOR, RECTANGLE_THICKNESS)
-            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), RECTANGLE_COLOR, cv2.FILLED)
-            font = cv2.FONT_HERSHEY_DUPLEX
-            cv2.putText(frame, name, (left + 6, bottom - 6), font, TEXT_SCALE, TEXT_COLOR, 1)
-        
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+def recognize_frame(frame):
+    """Recognize the faces in a camera frame; check-ins go to the attendance writer.
+
+    Returns ``[((top, right, bottom, left), label), ...]`` in full-frame coordinates,
+    or no faces at all until the models are loaded.
+    """
+    if not recognition_warmup.ready:
+        recognition_warmup.start()
+        return []
+    return annotations(camera_engine.process(frame))
 
-def record_attendance(name):
+recognition_scheduler = FrameScheduler(active_period=RECOGNITION_ACTIVE_PERIOD,
+                                       idle_period=RECOGNITION_IDLE_PERIOD,
+                                       motion_threshold=MOTION_THRESHOLD,
+                                       cpu_budget=RECOGNITION_CPU_BUDGET,
+                                       latency_target=RECOGNITION_LATENCY_TARGET,
+                                       summarize=scene_summary)
+
+# Capture, recognition and JPEG encoding run as separate stages so a slow
+# recognition frame never stalls the video stream.
+video_pipeline = FramePipeline(open_video_capture, recognize_frame, draw_faces,
+                               recognition_workers=RECOGNITION_WORKERS,
+                               scheduler=recognition_scheduler,
+                               max_recognition_age=MAX_RECOGNITION_AGE,
+                               recognition_queue_size=RECOGNITION_QUEUE_SIZE,
+                               recognition_drop_policy=RECOGNITION_DROP_POLICY,
+                               broadcast_buffer_size=BROADCAST_BUFFER_SIZE,
+                               max_subscriber_backlog=MAX_SUBSCRIBER_BACKLOG)
+# Join the stage threads before the interpreter tears down dlib/OpenCV, then
+# write out check-ins still queued (atexit runs these in reverse order)
+atexit.register(attendance_writer.stop)
+atexit.register(face_thumbnails.stop)
+atexit.register(video_pipeline.stop)
+profiler = SamplingProfiler()
+
+def _pipeline_dropped_frames():
+    stats = video_pipeline.stats()
+    return {'recognition': stats['dropped']['recognition'],
+            'display': stats['dropped']['display'],
+            'stale': stats['stale_frames']}
+
+# Scrape-time views of state kept elsewhere; stage latencies and attendance
+# write latency are recorded where the work happens (see metrics.py).
+Gauge('display_fps', 'Annotated frames published per second',
+      callback=lambda: video_pipeline.display_rate.rate())
+Gauge('recognition_fps', 'Frames recognized per second',
+      callback=lambda: video_pipeline.recognition_rate.rate())
+Gauge('dropped_frames_total', 'Frames dropped by the pipeline', ('reason',),
+      callback=_pipeline_dropped_frames, kind='counter')
+Gauge('gallery_size', 'Enrolled faces', callback=lambda: len(face_gallery.snapshot()))
+Gauge('recognition_ready', 'Whether models and gallery are loaded (1) or not (0)',
+      callback=lambda: float(recognition_warmup.ready))
+Gauge('active_streams', 'Connected /video_feed viewers',
+      callback=lambda: video_pipeline.broadcaster.subscriber_count())
+Gauge('display_frames_skipped_total', 'Frames not drawn or published', ('reason',),
+      callback=lambda: {'unwatched': video_pipeline.unwatched_frames,
+                        'unchanged': video_pipeline.unchanged_frames}, kind='counter')
+Gauge('recognize_pending_frames', 'Pushed frames queued or being recognized',
+      callback=lambda: recognition_service.pending)
+Gauge('recognize_frames_total', 'Pushed frames by outcome', ('outcome',),
+      callback=lambda: {'completed': recognition_service.completed,
+                        'rejected': recognition_service.rejected}, kind='counter')
+stream_bytes_sent = Counter('stream_bytes_sent_total', 'JPEG stream bytes sent to viewers')
+Gauge('attendance_pending_events', 'Check-ins queued for the attendance writer',
+      callback=attendance_writer.pending)
+Gauge('attendance_events_total', 'Check-ins handled by the attendance writer', ('outcome',),
+      callback=lambda: {'recorded': attendance_writer.recorded,
+                        'duplicate': attendance_writer.duplicates,
+                        'dropped': attendance_writer.dropped,
+                        'error': attendance_writer.errors}, kind='counter')
+Gauge('face_thumbnails_pending', 'Gallery thumbnails queued for the background builder',
+      callback=face_thumbnails.pending)
+Gauge('recognition_schedule_rate', 'Camera recognitions per second the scheduler allows',
+      callback=recognition_scheduler.rate)
+Gauge('recognition_schedule_decisions_total', 'Captured frames by scheduler decision',
+      ('decision',), callback=lambda: dict(recognition_scheduler.decisions), kind='counter')
+Gauge('active_tracks', 'Faces currently tracked', callback=lambda: len(face_tracker.tracks))
+Gauge('encodings_skipped_total', 'Faces matched from their track without encoding',
+      callback=lambda: face_tracker.encodings_skipped, kind='counter')
+
+def generate_frames(settings):
+    # Every viewer reads the same annotated frames, and viewers asking for the
+    # same quality and width share each JPEG; only the frame rate is per client
+    subscriber = video_pipeline.subscribe()
+    subscriber.settings = settings.as_dict()
+    log_event('stream_opened', subscriber=subscriber.id, **subscriber.settings,
+              active_streams=video_pipeline.broadcaster.subscriber_count())
     try:
-        if not os.path.exists(ATTENDANCE_DIRECTORY):
-            os.makedirs(ATTENDANCE_DIRECTORY)
-        
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        current_time = datetime.now().strftime('%H:%M:%S')
-        attendance_file = os.path.join(ATTENDANCE_DIRECTORY, f'{current_date}.json')
-        
-        attendance_data = []
-        if os.path.exists(attendance_file):
-            with open(attendance_file, 'r') as f:
-                attendance_data = json.load(f)
-        
-        for entry in attendance_data:
-            if entry['name'] == name and entry['date'] == current_date:
-                print(f"Attendance already recorded for {name} today")
-                return
-        
-        new_record = {
-            'name': name,
-            'date': current_date,
-            'time': current_time
-        }
-        attendance_data.append(new_record)
-        
-        with open(attendance_file, 'w') as f:
-            json.dump(attendance_data, f, indent=4)
-        
-        print(f"Attendance recorded for {name} at {current_time}")
-    except Exception as e:
-        print(f"Error recording attendance: {str(e)}")
+        for part in subscriber.frames(part_renderer(settings), settings.key,
+                                      settings.min_interval):
+            stream_bytes_sent.inc(len(part))
+            yield part
+    finally:
+        log_event('stream_closed', subscriber=subscriber.id, frames_sent=subscriber.frames_sent,
+                  frames_skipped=subscriber.frames_skipped, bytes_sent=subscriber.bytes_sent)
 
 @app.route('/')
 def index():
@@ -179,23 +274,164 @@ def set_privacy_notice():
 
 @app.route('/video_feed')
 def video_feed():
-    # Initialize video capture when feed is requested
-    get_video_capture()
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    """MJPEG stream; ``fps``, ``quality`` and ``width`` (or ``mode=thumbnail``) tune it per viewer"""
+    settings = StreamSettings.from_args(request.args, CAMERA_WIDTH)
+    # Start the capture pipeline when feed is requested
+    video_pipeline.start()
+    return Response(generate_frames(settings),
+                    mimetype=f'multipart/x-mixed-replace; boundary={MULTIPART_BOUNDARY}')
+
+@app.route('/video_feed/snapshot.jpg')
+def video_feed_snapshot():
+    """Latest annotated frame as one JPEG (a thumbnail by default), for polling dashboards"""
+    settings = StreamSettings.from_args(request.args, CAMERA_WIDTH, mode='thumbnail')
+    video_pipeline.start()
+    frame = video_pipeline.broadcaster.latest()
+    if frame is None:
+        return jsonify({'error': 'No frame available'}), 503
+    jpeg = frame.payload(('snapshot',) + settings.key,
+                         lambda image: encode_jpeg(image, settings.quality, settings.width))
+    if jpeg is None:
+        return jsonify({'error': 'Could not encode frame'}), 500
+    stream_bytes_sent.inc(len(jpeg))
+    response = Response(jpeg, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/video_feed/stats')
+def video_feed_stats():
+    """Pipeline throughput and per-viewer lag"""
+    stats = video_pipeline.stats()
+    stats['tracker'] = {
+        'active_tracks': len(face_tracker.tracks),
+        'encodings_skipped': face_tracker.encodings_skipped
+    }
+    if liveness_checker is not None:
+        stats['liveness'] = liveness_checker.stats()
+    stats['recognize_api'] = recognition_service.stats()
+    stats['attendance'] = attendance_writer.stats()
+    return jsonify(stats)
+
+@app.route('/video_feed/scheduler', methods=['GET', 'POST'])
+def video_feed_scheduler():
+    """Recognition rate and recent decisions; POST a JSON object of settings to tune them"""
+    if request.method == 'POST':
+        settings = request.get_json(silent=True)
+        if not isinstance(settings, dict):
+            return jsonify({'error': 'Expected a JSON object of settings'}), 400
+        try:
+            recognition_scheduler.configure(**settings)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        log_event('scheduler_configured', **settings)
+    return jsonify(recognition_scheduler.stats(request.args.get('history', 20, type=int)))
+
+def service_unavailable(error):
+    response = jsonify({'error': error})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RECOGNIZE_RETRY_AFTER)
+    return response
+
+@app.route('/recognize', methods=['POST'])
+def recognize():
+    """Recognize faces in client-pushed frames.
+
+    The body is one JPEG (``Content-Type: image/jpeg``) or a multipart form
+    with up to ``MAX_BATCH_FRAMES`` image files. Returns boxes, names and
+    distances per frame, in order; 503 with ``Retry-After`` while the models
+    load or the queue is full.
+    """
+    if request.files:
+        frames = [f.read() for _, f in request.files.items(multi=True)]
+    else:
+        frames = [request.get_data()]
+    if not frames or not any(frames):
+        return jsonify({'error': 'No frames in request'}), 400
+    if len(frames) > MAX_BATCH_FRAMES:
+        return jsonify({'error': f'At most {MAX_BATCH_FRAMES} frames per request'}), 413
+    if not recognition_warmup.ready:
+        recognition_warmup.start()
+        return service_unavailable('Face recognition is still starting')
+    try:
+        results = recognition_service.recognize_batch(frames)
+    except Overloaded as e:
+        log_event('recognize_rejected', frames=len(frames), reason=str(e))
+        return service_unavailable('Recognition queue is full')
+    return jsonify({'frames': results})
+
+@app.route('/recognize/stream', methods=['POST'])
+def recognize_stream():
+    """Recognize a stream of frames, each a 4-byte big-endian length then the JPEG.
+
+    Results come back as one JSON line per frame, in order, while the client
+    is still sending; a client that pushes faster than frames are recognized
+    is held back by TCP flow control.
+    """
+    if not recognition_warmup.ready:
+        recognition_warmup.start()
+        return service_unavailable('Face recognition is still starting')
+    stream = request.stream
+
+    def generate():
+        for result in recognition_service.stream(lambda: read_frame(stream)):
+            yield json.dumps(result).encode() + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/capture')
+def capture():
+    """Clean frame from the live feed (no boxes drawn) as a data URL for the register preview"""
+    if not video_pipeline.running:
+        return jsonify({'success': False, 'error': 'Video feed is not running'}), 409
+    frame = video_pipeline.grab()
+    if frame is None:
+        return jsonify({'success': False, 'error': 'No frame from the camera'}), 504
+    ret, buffer = cv2.imencode('.jpg', frame)
+    if not ret:
+        return jsonify({'success': False, 'error': 'Could not encode frame'}), 500
+    # Returned inline rather than saved, so captures never outlive the page
+    return jsonify({'success': True,
+                    'image_url': 'data:image/jpeg;base64,' + base64.b64encode(buffer).decode()})
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once models and gallery are loaded, 503 before"""
+    if WARMUP_MODE != 'background':
+        recognition_warmup.start()
+    status = recognition_warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/debug/profiler', methods=['GET', 'POST', 'DELETE'])
+def sampling_profiler():
+    """POST starts sampling, DELETE stops it, GET returns collapsed stacks"""
+    if not PROFILER_ENDPOINTS:
+        return jsonify({'error': 'Set PROFILER_ENDPOINTS=1 to enable the profiler'}), 404
+    if request.method == 'POST':
+        started = profiler.start(request.args.get('interval', 0.005, type=float),
+                                 request.args.get('duration', 300.0, type=float))
+        log_event('profiler_started' if started else 'profiler_already_running')
+        return jsonify(profiler.stats())
+    if request.method == 'DELETE':
+        profiler.stop()
+        log_event('profiler_stopped', samples=profiler.samples)
+        return jsonify(profiler.stats())
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.stats())
+    return Response(profiler.report(request.args.get('limit', type=int)), mimetype='text/plain')
 
 @app.route('/stop_video_feed', methods=['POST'])
 def stop_video_feed():
     """Stop the video feed and release camera resources"""
-    global video_capture
     try:
-        if video_capture is not None:
-            video_capture.release()
-            video_capture = None
-            print("Video capture released successfully")
+        video_pipeline.stop()
         return jsonify({'success': True})
     except Exception as e:
-        print(f"Error stopping video feed: {str(e)}")
+        log_event('video_feed_error', error=str(e))
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -208,25 +444,45 @@ def register():
             if not os.path.exists(FACES_DIRECTORY):
                 os.makedirs(FACES_DIRECTORY)
             
-            image_path = os.path.join(FACES_DIRECTORY, f'{name}.jpg')
-            image.save(image_path)
-            print(f"Saved image to: {image_path}")
-            
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
-            
-            if face_encodings:
-                load_known_faces()
-                # Check if request expects JSON response
-                if request.headers.get('Content-Type') == 'application/json' or request.is_json:
-                    return jsonify({'success': True, 'name': name})
-                return render_template('register.html', success=True, name=name)
-            else:
-                os.remove(image_path)
-                # Check if request expects JSON response
+            # Registering a name again adds another photo of that person
+            filename = face_gallery.next_template_filename(name)
+            if filename is None:
+                error = f"{name} already has {MAX_TEMPLATES_PER_IDENTITY} photos"
                 if request.headers.get('Content-Type') == 'application/json' or request.is_json:
-                    return jsonify({'success': False, 'error': "No face detected in the image"})
-                return render_template('register.html', error="No face detected in the image")
+                    return jsonify({'success': False, 'error': error}), 409
+                return render_template('register.html', error=error), 409
+            image_path = os.path.join(FACES_DIRECTORY, filename)
+            # Save next to the final path so a failed registration leaves
+            # no partial photo in place.
+            upload_path = image_path + '.upload'
+            image.save(upload_path)
+            try:
+                recognition_warmup.start()
+                if not recognition_warmup.wait(REGISTER_WARMUP_TIMEOUT):
+                    error = "Face recognition is still starting, please try again shortly"
+                    if request.headers.get('Content-Type') == 'application/json' or request.is_json:
+                        return jsonify({'success': False, 'error': error}), 503
+                    return render_template('register.html', error=error), 503
+                # An unreadable upload comes back as None, like a photo without a face
+                face_encodings = face_encoder.encode_images([upload_path])
+
+                if face_encodings[0] is not None:
+                    os.replace(upload_path, image_path)
+                    log_event('face_registered', name=name, filename=filename)
+                    # Reuse the encoding we just computed instead of rebuilding the gallery
+                    face_gallery.add(filename, face_encodings[0])
+                    # Check if request expects JSON response
+                    if request.headers.get('Content-Type') == 'application/json' or request.is_json:
+                        return jsonify({'success': True, 'name': name})
+                    return render_template('register.html', success=True, name=name)
+                else:
+                    # Check if request expects JSON response
+                    if request.headers.get('Content-Type') == 'application/json' or request.is_json:
+                        return jsonify({'success': False, 'error': "No face detected in the image"})
+                    return render_template('register.html', error="No face detected in the image")
+            finally:
+                if os.path.exists(upload_path):
+                    os.remove(upload_path)
         else:
             # Check if request expects JSON response
             if request.headers.get('Content-Type') == 'application/json' or request.is_json:
@@ -235,36 +491,108 @@ def register():
     
     return render_template('register.html')
 
+def faces_page():
+    # Every photo on disk is listed; the gallery only says which have an
+    # enrolled face, and only once it has loaded
+    filenames = face_gallery.photos()
+    enrolled = face_gallery.snapshot().enrolled if recognition_warmup.ready else None
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', FACES_PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), MAX_FACES_PAGE_SIZE)
+    faces = [{
+        'name': identity_name(filename),  # Dave__2.jpg is another photo of Dave
+        'filename': filename,
+        'enrolled': None if enrolled is None else filename in enrolled,
+        'image_path': url_for('serve_face', filename=filename),
+        'thumbnail_path': url_for('serve_face_thumbnail', filename=filename)
+    } for filename in filenames[(page - 1) * per_page:page * per_page]]
+    return {
+        'faces': faces,
+        'page': page,
+        'per_page': per_page,
+        'total': len(filenames),
+        'pages': (len(filenames) + per_page - 1) // per_page
+    }
+
 @app.route('/view_faces')
 def view_faces():
-    faces = []
-    if os.path.exists(FACES_DIRECTORY):
-        for filename in os.listdir(FACES_DIRECTORY):
-            if filename.endswith(SUPPORTED_IMAGE_EXTENSIONS):
-                name = os.path.splitext(filename)[0]  # Remove extension properly
-                faces.append({
-                    'name': name,
-                    'image_path': url_for('serve_face', filename=filename)
-                })
-    return render_template('view_faces.html', faces=faces)
+    result = faces_page()
+    return render_template('view_faces.html', faces=result['faces'], pagination=result)
+
+@app.route('/api/faces')
+def faces_api():
+    return jsonify(faces_page())
+
+def attendance_filters():
+    """Date-range and name filters shared by the attendance views"""
+    filters = {'start_date': None, 'end_date': None, 'name': request.args.get('name') or None}
+    for key, arg in (('start_date', 'start'), ('end_date', 'end')):
+        value = request.args.get(arg)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+                filters[key] = value
+            except ValueError:
+                pass
+    return filters
+
+def attendance_page():
+    filters = attendance_filters()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', ATTENDANCE_PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), MAX_ATTENDANCE_PAGE_SIZE)
+    total = attendance_store.count(**filters)
+    records = attendance_store.query(limit=per_page, offset=(page - 1) * per_page, **filters)
+    return {
+        'records': records,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': (total + per_page - 1) // per_page,
+        'filters': filters
+    }
 
 @app.route('/attendance')
 def attendance():
-    attendance_data = []
-    if os.path.exists(ATTENDANCE_DIRECTORY):
-        for filename in os.listdir(ATTENDANCE_DIRECTORY):
-            if filename.endswith('.json'):
-                date = filename[:-5]
-                with open(os.path.join(ATTENDANCE_DIRECTORY, filename), 'r') as f:
-                    data = json.load(f)
-                    attendance_data.extend(data)
+    result = attendance_page()
+    return render_template('attendance.html', attendance=result['records'], pagination=result)
+
+@app.route('/api/attendance')
+def attendance_api():
+    return jsonify(attendance_page())
+
+@app.route('/attendance/export.csv')
+def export_attendance():
+    filters = attendance_filters()
     
-    attendance_data.sort(key=lambda x: (x['date'], x['time']), reverse=True)
-    return render_template('attendance.html', attendance=attendance_data)
+    def generate():
+        # Records are streamed in chunks so a long report never sits in memory
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['name', 'date', 'time', 'camera_id'])
+        for i, record in enumerate(attendance_store.iter_records(**filters), 1):
+            writer.writerow([record['name'], record['date'], record['time'],
+                             record.get('camera_id', '')])
+            if i % CSV_EXPORT_CHUNK_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return Response(generate(), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=attendance.csv'})
 
 @app.route('/faces/<filename>')
 def serve_face(filename):
-    return send_from_directory(FACES_DIRECTORY, filename)
+    # Sent with ETag and Last-Modified, so revalidating an unchanged photo is a 304
+    return send_from_directory(FACES_DIRECTORY, filename, max_age=FACE_IMAGE_MAX_AGE)
+
+@app.route('/faces/<filename>/thumbnail')
+def serve_face_thumbnail(filename):
+    path = face_thumbnails.path(filename)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='image/jpeg', max_age=FACE_IMAGE_MAX_AGE)
 
 if __name__ == "__main__":
     import os
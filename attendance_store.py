@@ -0,0 +1,409 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from metrics import ATTENDANCE_WRITE_LATENCY
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not coordinated between processes
+    fcntl = None
+
+# Constants
+SQLITE_BACKEND = 'sqlite'
+JSONL_BACKEND = 'jsonl'
+DEFAULT_STORE_PATH = 'data/attendance.db'  # database file, or a directory for jsonl
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M:%S'
+SQLITE_BUSY_TIMEOUT = 10.0  # seconds
+DAYS_CACHED = 2             # days of names the JSON-lines store keeps in memory
+EXPORT_BATCH_SIZE = 500     # rows fetched at a time when streaming records
+INDEX_FILENAME = 'index.json'
+
+
+class AttendanceEvent:
+    """One check-in; ``inserted`` is set once the store has committed it.
+
+    ``camera_id`` names the camera that saw the person, if there are several.
+    """
+
+    __slots__ = ('name', 'date', 'time', 'camera_id', 'inserted', 'committed')
+
+    def __init__(self, name, when=None, camera_id=None):
+        when = when or datetime.now()
+        self.name = name
+        self.date = when.strftime(DATE_FORMAT)
+        self.time = when.strftime(TIME_FORMAT)
+        self.camera_id = camera_id
+        self.inserted = False
+        self.committed = False
+
+    def as_record(self):
+        record = {'name': self.name, 'date': self.date, 'time': self.time}
+        if self.camera_id is not None:
+            record['camera_id'] = self.camera_id
+        return record
+
+
+class AttendanceStore:
+    """Storage backend for attendance with one record per (name, date).
+
+    Writes are group-committed: concurrent ``record()`` calls that arrive
+    while a commit is in flight are written together by the next commit.
+    Subclasses implement ``_commit(events)`` and ``records()``.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+
+    def record(self, name, when=None, camera_id=None):
+        """Record ``name`` as present; returns False if already recorded that day"""
+        return self.record_many([AttendanceEvent(name, when, camera_id)])[0]
+
+    def record_many(self, events):
+        """Commit a batch of ``AttendanceEvent``s; returns which ones were new"""
+        events = list(events)
+        with self._pending_lock:
+            self._pending.extend(events)
+        with self._commit_lock:
+            if not all(event.committed for event in events):
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                try:
+                    with ATTENDANCE_WRITE_LATENCY.time():
+                        self._commit(batch)
+                finally:
+                    for event in batch:
+                        event.committed = True
+        return [event.inserted for event in events]
+
+    def records(self):
+        """Return every record as a dict, newest first"""
+        return self.query()
+
+    def query(self, start_date=None, end_date=None, name=None, limit=None, offset=0):
+        """Return matching records as dicts, newest first.
+
+        Dates are inclusive ``YYYY-MM-DD`` strings; ``None`` leaves that
+        side of the range open.
+        """
+        raise NotImplementedError
+
+    def count(self, start_date=None, end_date=None, name=None):
+        raise NotImplementedError
+
+    def iter_records(self, start_date=None, end_date=None, name=None):
+        """Yield matching records newest first without loading them all at once"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _commit(self, events):
+        raise NotImplementedError
+
+
+class SQLiteAttendanceStore(AttendanceStore):
+    """Attendance table in SQLite (WAL mode) with a UNIQUE(name, date) constraint"""
+
+    def __init__(self, path):
+        super().__init__()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._db = None
+        self._db_pid = None
+        with self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS attendance (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    camera_id TEXT,
+                    UNIQUE (name, date)
+                )''')
+            columns = [row[1] for row in self._connection.execute('PRAGMA table_info(attendance)')]
+            if 'camera_id' not in columns:
+                # Databases created before multi-camera support
+                self._connection.execute('ALTER TABLE attendance ADD COLUMN camera_id TEXT')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS attendance_date_time ON attendance (date, time)')
+
+    @property
+    def _connection(self):
+        # SQLite connections must not cross fork(), e.g. when gunicorn's
+        # preload_app imports the app in the master: each process opens its own
+        pid = os.getpid()
+        if self._db_pid != pid:
+            self._db = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT,
+                                       check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db_pid = pid
+        return self._db
+
+    def query(self, start_date=None, end_date=None, name=None, limit=None, offset=0):
+        where, params = self._where(start_date, end_date, name)
+        sql = (f'SELECT name, date, time, camera_id FROM attendance{where} '
+               'ORDER BY date DESC, time DESC')
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit, offset]
+        with self._commit_lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [self._record(row) for row in rows]
+
+    def count(self, start_date=None, end_date=None, name=None):
+        where, params = self._where(start_date, end_date, name)
+        with self._commit_lock:
+            return self._connection.execute(f'SELECT COUNT(*) FROM attendance{where}',
+                                            params).fetchone()[0]
+
+    def iter_records(self, start_date=None, end_date=None, name=None):
+        # A private connection keeps a long export from holding up check-ins
+        where, params = self._where(start_date, end_date, name)
+        connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            cursor = connection.execute(
+                f'SELECT name, date, time, camera_id FROM attendance{where} '
+                'ORDER BY date DESC, time DESC', params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._record(row)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _record(row):
+        name, date, time, camera_id = row
+        record = {'name': name, 'date': date, 'time': time}
+        if camera_id is not None:
+            record['camera_id'] = camera_id
+        return record
+
+    @staticmethod
+    def _where(start_date, end_date, name):
+        clauses = []
+        params = []
+        if start_date:
+            clauses.append('date >= ?')
+            params.append(start_date)
+        if end_date:
+            clauses.append('date <= ?')
+            params.append(end_date)
+        if name:
+            clauses.append('name = ?')
+            params.append(name)
+        if not clauses:
+            return '', params
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def close(self):
+        with self._commit_lock:
+            if self._db is not None and self._db_pid == os.getpid():
+                self._db.close()
+            self._db = None
+            self._db_pid = None
+
+    def _commit(self, events):
+        with self._connection:
+            for event in events:
+                cursor = self._connection.execute(
+                    'INSERT OR IGNORE INTO attendance (name, date, time, camera_id) '
+                    'VALUES (?, ?, ?, ?)',
+                    (event.name, event.date, event.time, event.camera_id))
+                event.inserted = cursor.rowcount == 1
+
+
+class JsonLinesAttendanceStore(AttendanceStore):
+    """Append-only ``<date>.jsonl`` files, one JSON record per line.
+
+    Each day's names are cached in memory and topped up from the bytes other
+    processes appended since the last read, so a check-in never rereads or
+    rewrites the whole file. A small per-day summary index (record count and
+    file size) lets queries skip whole days when paginating; days whose size
+    no longer matches the index are recounted. The index is kept in memory
+    and only re-validated against the day files when this store appends or
+    the directory or index file changes, so a page of results costs two
+    ``stat`` calls rather than one per day.
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self._seen = {}  # date -> (bytes read, names recorded)
+        self._index = (None, None)  # (_index_version() it was loaded at, index)
+
+    def query(self, start_date=None, end_date=None, name=None, limit=None, offset=0):
+        records = []
+        if limit == 0:
+            return records
+        for date, count in self._days(start_date, end_date):
+            if not name and offset >= count:
+                # Skip the whole day using its summary instead of reading it
+                offset -= count
+                continue
+            day_records = self._read_day(date, name)
+            if offset:
+                skipped = min(offset, len(day_records))
+                day_records = day_records[skipped:]
+                offset -= skipped
+            records.extend(day_records)
+            if limit is not None and len(records) >= limit:
+                return records[:limit]
+        return records
+
+    def count(self, start_date=None, end_date=None, name=None):
+        if not name:
+            return sum(count for _, count in self._days(start_date, end_date))
+        return sum(len(self._read_day(date, name))
+                   for date, _ in self._days(start_date, end_date))
+
+    def iter_records(self, start_date=None, end_date=None, name=None):
+        for date, _ in self._days(start_date, end_date):
+            for record in self._read_day(date, name):
+                yield record
+
+    def _days(self, start_date, end_date):
+        """Return ``[(date, record count), ...]`` in the range, newest first"""
+        version, index = self._index
+        if version is None or version != self._index_version():
+            with self._index_locked():
+                index = self._load_index()
+                # Taken after loading, which may have rewritten the index
+                self._index = (self._index_version(), index)
+        return [(date, index[date]['count'])
+                for date in sorted(index, reverse=True)
+                if (not start_date or date >= start_date) and (not end_date or date <= end_date)]
+
+    def _read_day(self, date, name=None):
+        """One day's records, newest first"""
+        path = os.path.join(self.directory, f'{date}.jsonl')
+        with open(path, 'r') as f:
+            # A line without its newline is still being appended by another process
+            records = [json.loads(line) for line in f if line.endswith('\n') and line.strip()]
+        if name:
+            records = [r for r in records if r['name'] == name]
+        records.sort(key=lambda x: x['time'], reverse=True)
+        return records
+
+    def _index_version(self):
+        # Adding a day file or replacing the index changes the directory's mtime
+        try:
+            directory = os.stat(self.directory)
+            index = os.stat(self.index_path)
+        except OSError:
+            return None
+        return directory.st_mtime_ns, index.st_mtime_ns, index.st_size
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        changed = False
+        present = set()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.jsonl'):
+                continue
+            date = filename[:-len('.jsonl')]
+            present.add(date)
+            size = os.path.getsize(os.path.join(self.directory, filename))
+            if date not in index or index[date]['size'] != size:
+                index[date] = {'count': len(self._read_day(date)), 'size': size}
+                changed = True
+        for date in set(index) - present:
+            del index[date]
+            changed = True
+        if changed:
+            self._save_index(index)
+        return index
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @contextlib.contextmanager
+    def _index_locked(self):
+        with open(self.index_path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _commit(self, events):
+        by_date = {}
+        for event in events:
+            by_date.setdefault(event.date, []).append(event)
+        for date, day_events in by_date.items():
+            self._append_day(date, day_events)
+
+    def _append_day(self, date, events):
+        path = os.path.join(self.directory, f'{date}.jsonl')
+        with open(path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset, names = self._seen.get(date, (0, set()))
+                f.seek(offset)
+                for line in f.read().splitlines():
+                    if line.strip():
+                        names.add(json.loads(line)['name'])
+
+                lines = []
+                for event in events:
+                    if event.name not in names:
+                        names.add(event.name)
+                        event.inserted = True
+                        lines.append(json.dumps(event.as_record()) + '\n')
+                f.write(''.join(lines))
+                f.flush()
+                self._seen[date] = (f.tell(), names)
+                if lines:
+                    self._update_index(date, len(names), f.tell())
+                # Only recent days are still being written to
+                for stale_date in sorted(self._seen)[:-DAYS_CACHED]:
+                    del self._seen[stale_date]
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+    def _update_index(self, date, count, size):
+        with self._index_locked():
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            index[date] = {'count': count, 'size': size}
+            self._save_index(index)
+        self._index = (None, None)
+
+
+def open_attendance_store(backend, path):
+    if backend == SQLITE_BACKEND:
+        return SQLiteAttendanceStore(path)
+    if backend == JSONL_BACKEND:
+        return JsonLinesAttendanceStore(path)
+    raise ValueError(f"Unknown attendance backend: {backend}")
@@ -0,0 +1,239 @@
+import collections
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from attendance_store import DATE_FORMAT, SQLITE_BUSY_TIMEOUT, AttendanceEvent
+from metrics import log_event
+
+# Constants
+EVENT_BATCH_SIZE = 100
+EVENT_FLUSH_INTERVAL = 0.5   # seconds the writer waits to fill a batch
+MAX_QUEUED_EVENTS = 1000     # beyond this, check-ins are dropped rather than blocking video
+MAX_SEEN_NAMES = 10000       # names per process remembered as checked in today
+STOP_TIMEOUT = 5.0           # seconds stop() waits for queued events to be written
+SEEN_SUFFIX = '_seen.db'     # data/attendance.db keeps today's names in data/attendance_seen.db
+
+
+def seen_path(store_path):
+    """Where the ``SeenToday`` table of the store at ``store_path`` lives"""
+    return os.path.splitext(store_path.rstrip(os.sep))[0] + SEEN_SUFFIX
+
+
+class SeenToday:
+    """Names already checked in today, shared by every process through a SQLite table.
+
+    Processes ask before writing to the attendance store and mark names once
+    written, so a person seen by several workers or cameras costs one store
+    write. Rows from earlier days are deleted when the date changes, which
+    keeps the table to one day of names. The store's own one-record-per-day
+    rule still decides; this only saves it the work.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._db = None
+        self._db_pid = None
+        self._date = None
+        with self._connection:
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS seen (
+                    date TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    PRIMARY KEY (date, name)
+                ) WITHOUT ROWID''')
+
+    @property
+    def _connection(self):
+        # As in SQLiteAttendanceStore, every process opens its own connection
+        pid = os.getpid()
+        if self._db_pid != pid:
+            self._db = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT,
+                                       check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db_pid = pid
+        return self._db
+
+    def seen(self, names, date):
+        """Subset of ``names`` already checked in on ``date``"""
+        names = list(names)
+        if not names:
+            return set()
+        placeholders = ','.join('?' * len(names))
+        rows = self._connection.execute(
+            f'SELECT name FROM seen WHERE date = ? AND name IN ({placeholders})',
+            [date] + names).fetchall()
+        return {name for (name,) in rows}
+
+    def mark(self, names, date):
+        with self._connection:
+            if date != self._date:
+                self._connection.execute('DELETE FROM seen WHERE date < ?', (date,))
+                self._date = date
+            self._connection.executemany('INSERT OR IGNORE INTO seen (date, name) VALUES (?, ?)',
+                                         [(date, name) for name in names])
+
+    def close(self):
+        if self._db is not None and self._db_pid == os.getpid():
+            self._db.close()
+        self._db = None
+        self._db_pid = None
+
+
+class AttendanceWriter:
+    """Records attendance off the video path.
+
+    ``submit()`` only touches memory: names already checked in today, or
+    still queued, are ignored, and the rest are queued without blocking (a
+    full queue drops the event; the person is submitted again on a later
+    frame). A background thread takes batches of up to ``batch_size``
+    events, skips names ``seen`` (a ``SeenToday``) reports as already
+    recorded by any process, and commits the rest with one
+    ``store.record_many()``. The thread is started on first use in each
+    process, so the writer survives gunicorn forking a preloaded app.
+    """
+
+    def __init__(self, store, seen=None, batch_size=EVENT_BATCH_SIZE,
+                 flush_interval=EVENT_FLUSH_INTERVAL, max_queued=MAX_QUEUED_EVENTS,
+                 max_seen=MAX_SEEN_NAMES):
+        self.store = store
+        self.shared_seen = seen
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queued = max_queued
+        self.max_seen = max_seen
+        self.recorded = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._date = None
+        self._seen = collections.OrderedDict()  # today's names, oldest first
+        self._queued = set()
+
+    def submit(self, name, when=None, camera_id=None):
+        """Queue a check-in for ``name``; returns False if it was skipped or dropped"""
+        when = when or datetime.now()
+        date = when.strftime(DATE_FORMAT)
+        with self._lock:
+            self._ensure_started()
+            self._roll_over(date)
+            if name in self._seen or name in self._queued:
+                return False
+            try:
+                self._queue.put_nowait(AttendanceEvent(name, when, camera_id))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._queued.add(name)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._queued)
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'recorded': self.recorded,
+            'duplicates': self.duplicates,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'seen_today': len(self._seen)
+        }
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Write what is queued and stop the thread"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stop_event.set()
+        thread.join(timeout)
+        if self.shared_seen is not None:
+            self.shared_seen.close()
+
+    def _ensure_started(self):
+        # Threads do not survive fork(): each process runs its own writer
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._queue = queue.Queue(self.max_queued)
+        self._queued = set()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._pid = pid
+        self._thread.start()
+
+    def _roll_over(self, date):
+        if date != self._date:
+            self._seen.clear()
+            self._date = date
+
+    def _remember(self, names, date):
+        with self._lock:
+            if date != self._date:
+                return
+            for name in names:
+                self._seen[name] = True
+                self._seen.move_to_end(name)
+            while len(self._seen) > self.max_seen:
+                self._seen.popitem(last=False)
+
+    def _run(self):
+        events = self._queue
+        while True:
+            batch = []
+            try:
+                batch.append(events.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(events.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+            elif self._stop_event.is_set():
+                break
+
+    def _write(self, batch):
+        by_date = {}
+        for event in batch:
+            by_date.setdefault(event.date, []).append(event)
+        for date, events in by_date.items():
+            start = time.perf_counter()
+            try:
+                seen = self.shared_seen.seen([e.name for e in events], date) \
+                    if self.shared_seen is not None else set()
+                new = [e for e in events if e.name not in seen]
+                inserted = self.store.record_many(new) if new else []
+                if self.shared_seen is not None:
+                    self.shared_seen.mark([e.name for e in new], date)
+            except Exception as e:
+                self.errors += len(events)
+                log_event('attendance_error', names=[event.name for event in events],
+                          error=str(e))
+            else:
+                latency_ms = round((time.perf_counter() - start) * 1000, 2)
+                for event, is_new in zip(new, inserted):
+                    if is_new:
+                        self.recorded += 1
+                        log_event('attendance_recorded', name=event.name,
+                                  camera_id=event.camera_id, batch=len(events),
+                                  latency_ms=latency_ms)
+                    else:
+                        self.duplicates += 1
+                self.duplicates += len(events) - len(new)
+                self._remember([e.name for e in events], date)
+            finally:
+                with self._lock:
+                    self._queued.difference_update(e.name for e in events)
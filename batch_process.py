@@ -0,0 +1,238 @@
+"""Backfill attendance from recorded video files or folders of images.
+
+Usage:
+    python batch_process.py lecture1.mp4 lecture2.mp4 --stride 5 --record
+    python batch_process.py snapshots/ --workers 4
+
+Frames are split into segments and recognized across a process pool by the
+same ``engine.RecognitionEngine`` and encoding cache as the web app. Sightings of the same
+person are merged into one attendance event per source.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+
+from attendance_store import (DEFAULT_STORE_PATH, JSONL_BACKEND, SQLITE_BACKEND, AttendanceEvent,
+                              open_attendance_store)
+from face_cache import (CACHE_DIRECTORY, FACES_DIRECTORY, SUPPORTED_IMAGE_EXTENSIONS,
+                        FaceEncodingCache, prepare_shared_cache)
+from detectors import DEFAULT_DETECTOR, DETECTORS, FRAME_RESIZE_FACTOR, FaceLocator, create_detector
+from engine import RecognitionEngine
+from gallery import FaceGallery
+from tracker import FaceTracker
+
+# Constants
+SEGMENT_FRAMES = 300         # video frames per task handed to a worker
+IMAGES_PER_TASK = 32
+DEFAULT_STRIDE = 5           # recognize every 5th video frame
+DEDUPE_WINDOW = 300          # seconds; sightings closer than this merge into one event
+MIN_SIGHTINGS = 2            # sightings needed before an event counts as attendance
+
+_matcher = None
+_locator = None
+
+
+def _init_worker(faces_directory, cache_directory, detector_name, detector_options, resize_factor):
+    # Each worker maps the shared encoding matrix read-only instead of re-encoding,
+    # and matches against the same templates as the app
+    global _matcher, _locator
+    _matcher = FaceGallery(faces_directory,
+                           FaceEncodingCache(faces_directory, cache_directory)).open().matcher
+    _locator = FaceLocator(create_detector(detector_name, **detector_options), resize_factor)
+
+
+def _sightings(source, frame_index, timestamp, results):
+    return [(source, frame_index, timestamp, face.match.name, face.match.distance)
+            for face in results
+            if face.match.index is not None]
+
+
+def process_video_segment(path, start_frame, end_frame, stride):
+    """Recognize every ``stride``-th frame in ``[start_frame, end_frame)``"""
+    # People sitting still keep their track, so only new faces hit the encoder
+    engine = RecognitionEngine(_matcher, _locator, tracker=FaceTracker())
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    if start_frame:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    sightings = []
+    processed = 0
+    frame_index = start_frame
+    try:
+        while end_frame is None or frame_index < end_frame:
+            if frame_index % stride:
+                # grab() skips the decode for frames we are not going to look at
+                if not capture.grab():
+                    break
+                frame_index += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                break
+            timestamp = frame_index / fps
+            results = engine.process(frame, timestamp)
+            sightings.extend(_sightings(path, frame_index, timestamp, results))
+            processed += 1
+            frame_index += 1
+    finally:
+        capture.release()
+    return processed, sightings
+
+
+def process_images(directory, images):
+    """Recognize ``[(path, seconds since the first image), ...]`` from one directory"""
+    engine = RecognitionEngine(_matcher, _locator)
+    sightings = []
+    processed = 0
+    for path, timestamp in images:
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"Could not read image: {path}")
+            continue
+        results = engine.process(frame, timestamp)
+        sightings.extend(_sightings(directory, 0, timestamp, results))
+        processed += 1
+    return processed, sightings
+
+
+def plan_tasks(inputs, stride):
+    """Split the inputs into ``(function, args)`` tasks and note each source's start time"""
+    tasks = []
+    start_times = {}
+    for path in inputs:
+        if os.path.isdir(path):
+            # A directory is one source; each image is placed on it by its mtime
+            images = sorted((os.path.getmtime(os.path.join(path, f)), os.path.join(path, f))
+                            for f in os.listdir(path)
+                            if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS))
+            if not images:
+                continue
+            first_mtime = images[0][0]
+            start_times[path] = datetime.fromtimestamp(first_mtime)
+            images = [(image, mtime - first_mtime) for mtime, image in images]
+            for i in range(0, len(images), IMAGES_PER_TASK):
+                tasks.append((process_images,
+                              (path, images[i:i + IMAGES_PER_TASK])))
+            continue
+
+        capture = cv2.VideoCapture(path)
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+
+        if os.path.exists(path):
+            # Recordings are usually closed when they end, so mtime marks the last frame
+            duration = timedelta(seconds=max(frame_count, 0) / fps)
+            start_times[path] = datetime.fromtimestamp(os.path.getmtime(path)) - duration
+        else:
+            start_times[path] = datetime.now()
+
+        if frame_count <= 0:
+            # Unknown length (e.g. a stream URL): process it in one pass
+            tasks.append((process_video_segment, (path, 0, None, stride)))
+            continue
+        for start in range(0, frame_count, SEGMENT_FRAMES):
+            end = min(start + SEGMENT_FRAMES, frame_count)
+            tasks.append((process_video_segment, (path, start, end, stride)))
+    return tasks, start_times
+
+
+def deduplicate(sightings, start_times, window=DEDUPE_WINDOW, min_sightings=MIN_SIGHTINGS):
+    """Merge per-frame sightings into attendance events.
+
+    Sightings of one name in one source that are less than ``window``
+    seconds apart belong to the same event. Returns a list of dicts sorted
+    by first sighting.
+    """
+    events = []
+    by_key = {}
+    for source, frame_index, timestamp, name, distance in sightings:
+        by_key.setdefault((source, name), []).append((timestamp, distance))
+
+    for (source, name), hits in by_key.items():
+        hits.sort()
+        group = [hits[0]]
+        for hit in hits[1:] + [None]:
+            if hit is not None and hit[0] - group[-1][0] <= window:
+                group.append(hit)
+                continue
+            if len(group) >= min_sightings:
+                first_seen = start_times[source] + timedelta(seconds=group[0][0])
+                events.append({
+                    'name': name,
+                    'source': source,
+                    'first_seen': first_seen,
+                    'last_seen': start_times[source] + timedelta(seconds=group[-1][0]),
+                    'sightings': len(group),
+                    'best_distance': min(d for _, d in group)
+                })
+            group = [hit]
+    events.sort(key=lambda e: e['first_seen'])
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recognize faces in recorded video or images')
+    parser.add_argument('inputs', nargs='+', help='video files, stream URLs or image directories')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--stride', type=int, default=DEFAULT_STRIDE,
+                        help='recognize every Nth video frame')
+    parser.add_argument('--resize', type=float, default=FRAME_RESIZE_FACTOR,
+                        help='downscale factor applied before detection')
+    parser.add_argument('--detector', choices=sorted(DETECTORS), default=DEFAULT_DETECTOR)
+    parser.add_argument('--upsample', type=int, default=None,
+                        help='upsample count for the hog/cnn detectors')
+    parser.add_argument('--dedupe-window', type=float, default=DEDUPE_WINDOW)
+    parser.add_argument('--min-sightings', type=int, default=MIN_SIGHTINGS)
+    parser.add_argument('--record', action='store_true', help='write events to the attendance store')
+    parser.add_argument('--backend', choices=(SQLITE_BACKEND, JSONL_BACKEND), default=SQLITE_BACKEND)
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--faces', default=FACES_DIRECTORY)
+    parser.add_argument('--cache', default=CACHE_DIRECTORY)
+    args = parser.parse_args()
+
+    prepare_shared_cache(args.faces, args.cache)
+
+    detector_options = {}
+    if args.upsample is not None:
+        detector_options['upsample'] = args.upsample
+    tasks, start_times = plan_tasks(args.inputs, max(args.stride, 1))
+    start = time.perf_counter()
+    frames = 0
+    sightings = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.faces, args.cache, args.detector, detector_options,
+                                       args.resize)) as executor:
+        futures = [executor.submit(function, *task_args) for function, task_args in tasks]
+        for future in as_completed(futures):
+            processed, task_sightings = future.result()
+            frames += processed
+            sightings.extend(task_sightings)
+    elapsed = time.perf_counter() - start
+
+    events = deduplicate(sightings, start_times, args.dedupe_window, args.min_sightings)
+    for event in events:
+        print(f"{event['first_seen']:%Y-%m-%d %H:%M:%S}  {event['name']:<20} "
+              f"{event['sightings']:>4} sightings  best distance {event['best_distance']:.3f}  "
+              f"({event['source']})")
+
+    if args.record and events:
+        store = open_attendance_store(args.backend, args.store)
+        try:
+            inserted = sum(store.record_many(AttendanceEvent(e['name'], e['first_seen'])
+                                             for e in events))
+        finally:
+            store.close()
+        print(f"Recorded {inserted} new attendance records")
+
+    print(f"Processed {frames} frames in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed else 0:.1f} frames/sec, {len(tasks)} tasks)")
+
+
+if __name__ == '__main__':
+    main()
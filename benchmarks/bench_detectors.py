@@ -0,0 +1,125 @@
+"""Compare face detector configurations on latency and recall.
+
+Usage:
+    python benchmarks/bench_detectors.py --frames recordings/frames/
+    python benchmarks/bench_detectors.py --video lecture.mp4 --every 10
+    python benchmarks/bench_detectors.py --frames faces/ --annotations boxes.json
+
+Without ``--annotations`` (``{"image.jpg": [[top, right, bottom, left], ...]}``
+in full-frame pixels) the reference boxes come from HOG with two upsamples
+on the full-resolution frame, the slowest and most sensitive configuration.
+Recall is the fraction of reference faces overlapped by a detection with
+IoU >= 0.3. Detectors that are not available in this install are skipped.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from detectors import FaceLocator, create_detector  # noqa: E402
+from face_cache import SUPPORTED_IMAGE_EXTENSIONS  # noqa: E402
+from tracker import iou_matrix  # noqa: E402
+
+RECALL_IOU = 0.3
+
+# (label, detector name, detector options, resize factor)
+CONFIGURATIONS = [
+    ('hog@0.25', 'hog', {}, 0.25),
+    ('hog@0.5', 'hog', {}, 0.5),
+    ('hog@0.25 up2', 'hog', {'upsample': 2}, 0.25),
+    ('hog@1.0 up0', 'hog', {'upsample': 0}, 1.0),
+    ('haar@0.5', 'haar', {}, 0.5),
+    ('haar@1.0', 'haar', {}, 1.0),
+    ('dnn@0.5', 'dnn', {}, 0.5),
+    ('dnn@1.0', 'dnn', {}, 1.0),
+]
+REFERENCE = ('reference', 'hog', {'upsample': 2}, 1.0)
+
+
+def load_frames(args):
+    frames = []
+    if args.frames:
+        for filename in sorted(os.listdir(args.frames)):
+            if filename.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(args.frames, filename))
+                if frame is not None:
+                    frames.append((filename, frame))
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        index = 0
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if index % args.every == 0:
+                frames.append((f'{index:06d}', frame))
+            index += 1
+        capture.release()
+    return frames
+
+
+def run(locator, frames):
+    latencies = []
+    boxes = {}
+    for key, frame in frames:
+        start = time.perf_counter()
+        detection = locator.locate(frame)
+        latencies.append(time.perf_counter() - start)
+        boxes[key] = detection.boxes
+    return np.array(latencies), boxes
+
+
+def recall(reference, boxes):
+    found = total = 0
+    for key, expected in reference.items():
+        total += len(expected)
+        if expected and boxes.get(key):
+            overlaps = iou_matrix(expected, boxes[key])
+            found += int((overlaps.max(axis=1) >= RECALL_IOU).sum())
+    return found / total if total else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', help='directory of still frames')
+    parser.add_argument('--video', help='video file to sample frames from')
+    parser.add_argument('--every', type=int, default=10, help='sample every Nth video frame')
+    parser.add_argument('--annotations', help='JSON file of ground-truth boxes per frame')
+    args = parser.parse_args()
+    if not args.frames and not args.video:
+        parser.error('give --frames and/or --video')
+
+    frames = load_frames(args)
+    if not frames:
+        parser.error('no frames found')
+
+    if args.annotations:
+        with open(args.annotations, 'r') as f:
+            reference = {key: [tuple(box) for box in boxes] for key, boxes in json.load(f).items()}
+        reference = {key: reference.get(key, []) for key, _ in frames}
+    else:
+        _, name, options, factor = REFERENCE
+        _, reference = run(FaceLocator(create_detector(name, **options), factor), frames)
+    print(f"{len(frames)} frames, {sum(len(b) for b in reference.values())} reference faces")
+
+    print(f"{'configuration':<16} {'mean ms':>9} {'p95 ms':>9} {'recall':>8}")
+    for label, name, options, factor in CONFIGURATIONS:
+        try:
+            locator = FaceLocator(create_detector(name, **options), factor)
+        except (RuntimeError, OSError) as e:
+            print(f"{label:<16} skipped: {e}")
+            continue
+        run(locator, frames[:1])  # warm-up
+        latencies, boxes = run(locator, frames)
+        print(f"{label:<16} {latencies.mean() * 1000:>9.1f} "
+              f"{np.percentile(latencies, 95) * 1000:>9.1f} {recall(reference, boxes):>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare the batched matcher with the per-face compare_faces loop.
+
+Usage: python benchmarks/bench_matcher.py [--sizes 1000 10000 100000] [--faces 30]
+
+Galleries are synthetic unit-norm 128-d encodings; each query is a gallery
+row plus noise, so the expected best match is known and index recall can
+be reported alongside latency.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from matcher import FaceMatcher  # noqa: E402
+
+QUERY_NOISE = 0.35
+
+
+def compare_faces_loop(known_face_encodings, known_face_names, face_encodings):
+    """The original generate_frames() matching path"""
+    import face_recognition
+
+    names = []
+    for face_encoding in face_encodings:
+        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
+        name = "Unknown"
+        if True in matches:
+            name = known_face_names[matches.index(True)]
+        names.append(name)
+    return names
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_gallery(size, rng):
+    encodings = rng.normal(size=(size, 128))
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+    return encodings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--faces', type=int, default=30, help='faces per frame')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'compare_faces':>14} {'exact':>10} {'index':>10} "
+          f"{'index build':>12} {'recall':>7}")
+    for size in args.sizes:
+        encodings = synthetic_gallery(size, rng)
+        names = [f'person_{i}' for i in range(size)]
+        targets = rng.choice(size, args.faces, replace=False)
+        noise = rng.normal(size=(args.faces, 128))
+        noise *= QUERY_NOISE / np.linalg.norm(noise, axis=1, keepdims=True)
+        queries = list(encodings[targets] + noise)
+
+        known_face_encodings = list(encodings)
+        try:
+            baseline, _ = time_call(
+                lambda: compare_faces_loop(known_face_encodings, names, queries), args.repeat)
+            baseline = f'{baseline * 1000:.2f} ms'
+        except ImportError:
+            baseline = 'n/a'
+
+        exact_matcher = FaceMatcher(names, encodings, index_threshold=None)
+        exact, (exact_indices, _) = time_call(lambda: exact_matcher.nearest(queries), args.repeat)
+
+        start = time.perf_counter()
+        indexed_matcher = FaceMatcher(names, encodings, index_threshold=0)
+        build = time.perf_counter() - start
+        indexed, (indexed_indices, _) = time_call(lambda: indexed_matcher.nearest(queries),
+                                                  args.repeat)
+        recall = np.mean(indexed_indices == exact_indices)
+
+        print(f"{size:>10} {baseline:>14} {exact * 1000:>7.2f} ms {indexed * 1000:>7.2f} ms "
+              f"{build:>10.2f} s {recall:>7.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Compare recognizing every Nth frame with the adaptive FrameScheduler.
+
+Usage: python benchmarks/bench_scheduler.py [--faces faces/] [--fps 30] [--skip 3]
+
+Plays a synthetic scene at ``--fps``: an empty room with sensor noise, a
+person (a photo from ``--faces``) walking in, standing still, walking out
+and the empty room again. Frames are recognized by a ``RecognitionEngine``
+with a tracker, as in the app. The scene runs on a virtual clock: a frame
+offered while recognition is busy waits in a one-frame queue (newest wins),
+and results become visible once their measured latency has passed. For
+each policy it reports how many frames were recognized and dropped, the CPU
+time spent (also as a share of one core), recognitions while nobody was
+there, how long after entering the person was first named, and the share of
+frames with the person in view that carried their name.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine import RecognitionEngine, annotations, scene_summary  # noqa: E402
+from face_cache import FaceEncodingCache, identity_name  # noqa: E402
+from gallery import FaceGallery  # noqa: E402
+from scheduler import FrameScheduler  # noqa: E402
+from tracker import FaceTracker  # noqa: E402
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+PERSON_HEIGHT = 300
+SENSOR_NOISE = 3              # +- grey levels of per-frame noise
+MAX_RECOGNITION_AGE = 1.0     # seconds, as in the app
+# (phase, seconds): the person is off-screen, walks in, stands, walks out
+SCENE = (('empty', 10.0), ('enter', 1.0), ('stand', 10.0), ('leave', 1.0), ('empty', 10.0))
+
+
+class EveryNth:
+    """The old fixed policy: offer every ``n``-th frame"""
+
+    def __init__(self, n):
+        self.n = n
+        self._seq = 0
+
+    def decide(self, image, now):
+        offer = self._seq % self.n == 0
+        self._seq += 1
+        return offer
+
+    def observe(self, results, latency, cpu_seconds, now):
+        pass
+
+
+def scene_frames(photo, fps, rng):
+    """Yield ``(phase, BGR frame)`` for ``SCENE``"""
+    gradient = np.linspace(60, 180, FRAME_WIDTH, dtype=np.float32)
+    background = np.repeat(np.tile(gradient, (FRAME_HEIGHT, 1))[:, :, None], 3, axis=2)
+    scale = PERSON_HEIGHT / photo.shape[0]
+    person = cv2.resize(photo, (int(photo.shape[1] * scale), PERSON_HEIGHT))
+    top = (FRAME_HEIGHT - PERSON_HEIGHT) // 2
+    standing_left = (FRAME_WIDTH - person.shape[1]) // 2
+    for phase, seconds in SCENE:
+        count = int(seconds * fps)
+        for i in range(count):
+            noise = rng.integers(-SENSOR_NOISE, SENSOR_NOISE + 1, size=background.shape[:2])
+            frame = np.clip(background + noise[:, :, None], 0, 255).astype(np.uint8)
+            if phase == 'enter':
+                left = int(-person.shape[1] + (standing_left + person.shape[1]) * (i + 1) / count)
+            elif phase == 'stand':
+                left = standing_left
+            elif phase == 'leave':
+                left = int(standing_left + (FRAME_WIDTH - standing_left) * (i + 1) / count)
+            else:
+                left = None
+            if left is not None:
+                visible_left, visible_right = max(left, 0), min(left + person.shape[1], FRAME_WIDTH)
+                if visible_right > visible_left:
+                    frame[top:top + PERSON_HEIGHT, visible_left:visible_right] = \
+                        person[:, visible_left - left:visible_right - left]
+            yield phase, frame
+
+
+def run(policy, matcher, photo, name, fps):
+    engine = RecognitionEngine(matcher, tracker=FaceTracker())
+    rng = np.random.default_rng(0)
+    results = []
+    pending = None          # (frame time, image, phase) waiting for the worker
+    busy_until = 0.0
+    finished = None         # (time results become visible, results)
+    report = {'recognized': 0, 'dropped': 0, 'cpu': 0.0, 'empty_recognitions': 0,
+              'first_named': None, 'named': 0, 'present': 0}
+    entered_at = None
+    for i, (phase, frame) in enumerate(scene_frames(photo, fps, rng)):
+        now = i / fps
+        if finished is not None and now >= finished[0]:
+            results = finished[1]
+            finished = None
+        if policy.decide(frame, now):
+            if pending is not None:
+                report['dropped'] += 1
+            pending = (now, frame, phase)
+        if pending is not None and now >= busy_until:
+            offered_at, image, offered_phase = pending
+            pending = None
+            if now - offered_at <= MAX_RECOGNITION_AGE:
+                start = time.perf_counter()
+                cpu_start = time.thread_time()
+                faces = annotations(engine.process(image, now))
+                latency = time.perf_counter() - start
+                cpu = time.thread_time() - cpu_start
+                busy_until = now + latency
+                finished = (busy_until, faces)
+                policy.observe(faces, latency, cpu, busy_until)
+                report['recognized'] += 1
+                report['cpu'] += cpu
+                report['empty_recognitions'] += offered_phase == 'empty'
+
+        if phase != 'empty':
+            entered_at = now if entered_at is None else entered_at
+            report['present'] += 1
+            named = any(label == name for _, label in results)
+            report['named'] += named
+            if named and report['first_named'] is None:
+                report['first_named'] = now - entered_at
+    report['duration'] = i / fps
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', default='faces')
+    parser.add_argument('--photo', help='photo in --faces to walk through the scene')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--skip', type=int, default=3, help='N for the fixed policy')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        gallery = FaceGallery(args.faces, FaceEncodingCache(args.faces, cache_directory))
+        snapshot = gallery.load()
+        matcher = snapshot.matcher
+    filename = args.photo or sorted(snapshot.filenames)[0]
+    photo = cv2.imread(os.path.join(args.faces, filename))
+    name = identity_name(filename)
+    RecognitionEngine(matcher).process(photo)  # load the models outside the timings
+
+    policies = [(f'every {args.skip}', EveryNth(args.skip)),
+                ('adaptive', FrameScheduler(summarize=scene_summary))]
+    print(f"{name} walks through {sum(seconds for _, seconds in SCENE):.0f}s of scene "
+          f"at {args.fps:.0f} fps")
+    print(f"{'policy':>10} {'recognized':>10} {'dropped':>8} {'cpu s':>7} {'core':>6} "
+          f"{'empty':>6} {'named after':>12} {'named':>6}")
+    for label, policy in policies:
+        report = run(policy, matcher, photo, name, args.fps)
+        first = 'never' if report['first_named'] is None else f"{report['first_named']:.2f}s"
+        print(f"{label:>10} {report['recognized']:>10} {report['dropped']:>8} "
+              f"{report['cpu']:>7.2f} {report['cpu'] / report['duration']:>6.1%} "
+              f"{report['empty_recognitions']:>6} {first:>12} "
+              f"{report['named'] / max(report['present'], 1):>6.1%}")
+        if isinstance(policy, FrameScheduler):
+            print(f"{'':>10} decisions: " +
+                  ', '.join(f'{k} {v}' for k, v in policy.decisions.items()))
+
+
+if __name__ == '__main__':
+    main()
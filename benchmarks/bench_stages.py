@@ -0,0 +1,133 @@
+"""Time each recognition stage on its own: detection, landmarks, encoding, matching.
+
+Usage: python benchmarks/bench_stages.py [--frames faces/] [--video lecture.mp4]
+                                         [--batch-sizes 1 8 32] [--gallery-sizes 100 10000]
+
+Detection and landmarks are timed per frame on the given frames. Encoding
+is timed per face chip at each batch size, both for live frames and for a
+gallery build from the frame images. Matching uses synthetic galleries of
+the given sizes.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from detectors import FaceLocator  # noqa: E402
+from encoder import LARGE_LANDMARKS, SMALL_LANDMARKS, FaceEncoder  # noqa: E402
+from face_cache import SUPPORTED_IMAGE_EXTENSIONS  # noqa: E402
+from matcher import FaceMatcher  # noqa: E402
+
+REPEAT = 3
+
+
+def load_frames(args):
+    frames = []
+    if args.frames:
+        for filename in sorted(os.listdir(args.frames)):
+            if filename.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(args.frames, filename))
+                if frame is not None:
+                    frames.append(frame)
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        index = 0
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if index % args.every == 0:
+                frames.append(frame)
+            index += 1
+        capture.release()
+    return frames
+
+
+def best_of(fn, repeat=REPEAT):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(stage, seconds, count, unit):
+    per_item = seconds / count * 1000 if count else float('nan')
+    print(f"{stage:<28} {per_item:>10.2f} ms/{unit:<6} ({count} {unit}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', default=None, help='directory of still frames')
+    parser.add_argument('--video', help='video file to sample frames from')
+    parser.add_argument('--every', type=int, default=10, help='sample every Nth video frame')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    args = parser.parse_args()
+    if not args.frames and not args.video:
+        args.frames = 'faces'
+
+    frames = load_frames(args)
+    if not frames:
+        parser.error('no frames found')
+    rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+
+    # Detection
+    locator = FaceLocator()
+    seconds, detections = best_of(lambda: [locator.locate(frame) for frame in frames])
+    report('detect (hog@0.25)', seconds, len(frames), 'frame')
+    boxes = [detection.boxes for detection in detections]
+    faces = sum(len(b) for b in boxes)
+    if not faces:
+        print("No faces found; nothing more to time")
+        return
+
+    # Landmarks
+    encoders = {model: FaceEncoder(model) for model in (SMALL_LANDMARKS, LARGE_LANDMARKS)}
+    shapes = {}
+    for model, encoder in encoders.items():
+        seconds, shapes[model] = best_of(
+            lambda: [encoder.shapes(rgb, b) for rgb, b in zip(rgb_frames, boxes)])
+        report(f'landmarks ({model})', seconds, faces, 'face')
+
+    # Alignment and encoding
+    encoder = encoders[LARGE_LANDMARKS]
+    seconds, chips = best_of(lambda: [chip for rgb, s in zip(rgb_frames, shapes[LARGE_LANDMARKS])
+                                      for chip in encoder.chips(rgb, s)])
+    report('align (face chips)', seconds, faces, 'face')
+    for batch_size in args.batch_sizes:
+        encoder.batch_size = batch_size
+        # Repeat the chips so every batch size sees full batches
+        batch = (chips * (-(-batch_size // len(chips))))[:max(batch_size, len(chips))]
+        seconds, _ = best_of(lambda: encoder.encode_chips(batch))
+        report(f'encode (batch {batch_size})', seconds, len(batch), 'face')
+
+    # Gallery build: detect + align per image, encode in batches
+    if args.frames:
+        paths = [os.path.join(args.frames, f) for f in sorted(os.listdir(args.frames))
+                 if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS)]
+        for batch_size in args.batch_sizes:
+            encoder.batch_size = batch_size
+            seconds, _ = best_of(lambda: encoder.encode_images(paths), repeat=1)
+            report(f'gallery build (batch {batch_size})', seconds, len(paths), 'image')
+
+    # Matching
+    rng = np.random.default_rng(0)
+    queries = encoder.encode_chips(chips[:8])
+    for size in args.gallery_sizes:
+        gallery = rng.normal(size=(size, 128))
+        gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+        matcher = FaceMatcher([f'person{i}' for i in range(size)], gallery)
+        matcher.match(queries)  # builds the index outside the timing
+        seconds, _ = best_of(lambda: matcher.match(queries))
+        report(f'match ({size} identities)', seconds, len(queries), 'face')
+
+
+if __name__ == '__main__':
+    main()
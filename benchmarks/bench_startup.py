@@ -0,0 +1,107 @@
+"""Time a cold start of the web app and measure worker memory.
+
+Usage: python benchmarks/bench_startup.py [--workers 2] [--port 8765]
+
+For each configuration a fresh ``gunicorn app:app`` is started and timed
+until the first page (``/privacy_notice``) is served and until ``/ready``
+reports recognition as warm. Once ready, the proportional set size (PSS)
+of every worker is read from ``/proc``; with ``preload`` the workers share
+the master's model pages copy-on-write, so their PSS is lower. ``eager``
+mimics loading everything at import in every worker, as before lazy
+start-up.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+POLL_INTERVAL = 0.05
+START_TIMEOUT = 300.0
+
+# name: (GUNICORN_PRELOAD, WARMUP_MODE)
+CONFIGURATIONS = {
+    'eager': ('0', 'eager'),
+    'lazy': ('0', 'background'),
+    'preload': ('1', 'background'),
+}
+
+
+def status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None
+
+
+def wait_for(url, start, ok=(200,), repeat=1):
+    """Seconds from ``start`` until ``url`` returned an ``ok`` status ``repeat`` times in a row"""
+    streak = 0
+    while time.perf_counter() - start < START_TIMEOUT:
+        if status(url) in ok:
+            streak += 1
+            if streak >= repeat:
+                return time.perf_counter() - start
+        else:
+            streak = 0
+            time.sleep(POLL_INTERVAL)
+    raise TimeoutError(url)
+
+
+def worker_pss(master_pid):
+    """PSS in MB of each child of ``master_pid``"""
+    children = subprocess.run(['pgrep', '-P', str(master_pid)], capture_output=True,
+                              text=True).stdout.split()
+    sizes = []
+    for pid in children:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    sizes.append(int(line.split()[1]) / 1024)
+    return sizes
+
+
+def run(name, workers, port):
+    preload, warmup_mode = CONFIGURATIONS[name]
+    env = dict(os.environ, GUNICORN_PRELOAD=preload, WARMUP_MODE=warmup_mode,
+               WEB_CONCURRENCY=str(workers), PORT=str(port))
+    command = [sys.executable, '-m', 'gunicorn', 'app:app']
+    base = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        first_page = wait_for(base + '/privacy_notice', start)
+        ready = wait_for(base + '/ready', start, repeat=workers * 4)
+        pss = worker_pss(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    return first_page, ready, pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--configurations', nargs='+', default=list(CONFIGURATIONS),
+                        choices=CONFIGURATIONS)
+    args = parser.parse_args()
+
+    print(f"{args.workers} gunicorn workers")
+    print(f"{'config':<8} {'first page s':>13} {'ready s':>8} {'PSS/worker MB':>14}")
+    for name in args.configurations:
+        first_page, ready, pss = run(name, args.workers, args.port)
+        print(f"{name:<8} {first_page:13.2f} {ready:8.2f} "
+              f"{sum(pss) / max(len(pss), 1):14.0f}")
+
+
+if __name__ == '__main__':
+    main()
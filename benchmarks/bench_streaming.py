@@ -0,0 +1,124 @@
+"""Measure server CPU and bandwidth per /video_feed viewer.
+
+Usage: python benchmarks/bench_streaming.py lecture.mp4 [--viewers 4] [--duration 10] [--motion]
+
+A recorded video, looped and paced to its own frame rate, feeds a
+``FramePipeline`` with recognition stubbed out, so only drawing, change
+detection, JPEG encoding and fan-out are measured. Each scenario runs
+``--viewers`` in-process viewers for ``--duration`` seconds and reports the
+process CPU time and bytes sent. ``legacy`` mimics the stream before
+per-client settings: every frame, full size, OpenCV's default quality 95,
+no change detection. ``--motion`` pans every frame so nothing is skipped as
+unchanged, for recordings of a still scene.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pipeline import CHANGE_THRESHOLD, FramePipeline  # noqa: E402
+from streaming import MAX_STREAM_FPS, StreamSettings, part_renderer  # noqa: E402
+
+SCENARIOS = {
+    'legacy': (StreamSettings(MAX_STREAM_FPS, 95), 0),
+    'default': (StreamSettings(), CHANGE_THRESHOLD),
+    'half-size': (StreamSettings(width=320), CHANGE_THRESHOLD),
+    'thumbnail': (StreamSettings.thumbnail(), CHANGE_THRESHOLD),
+}
+
+
+class PacedCapture:
+    """``cv2.VideoCapture`` over a file, looped and read at the file's frame rate"""
+
+    def __init__(self, path, motion=False):
+        self.capture = cv2.VideoCapture(path)
+        self.motion = motion
+        self.frames = 0
+        self.interval = 1.0 / (self.capture.get(cv2.CAP_PROP_FPS) or 30.0)
+        self.next_at = time.monotonic()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        delay = self.next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_at = max(self.next_at + self.interval, time.monotonic() - self.interval)
+        ret, image = self.capture.read()
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self.capture.read()
+        if ret and self.motion:
+            image = np.roll(image, self.frames * 8 % 128, axis=1)
+        self.frames += 1
+        return ret, image
+
+    def release(self):
+        self.capture.release()
+
+
+def draw(image, results):
+    for top, right, bottom, left in results:
+        cv2.rectangle(image, (left, top), (right, bottom), (0, 255, 0), 2)
+
+
+def run(video, settings, change_threshold, viewers, duration, motion=False):
+    pipeline = FramePipeline(lambda: PacedCapture(video, motion), lambda image: [], draw,
+                             change_threshold=change_threshold)
+    pipeline.start()
+    subscribers = [pipeline.subscribe() for _ in range(viewers)]
+    stop = threading.Event()
+
+    def consume(subscriber):
+        for _ in subscriber.frames(part_renderer(settings), settings.key, settings.min_interval):
+            if stop.is_set():
+                break
+
+    threads = [threading.Thread(target=consume, args=(s,), daemon=True) for s in subscribers]
+    for thread in threads:
+        thread.start()
+    cpu_start = time.process_time()
+    time.sleep(duration)
+    cpu = time.process_time() - cpu_start
+    stop.set()
+    stats = pipeline.stats()
+    pipeline.stop()
+    for thread in threads:
+        thread.join()
+    return {
+        'cpu': cpu / duration,
+        'fps': sum(s.frames_sent for s in subscribers) / viewers / duration,
+        'kbps': sum(s.bytes_sent for s in subscribers) / viewers / duration * 8 / 1000,
+        'unchanged': stats['skipped']['unchanged']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('video')
+    parser.add_argument('--viewers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--motion', action='store_true', help='pan each frame')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    args = parser.parse_args()
+
+    print(f"{args.viewers} viewers, {args.duration:.0f}s per scenario")
+    print(f"{'scenario':<10} {'cpu %':>7} {'fps/viewer':>11} {'kbit/s/viewer':>14} "
+          f"{'unchanged':>10}")
+    for name in args.scenarios:
+        settings, change_threshold = SCENARIOS[name]
+        result = run(args.video, settings, change_threshold, args.viewers, args.duration,
+                     args.motion)
+        print(f"{name:<10} {result['cpu'] * 100:7.1f} {result['fps']:11.1f} "
+              f"{result['kbps']:14.0f} {result['unchanged']:10d}")
+
+
+if __name__ == '__main__':
+    main()
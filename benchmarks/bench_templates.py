@@ -0,0 +1,232 @@
+"""Compare one template per identity with several, per template reduction.
+
+Usage: python benchmarks/bench_templates.py [--identities 1000 10000] [--templates 5]
+       python benchmarks/bench_templates.py --dataset photos/  # photos/<name>/*.jpg
+       python benchmarks/bench_templates.py --augment faces/   # faces/<name>.jpg
+
+Latency: exact ``FaceMatcher.nearest`` over a synthetic gallery of
+``--identities`` people with one template each (the old gallery) versus
+``--templates`` each, for every reduction.
+
+Recognition: each person's first image(s) are enrolled and the rest used as
+probes. Synthetic people are a centre encoding plus per-photo noise scaled
+so that same-person distances (about 0.3-0.6) and different-person
+distances (about 0.8) resemble dlib's; a share of them is never enrolled
+and probes as impostors. ``--dataset`` encodes a labelled photo tree
+instead, and ``--augment`` makes a labelled set out of one photo per person
+by flipping, rotating, shrinking, relighting and blurring it. Reports the
+rate of correct matches, probes left Unknown, impostors accepted and the
+mean margin (closest wrong identity minus the true one).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from face_cache import SUPPORTED_IMAGE_EXTENSIONS  # noqa: E402
+from matcher import FACE_MATCH_THRESHOLD, TEMPLATE_REDUCTIONS, FaceMatcher  # noqa: E402
+
+IDENTITY_SPREAD = 0.57          # centre offset; different people end up ~0.8 apart
+PHOTO_NOISE = (0.2, 0.45)       # per-photo offset from the centre, uniform in this range
+IMPOSTOR_SHARE = 0.2            # synthetic people probed but never enrolled
+PROBES_PER_IDENTITY = 10
+FACES_PER_FRAME = 4
+
+
+def random_offsets(count, norms, rng):
+    offsets = rng.normal(size=(count, 128))
+    offsets *= (np.asarray(norms) / np.linalg.norm(offsets, axis=1))[:, None]
+    return offsets
+
+
+def synthetic_people(identities, photos, rng):
+    """``{name: (photos, 128) encodings}`` for synthetic people"""
+    mean = random_offsets(1, [1.0], rng)
+    centres = mean + random_offsets(identities, np.full(identities, IDENTITY_SPREAD), rng)
+    people = {}
+    for i, centre in enumerate(centres):
+        noise = rng.uniform(*PHOTO_NOISE, size=photos)
+        people[f'person_{i}'] = centre + random_offsets(photos, noise, rng)
+    return people
+
+
+def augmented_images(image):
+    """``(label, image)`` variants of one BGR photo standing in for further photos of the person"""
+    import cv2
+
+    height, width = image.shape[:2]
+    centre = (width / 2, height / 2)
+    small = cv2.resize(image, (0, 0), fx=0.4, fy=0.4)
+    yield 'flip', cv2.flip(image, 1)
+    for angle in (-10, 10):
+        yield f'rotate{angle:+d}', cv2.warpAffine(
+            image, cv2.getRotationMatrix2D(centre, angle, 1.0), (width, height))
+    yield 'low-res', cv2.resize(small, (width, height))
+    yield 'dark', cv2.convertScaleAbs(image, alpha=0.6, beta=-20)
+    yield 'bright', cv2.convertScaleAbs(image, alpha=1.3, beta=30)
+    yield 'blur', cv2.GaussianBlur(image, (9, 9), 0)
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 15])
+    yield 'jpeg-15', cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+
+
+def encode_people(paths_by_name):
+    """``{name: encodings}`` for image files, dropping images without a face"""
+    from encoder import FaceEncoder
+
+    names = [name for name, paths in paths_by_name.items() for _ in paths]
+    paths = [path for paths in paths_by_name.values() for path in paths]
+    people = {}
+    for name, encoding in zip(names, FaceEncoder().encode_images(paths)):
+        if encoding is not None:
+            people.setdefault(name, []).append(encoding)
+    return {name: np.array(encodings) for name, encodings in people.items()}
+
+
+def dataset_people(directory):
+    paths_by_name = {}
+    for name in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, name)
+        if os.path.isdir(folder):
+            paths_by_name[name] = sorted(
+                os.path.join(folder, f) for f in os.listdir(folder)
+                if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS))
+    return encode_people(paths_by_name)
+
+
+def augmented_people(directory, scratch):
+    import cv2
+
+    from face_cache import identity_name
+
+    paths_by_name = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+            continue
+        name = identity_name(filename)
+        path = os.path.join(directory, filename)
+        paths = paths_by_name.setdefault(name, [path])
+        for i, (_, variant) in enumerate(augmented_images(cv2.imread(path))):
+            paths.append(os.path.join(scratch, f'{name}-{i}.jpg'))
+            cv2.imwrite(paths[-1], variant)
+    return encode_people(paths_by_name)
+
+
+def evaluate(people, templates, reduction, probe_start, impostors=()):
+    """Hit, unknown and false-accept rates and mean margin when enrolling ``templates`` photos each.
+
+    Photos from ``probe_start`` on are probes, so every setting sees the same ones.
+    """
+    enrolled = [name for name in people if name not in impostors]
+    names = [name for name in enrolled for _ in people[name][:templates]]
+    encodings = np.concatenate([people[name][:templates] for name in enrolled])
+    matcher = FaceMatcher(names, encodings, index_threshold=None, reduction=reduction)
+    column = {name: i for i, name in enumerate(matcher.identities)}
+
+    hits = unknown = accepted = probes = impostor_probes = 0
+    margins = []
+    for name, photos in people.items():
+        queries = photos[probe_start:] if name not in impostors else photos
+        if not len(queries):
+            continue
+        distances = matcher.identity_distances(queries)
+        best = distances.argmin(axis=1)
+        best_distance = distances[np.arange(len(queries)), best]
+        known = best_distance <= FACE_MATCH_THRESHOLD
+        if name in impostors:
+            impostor_probes += len(queries)
+            accepted += int(known.sum())
+            continue
+        probes += len(queries)
+        true = column[name]
+        hits += int((known & (best == true)).sum())
+        unknown += int((~known).sum())
+        if len(column) > 1:
+            others = np.delete(distances, true, axis=1)
+            margins.extend(others.min(axis=1) - distances[:, true])
+    return {
+        'hit': hits / max(probes, 1),
+        'unknown': unknown / max(probes, 1),
+        'false_accept': accepted / impostor_probes if impostor_probes else None,
+        'margin': float(np.mean(margins)) if margins else float('nan')
+    }
+
+
+def time_nearest(matcher, queries, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matcher.nearest(queries)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report_latency(sizes, templates, repeat, rng):
+    print(f"matcher latency, {FACES_PER_FRAME} faces per frame, exact search")
+    print(f"{'identities':>10} {'1 template':>11} " +
+          ' '.join(f"{f'{templates}x {r}':>12}" for r in TEMPLATE_REDUCTIONS))
+    for size in sizes:
+        people = synthetic_people(size, templates, rng)
+        queries = np.stack([photos[0] for photos in list(people.values())[:FACES_PER_FRAME]])
+        names = list(people)
+        single = FaceMatcher(names, [people[n][0] for n in names], index_threshold=None)
+        row = [time_nearest(single, queries, repeat)]
+        all_names = [n for n in names for _ in range(templates)]
+        encodings = np.concatenate([people[n] for n in names])
+        for reduction in TEMPLATE_REDUCTIONS:
+            matcher = FaceMatcher(all_names, encodings, index_threshold=None, reduction=reduction)
+            row.append(time_nearest(matcher, queries, repeat))
+        print(f"{size:>10} {row[0] * 1000:>8.2f} ms " +
+              ' '.join(f"{t * 1000:>9.2f} ms" for t in row[1:]))
+
+
+def report_recognition(title, people, templates, impostors=()):
+    print(title)
+    print(f"{'templates':>9} {'reduction':>9} {'hit':>7} {'unknown':>8} {'false acc':>10} "
+          f"{'margin':>7}")
+    settings = [(1, 'min')] + [(templates, r) for r in TEMPLATE_REDUCTIONS]
+    for count, reduction in settings:
+        result = evaluate(people, count, reduction, templates, impostors)
+        false_accept = 'n/a' if result['false_accept'] is None else f"{result['false_accept']:.1%}"
+        print(f"{count:>9} {reduction:>9} {result['hit']:>7.1%} {result['unknown']:>8.1%} "
+              f"{false_accept:>10} {result['margin']:>7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--identities', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--templates', type=int, default=5, help='templates per identity')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--dataset', help='directory of <name>/ photo folders')
+    parser.add_argument('--augment', help='directory of one photo per person to augment')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    report_latency(args.identities, args.templates, args.repeat, rng)
+    print()
+
+    people = synthetic_people(500, args.templates + PROBES_PER_IDENTITY, rng)
+    impostors = set(list(people)[:int(len(people) * IMPOSTOR_SHARE)])
+    report_recognition(f"synthetic: {len(people) - len(impostors)} enrolled, "
+                       f"{len(impostors)} impostors", people, args.templates, impostors)
+
+    if args.dataset:
+        print()
+        report_recognition(f"dataset {args.dataset}", dataset_people(args.dataset),
+                           args.templates)
+    if args.augment:
+        import tempfile
+
+        # Only the original and the first augmentations are enrolled; the rest are probes
+        with tempfile.TemporaryDirectory() as scratch:
+            people = augmented_people(args.augment, scratch)
+        print()
+        report_recognition(f"augmented {args.augment}: {len(people)} people", people,
+                           min(args.templates, 4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Find how many camera streams the supervisor sustains on this machine.
+
+Usage: python benchmarks/load_cameras.py lecture.mp4 [other.mp4 ...] [--max-streams 8]
+
+Recorded videos stand in for cameras: each one is looped and paced to its
+own frame rate, exactly like a live source. For 1, 2, ... streams the
+supervisor runs for ``--duration`` seconds; a load level "fits" when every
+stream captures at >= 90% of its source frame rate and recognition drops
+fewer than 10% of the frames it is offered.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from supervisor import FRAME_SKIP_RATE, CameraSupervisor  # noqa: E402
+
+MIN_CAPTURE_RATIO = 0.9
+MAX_DROP_RATIO = 0.1
+
+
+def source_fps(path):
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    capture.release()
+    return fps
+
+
+def run_level(videos, streams, duration, frame_skip, faces, cache, directory):
+    config = {
+        'faces': faces,
+        'cache': cache,
+        'attendance': {'backend': 'sqlite', 'path': os.path.join(directory, f'{streams}.db')},
+        'cameras': [{'id': f'cam{i}', 'source': videos[i % len(videos)], 'loop': True,
+                     'frame_skip': frame_skip}
+                    for i in range(streams)]
+    }
+    supervisor = CameraSupervisor(config)
+    supervisor.start()
+    time.sleep(duration)
+    stats = supervisor.stats()['cameras']
+    supervisor.stop()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--max-streams', type=int, default=(os.cpu_count() or 1) * 2)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per load level')
+    parser.add_argument('--frame-skip', type=int, default=FRAME_SKIP_RATE)
+    parser.add_argument('--faces', default='faces')
+    parser.add_argument('--cache', default='cache')
+    args = parser.parse_args()
+
+    fps = {video: source_fps(video) for video in args.videos}
+    print(f"{os.cpu_count()} cores; sources at "
+          + ', '.join(f'{os.path.basename(v)} {f:.0f} fps' for v, f in fps.items()))
+    print(f"{'streams':>7} {'capture fps':>12} {'recog fps':>10} {'recog ms':>9} "
+          f"{'dropped':>8}  fits")
+
+    fitting = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for streams in range(1, args.max_streams + 1):
+            stats = run_level(args.videos, streams, args.duration, args.frame_skip,
+                              args.faces, args.cache, directory)
+            fits = True
+            capture = recognition = latency = dropped = 0.0
+            for i, camera in enumerate(stats.values()):
+                target = fps[args.videos[i % len(args.videos)]]
+                offered = camera['recognition_fps'] + camera['dropped_frames'] / args.duration
+                drop_ratio = camera['dropped_frames'] / (offered * args.duration) if offered else 1.0
+                fits = fits and camera['capture_fps'] >= MIN_CAPTURE_RATIO * target \
+                    and drop_ratio < MAX_DROP_RATIO
+                capture += camera['capture_fps']
+                recognition += camera['recognition_fps']
+                latency += camera['mean_recognition_ms'] or 0.0
+                dropped += drop_ratio
+            print(f"{streams:>7} {capture / streams:>12.1f} {recognition / streams:>10.1f} "
+                  f"{latency / streams:>9.1f} {dropped / streams:>8.1%}  {'yes' if fits else 'no'}")
+            if not fits:
+                break
+            fitting = streams
+    print(f"{fitting} stream(s) fit on {os.cpu_count()} cores "
+          f"(recognizing every {args.frame_skip} frame(s))")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Push frames at a running server's /recognize API and report throughput.
+
+Usage: python benchmarks/load_recognize.py http://localhost:5000 lecture.mp4 [--clients 4]
+       python benchmarks/load_recognize.py http://localhost:5000 faces/ --stream
+
+Each client thread sends JPEG frames taken from a video (every
+``--every``-th frame) or an image directory, one frame per request, or over
+a single ``/recognize/stream`` request with ``--stream``. Reports frames
+recognized per second, latency percentiles and how many requests the
+server turned away with 503 (its backpressure).
+"""
+import argparse
+import http.client
+import json
+import os
+import struct
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import cv2
+import numpy as np
+
+SUPPORTED_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+STREAM_WINDOW = 2   # frames a streaming client sends ahead of the results it has read
+
+
+def load_frames(source, every, limit, width):
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, f) for f in os.listdir(source)
+                       if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS))
+        images = [cv2.imread(path) for path in paths[:limit]]
+    else:
+        capture = cv2.VideoCapture(source)
+        images = []
+        index = 0
+        while len(images) < limit:
+            ret, image = capture.read()
+            if not ret:
+                break
+            if index % every == 0:
+                images.append(image)
+            index += 1
+        capture.release()
+    frames = []
+    for image in images:
+        if width and image.shape[1] > width:
+            image = cv2.resize(image, (width, int(image.shape[0] * width / image.shape[1])))
+        frames.append(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return frames
+
+
+def post_frames(url, frames, deadline, latencies, counts):
+    i = 0
+    while time.perf_counter() < deadline:
+        request = urllib.request.Request(url + '/recognize', data=frames[i % len(frames)],
+                                         headers={'Content-Type': 'image/jpeg'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                json.load(response)
+            latencies.append(time.perf_counter() - start)
+            counts['ok'] += 1
+        except urllib.error.HTTPError as e:
+            counts['rejected' if e.code == 503 else 'failed'] += 1
+            if e.code == 503:
+                time.sleep(float(e.headers.get('Retry-After', 1)))
+        i += 1
+
+
+def stream_frames(url, frames, deadline, latencies, counts):
+    parts = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    sent_at = []
+    # Like a live client, keep only a couple of frames in flight; otherwise
+    # frames queue in socket buffers and latency grows without bound
+    in_flight = threading.Semaphore(STREAM_WINDOW)
+
+    def body():
+        i = 0
+        while time.perf_counter() < deadline:
+            in_flight.acquire()
+            data = frames[i % len(frames)]
+            sent_at.append(time.perf_counter())
+            yield struct.pack('>I', len(data)) + data
+            i += 1
+
+    def send():
+        for chunk in body():
+            connection.send(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+        connection.send(b'0\r\n\r\n')
+
+    # Results are read while frames are still being sent
+    connection.putrequest('POST', '/recognize/stream')
+    connection.putheader('Content-Type', 'application/octet-stream')
+    connection.putheader('Transfer-Encoding', 'chunked')
+    connection.endheaders()
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    response = connection.getresponse()
+    if response.status != 200:
+        counts['rejected' if response.status == 503 else 'failed'] += 1
+        return
+    for i, line in enumerate(response):
+        result = json.loads(line)
+        counts['failed' if 'error' in result else 'ok'] += 1
+        latencies.append(time.perf_counter() - sent_at[i])
+        in_flight.release()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('source', help='video file or image directory')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--every', type=int, default=10, help='use every n-th video frame')
+    parser.add_argument('--limit', type=int, default=50, help='distinct frames to send')
+    parser.add_argument('--width', type=int, default=640, help='downscale wider frames')
+    parser.add_argument('--stream', action='store_true', help='use /recognize/stream')
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.every, args.limit, args.width)
+    if not frames:
+        parser.error(f"No frames in {args.source}")
+    url = args.url.rstrip('/')
+    latencies = []
+    counts = {'ok': 0, 'rejected': 0, 'failed': 0}
+    deadline = time.perf_counter() + args.duration
+    target = stream_frames if args.stream else post_frames
+    threads = [threading.Thread(target=target, args=(url, frames, deadline, latencies, counts))
+               for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.clients} clients, {'stream' if args.stream else 'request per frame'}, "
+          f"{len(frames)} distinct frames")
+    print(f"recognized {counts['ok'] / elapsed:.1f} frames/s; "
+          f"rejected {counts['rejected']}, failed {counts['failed']}")
+    if latencies:
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print(f"latency p50 {p50:.0f} ms, p95 {p95:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Regression and latency check for engine.RecognitionEngine, without a camera.
+
+Usage: python benchmarks/regress_engine.py [--faces faces/] [--repeat 5]
+       python benchmarks/regress_engine.py --save-baseline engine_baseline.json
+       python benchmarks/regress_engine.py --baseline engine_baseline.json
+
+Enrolls the photos in ``--faces`` (encodings go to a scratch cache, so the
+app's ``cache/`` is untouched) and runs the engine over probe frames made
+from them: each photo at camera size and its augmentations from
+``bench_templates.py`` (flipped, rotated, low resolution, dark, bright,
+blurred, heavy JPEG), everyone side by side in one frame, and an empty
+frame. Each probe must return exactly the people in it. A steady-scene run
+through the tracker path follows, and a tracked scene that cuts from one
+person to the next in the same spot, where every frame must carry the
+person actually in view. With ``--baseline`` the names, match
+distances and median latency are compared against an earlier
+``--save-baseline`` run from the same machine. Exits with status 1 on any
+regression.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_templates import augmented_images  # noqa: E402
+from engine import RecognitionEngine  # noqa: E402
+from face_cache import FaceEncodingCache, identity_name  # noqa: E402
+from gallery import FaceGallery  # noqa: E402
+from tracker import FaceTracker  # noqa: E402
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+STEADY_FRAMES = 30
+CUT_FRAMES = 10               # tracked frames per person in the cut scene
+DISTANCE_TOLERANCE = 0.05     # allowed increase of a probe's match distance
+LATENCY_TOLERANCE = 0.25      # allowed relative increase of the median latency
+
+
+def camera_frame(image, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """``image`` scaled to fit and centred on a black ``width`` x ``height`` frame"""
+    scale = min(width / image.shape[1], height / image.shape[0])
+    resized = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)))
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    top = (height - resized.shape[0]) // 2
+    left = (width - resized.shape[1]) // 2
+    frame[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return frame
+
+
+def probes(faces_directory):
+    """``[(probe id, BGR frame, expected names), ...]``"""
+    result = []
+    photos = []
+    for filename in sorted(os.listdir(faces_directory)):
+        image = cv2.imread(os.path.join(faces_directory, filename))
+        if image is None:
+            continue
+        name = identity_name(filename)
+        frame = camera_frame(image)
+        photos.append((name, image))
+        result.append((f'{filename}:original', frame, [name]))
+        for label, variant in augmented_images(frame):
+            result.append((f'{filename}:{label}', variant, [name]))
+    if len(photos) > 1:
+        # Everyone in one wide frame, each at the height of a camera frame
+        group = np.hstack([camera_frame(image, FRAME_HEIGHT, FRAME_HEIGHT) for _, image in photos])
+        result.append(('group', group, sorted({name for name, _ in photos})))
+    result.append(('empty', np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8), []))
+    return result
+
+
+def run_probes(engine, cases, repeat):
+    report = {}
+    for probe_id, frame, expected in cases:
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = engine.process(frame)
+            latencies.append(time.perf_counter() - start)
+        names = sorted(result.name for result in results if result.known)
+        distances = [result.match.distance for result in results if result.known]
+        report[probe_id] = {
+            'expected': expected,
+            'names': names,
+            'max_distance': round(max(distances), 4) if distances else None,
+            'ms': round(float(np.median(latencies)) * 1000, 2)
+        }
+    return report
+
+
+def steady_scene(matcher, frame):
+    """Median ms per frame when the same face stays in view, tracker path"""
+    engine = RecognitionEngine(matcher, tracker=FaceTracker())
+    latencies = []
+    for i in range(STEADY_FRAMES):
+        start = time.perf_counter()
+        engine.process(frame, now=i / 10)
+        latencies.append(time.perf_counter() - start)
+    return round(float(np.median(latencies[1:])) * 1000, 2)
+
+
+def cut_scene(matcher, faces_directory):
+    """``(frame label, expected name, names)`` for each tracked frame that named the wrong person"""
+    engine = RecognitionEngine(matcher, tracker=FaceTracker())
+    wrong = []
+    frame_index = 0
+    for filename in sorted(os.listdir(faces_directory)):
+        image = cv2.imread(os.path.join(faces_directory, filename))
+        if image is None:
+            continue
+        frame = camera_frame(image)
+        name = identity_name(filename)
+        for _ in range(CUT_FRAMES):
+            names = sorted(result.name for result in engine.process(frame, now=frame_index / 10))
+            if names != [name]:
+                wrong.append((f'{filename}:{frame_index}', name, names))
+            frame_index += 1
+    return wrong
+
+
+def compare(report, baseline, latency_tolerance):
+    """Regressions against an earlier report, as messages"""
+    problems = []
+    for probe_id, previous in baseline['probes'].items():
+        current = report['probes'].get(probe_id)
+        if current is None:
+            problems.append(f"{probe_id}: probe missing")
+            continue
+        if current['names'] != previous['names']:
+            problems.append(f"{probe_id}: {current['names']} instead of {previous['names']}")
+        elif current['max_distance'] is not None and previous['max_distance'] is not None and \
+                current['max_distance'] > previous['max_distance'] + DISTANCE_TOLERANCE:
+            problems.append(f"{probe_id}: distance {current['max_distance']} "
+                            f"(was {previous['max_distance']})")
+    for key in ('median_ms', 'steady_ms'):
+        if report[key] > baseline[key] * (1 + latency_tolerance):
+            problems.append(f"{key}: {report[key]} ms (was {baseline[key]} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', default='faces')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', help='report to compare against')
+    parser.add_argument('--save-baseline', help='write this run\'s report here')
+    parser.add_argument('--latency-tolerance', type=float, default=LATENCY_TOLERANCE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        gallery = FaceGallery(args.faces, FaceEncodingCache(args.faces, cache_directory))
+        gallery.load()
+        matcher = gallery.snapshot().matcher
+        engine = RecognitionEngine(matcher)
+        cases = probes(args.faces)
+        engine.process(cases[0][1])  # load the models outside the timings
+        report = {'probes': run_probes(engine, cases, args.repeat)}
+        report['median_ms'] = round(float(np.median([p['ms'] for p in report['probes'].values()])),
+                                    2)
+        report['steady_ms'] = steady_scene(matcher, cases[0][1])
+        cut_failures = cut_scene(matcher, args.faces)
+
+    failures = 0
+    for probe_id, probe in report['probes'].items():
+        ok = probe['names'] == probe['expected']
+        failures += not ok
+        distance = '' if probe['max_distance'] is None else f"{probe['max_distance']:.3f}"
+        print(f"{'ok  ' if ok else 'FAIL'} {probe_id:<28} {', '.join(probe['names']) or '-':<24} "
+              f"{distance:>6} {probe['ms']:>8.1f} ms")
+    for frame_label, name, names in cut_failures:
+        print(f"FAIL cut {frame_label:<24} {', '.join(names) or '-'} instead of {name}")
+    print(f"{len(report['probes']) - failures}/{len(report['probes'])} probes recognized "
+          f"as expected; median {report['median_ms']} ms per frame, "
+          f"{report['steady_ms']} ms per tracked frame")
+    print(f"cut scene: {len(cut_failures)} tracked frames named the wrong person")
+    failures += len(cut_failures)
+
+    problems = compare(report, json.load(open(args.baseline)), args.latency_tolerance) \
+        if args.baseline else []
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if failures or problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Regression check for gallery.FaceGallery shared by several workers.
+
+Usage: python benchmarks/regress_gallery.py [--faces faces/]
+
+Runs two ``FaceGallery`` instances over one scratch faces directory and
+encoding cache, as two gunicorn workers would, with made-up encodings. They
+take turns enrolling or removing someone; the worker that wrote must list
+exactly the people in the cache at once, and both must once their stale
+check has run. Then a zip holding a photo from ``--faces`` under several
+folders is bulk-enrolled into a gallery that already has that person: the
+enrolled photo must survive, every copy must get its own template name and
+copies beyond the template cap must be rejected. Exits with status 1 on any
+failure.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from face_cache import SUPPORTED_IMAGE_EXTENSIONS, FaceEncodingCache, identity_name  # noqa: E402
+from gallery import STALE_CHECK_INTERVAL, FaceGallery  # noqa: E402
+
+ZIP_COPIES = 3       # archive folders holding the same photo
+ZIP_TEMPLATES = 3    # template cap of the gallery they are enrolled into
+
+
+def enroll(gallery, filename, rng):
+    with open(os.path.join(gallery.faces_directory, filename), 'wb') as f:
+        f.write(filename.encode())
+    gallery.add(filename, rng.normal(size=128))
+
+
+def shared_galleries(rng):
+    """Yield ``(step, expected, {worker: filenames})`` for two workers taking turns.
+
+    Steps follow each other faster than ``STALE_CHECK_INTERVAL``, so only
+    the worker that just wrote is checked; both are checked once it passes.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        faces = os.path.join(directory, 'faces')
+        cache = os.path.join(directory, 'cache')
+        os.makedirs(faces)
+        workers = {worker: FaceGallery(faces, FaceEncodingCache(faces, cache))
+                   for worker in ('A', 'B')}
+        for worker in workers.values():
+            worker.load()
+        steps = [('A enrolls Alice', 'A', 'Alice.jpg'), ('B enrolls Bob', 'B', 'Bob.jpg'),
+                 ('A enrolls Carol', 'A', 'Carol.jpg'), ('B removes Alice', 'B', '-Alice.jpg'),
+                 ('A enrolls Dan', 'A', 'Dan.jpg')]
+        expected = set()
+        for step, worker, filename in steps:
+            if filename.startswith('-'):
+                workers[worker].remove(filename[1:])
+                expected.discard(filename[1:])
+            else:
+                enroll(workers[worker], filename, rng)
+                expected.add(filename)
+            yield step, set(expected), {worker: set(workers[worker].snapshot().filenames)}
+
+        time.sleep(STALE_CHECK_INTERVAL * 1.5)
+        yield 'settled', expected, {name: set(gallery.snapshot().filenames)
+                                    for name, gallery in workers.items()}
+
+
+def bulk_enrollment(faces_directory):
+    """Return ``(check, ok, detail)`` for a zip enrolled over an existing photo"""
+    photo = sorted(f for f in os.listdir(faces_directory)
+                   if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS))[0]
+    name = identity_name(photo)
+    with open(os.path.join(faces_directory, photo), 'rb') as f:
+        original = f.read()
+    with tempfile.TemporaryDirectory() as directory:
+        faces = os.path.join(directory, 'faces')
+        os.makedirs(faces)
+        with open(os.path.join(faces, photo), 'wb') as f:
+            f.write(original)
+        gallery = FaceGallery(faces, FaceEncodingCache(faces, os.path.join(directory, 'cache')),
+                              max_templates=ZIP_TEMPLATES)
+        gallery.load()
+        archive_path = os.path.join(directory, 'photos.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            for i in range(ZIP_COPIES):
+                archive.writestr(f'folder{i}/{photo}', original[:-1] + bytes([i]))
+        enrolled, rejected = gallery.enroll_zip(archive_path, workers=1)
+
+        with open(os.path.join(faces, photo), 'rb') as f:
+            kept = f.read() == original
+        templates = sorted(gallery.snapshot().templates(name))
+    return [
+        ('existing photo kept', kept, photo),
+        ('copies enrolled', len(enrolled) == ZIP_TEMPLATES - 1 and
+         len(set(enrolled)) == len(enrolled), ', '.join(enrolled)),
+        ('copies over the cap rejected', len(rejected) == ZIP_COPIES - ZIP_TEMPLATES + 1,
+         ', '.join(rejected)),
+        ('templates', len(templates) == ZIP_TEMPLATES, ', '.join(templates)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', default='faces')
+    args = parser.parse_args()
+
+    failures = 0
+    for step, expected, seen in shared_galleries(np.random.default_rng(0)):
+        for worker, filenames in seen.items():
+            ok = filenames == expected
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {step:<18} worker {worker}: "
+                  f"{', '.join(sorted(filenames)) or '-'}")
+    for check, ok, detail in bulk_enrollment(args.faces):
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} zip {check:<28} {detail or '-'}")
+    print(f"{failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import itertools
+import threading
+import time
+
+# Constants
+BUFFER_SIZE = 8          # frames kept in the ring buffer
+MAX_BACKLOG = 0          # frames a subscriber may fall behind before skipping to the newest
+WAIT_TIMEOUT = 1.0       # seconds a subscriber waits before re-checking for shutdown
+DEMAND_WINDOW = 5.0      # seconds a snapshot request keeps frames flowing without subscribers
+
+
+class BroadcastFrame:
+    """One published frame plus the renderings of it viewers asked for.
+
+    ``payload(key, render)`` runs ``render(data)`` once per key, so viewers
+    sharing a rendering (e.g. the same JPEG quality and size) share its cost.
+    """
+
+    __slots__ = ('seq', 'timestamp', 'data', '_payloads', '_lock')
+
+    def __init__(self, seq, timestamp, data):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.data = data
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def payload(self, key, render):
+        with self._lock:
+            if key not in self._payloads:
+                self._payloads[key] = render(self.data)
+            return self._payloads[key]
+
+    def rendered(self):
+        return len(self._payloads)
+
+
+class FrameBroadcaster:
+    """Single-producer, multi-subscriber ring buffer of frames.
+
+    One capture/recognition loop publishes each annotated frame once and any
+    number of viewers read from the ring, rendering it on demand through
+    ``BroadcastFrame.payload``. A subscriber that falls more than
+    ``max_backlog`` frames behind jumps straight to the newest frame, so a
+    slow client skips frames instead of accumulating a backlog.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, max_backlog=MAX_BACKLOG):
+        self.buffer_size = buffer_size
+        self.max_backlog = min(max_backlog, buffer_size - 1)
+        self._ring = [None] * buffer_size
+        self._seq = -1
+        self._closed = False
+        self._condition = threading.Condition()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._demanded_at = None
+
+    def publish(self, data):
+        with self._condition:
+            self._seq += 1
+            self._ring[self._seq % self.buffer_size] = BroadcastFrame(self._seq, time.monotonic(),
+                                                                      data)
+            self._condition.notify_all()
+
+    def open(self):
+        """Accept frames again after ``close()``"""
+        with self._condition:
+            self._closed = False
+
+    def close(self):
+        """End every subscriber's stream"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def subscribe(self):
+        with self._condition:
+            subscriber = Subscriber(self, next(self._ids), self._seq)
+            self._subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def wanted(self):
+        """Whether anyone would see a published frame: a subscriber or a recent ``latest()`` call"""
+        demanded_at = self._demanded_at
+        return bool(self._subscribers) or \
+            (demanded_at is not None and time.monotonic() - demanded_at < DEMAND_WINDOW)
+
+    def latest(self, max_age=WAIT_TIMEOUT, timeout=WAIT_TIMEOUT):
+        """Newest frame, waiting up to ``timeout`` for one younger than ``max_age`` seconds.
+
+        Keeps frames being published for ``DEMAND_WINDOW`` seconds, so
+        polling clients (dashboard thumbnails) need not hold a stream open.
+        Returns the newest frame available, or None if nothing was published.
+        """
+        with self._condition:
+            self._demanded_at = time.monotonic()
+
+            def fresh():
+                frame = self._ring[self._seq % self.buffer_size] if self._seq >= 0 else None
+                return self._closed or \
+                    (frame is not None and time.monotonic() - frame.timestamp <= max_age)
+
+            self._condition.wait_for(fresh, timeout)
+            return self._ring[self._seq % self.buffer_size] if self._seq >= 0 else None
+
+    def stats(self):
+        with self._condition:
+            latest_seq = self._seq
+            subscribers = list(self._subscribers.values())
+        return {
+            'latest_seq': latest_seq,
+            'subscribers': [s.stats(latest_seq) for s in subscribers]
+        }
+
+    def _unsubscribe(self, subscriber):
+        with self._condition:
+            self._subscribers.pop(subscriber.id, None)
+
+    def _next_frame(self, last_seq, timeout, newest=False):
+        """Return the frame a subscriber that last saw ``last_seq`` should get next.
+
+        With ``newest`` that is always the latest frame. Returns None on
+        timeout and raises ``StopIteration`` once closed.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._closed or self._seq > last_seq,
+                                            timeout):
+                return None
+            if self._closed:
+                raise StopIteration
+            next_seq = last_seq + 1
+            if newest or self._seq - next_seq > self.max_backlog:
+                next_seq = self._seq
+            return self._ring[next_seq % self.buffer_size]
+
+
+class Subscriber:
+    def __init__(self, broadcaster, subscriber_id, last_seq):
+        self.broadcaster = broadcaster
+        self.id = subscriber_id
+        self.last_seq = last_seq
+        self.connected_at = time.monotonic()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.last_lag = 0.0
+        self.bytes_sent = 0
+        self.settings = None
+
+    def frames(self, render=None, key=None, min_interval=0.0):
+        """Yield frame payloads until the broadcaster closes or the consumer stops.
+
+        ``render(data)`` turns a frame into the payload to send and is shared
+        by every subscriber passing the same ``key``. With ``min_interval``
+        (seconds) frames are sent at most that often, always the newest one.
+        """
+        sent_at = None
+        try:
+            while True:
+                if min_interval and sent_at is not None:
+                    delay = sent_at + min_interval - time.monotonic()
+                    if delay > 0:
+                        time.sleep(min(delay, WAIT_TIMEOUT))
+                        continue
+                try:
+                    frame = self.broadcaster._next_frame(self.last_seq, WAIT_TIMEOUT,
+                                                         newest=bool(min_interval))
+                except StopIteration:
+                    return
+                if frame is None:
+                    continue
+                self.frames_skipped += frame.seq - self.last_seq - 1
+                self.last_seq = frame.seq
+                data = frame.data if render is None else frame.payload(key, render)
+                if data is None:
+                    continue
+                sent_at = time.monotonic()
+                self.last_lag = sent_at - frame.timestamp
+                self.frames_sent += 1
+                self.bytes_sent += len(data)
+                yield data
+        finally:
+            self.close()
+
+    def close(self):
+        self.broadcaster._unsubscribe(self)
+
+    def stats(self, latest_seq):
+        return {
+            'id': self.id,
+            'connected_seconds': round(time.monotonic() - self.connected_at, 1),
+            'frames_sent': self.frames_sent,
+            'frames_skipped': self.frames_skipped,
+            'lag_frames': max(latest_seq - self.last_seq, 0),
+            'lag_seconds': round(self.last_lag, 4),
+            'bytes_sent': self.bytes_sent,
+            'settings': self.settings
+        }
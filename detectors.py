@@ -0,0 +1,280 @@
+import collections
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from metrics import STAGE_LATENCY
+
+# Constants
+DEFAULT_DETECTOR = 'hog'
+HOG_UPSAMPLE = 1                 # face_recognition's default
+HAAR_CASCADE_FILENAME = 'haarcascade_frontalface_default.xml'
+HAAR_SCALE_FACTOR = 1.1
+HAAR_MIN_NEIGHBORS = 5
+DNN_MODEL_PATH = 'Model/face_detection_yunet_2023mar.onnx'
+DNN_SCORE_THRESHOLD = 0.8
+DNN_NMS_THRESHOLD = 0.3
+FRAME_RESIZE_FACTOR = 0.25
+MIN_RESIZE_FACTOR = 0.25
+MAX_RESIZE_FACTOR = 0.5
+TARGET_FACE_SIZE = 60            # px; face height we aim for in the detector's input
+SCALE_HISTORY = 30               # recent face sizes considered by the adaptive scaler
+SCALE_PROBE_INTERVAL = 15        # frames without faces between full-scale probes
+SCALE_STEP = 0.05
+
+_RESIZE_LATENCY = STAGE_LATENCY.labels('resize')
+_DETECT_LATENCY = STAGE_LATENCY.labels('detect')
+# face_recognition keeps one dlib detector of each kind per process, and dlib
+# detectors must not run on two threads at once (e.g. the camera and /recognize)
+_HOG_LOCK = threading.Lock()
+_CNN_LOCK = threading.Lock()
+
+
+class FaceDetector:
+    """Finds face boxes in an RGB image.
+
+    ``detect(rgb_image)`` returns ``[(top, right, bottom, left), ...]`` in
+    the image's own pixel coordinates, the same convention as
+    ``face_recognition.face_locations``.
+    """
+
+    name = None
+
+    def detect(self, rgb_image):
+        raise NotImplementedError
+
+
+class HogDetector(FaceDetector):
+    """dlib HOG detector via face_recognition; ``upsample`` finds smaller faces at a CPU cost"""
+
+    name = 'hog'
+
+    def __init__(self, upsample=HOG_UPSAMPLE):
+        self.upsample = upsample
+
+    def detect(self, rgb_image):
+        import face_recognition
+
+        with _HOG_LOCK:
+            return face_recognition.face_locations(rgb_image, self.upsample, model='hog')
+
+
+class CnnDetector(HogDetector):
+    """dlib CNN (MMOD) detector; far more accurate but slow without a GPU"""
+
+    name = 'cnn'
+
+    def detect(self, rgb_image):
+        import face_recognition
+
+        with _CNN_LOCK:
+            return face_recognition.face_locations(rgb_image, self.upsample, model='cnn')
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade; cheapest option, frontal faces only"""
+
+    name = 'haar'
+
+    def __init__(self, cascade_path=None, scale_factor=HAAR_SCALE_FACTOR,
+                 min_neighbors=HAAR_MIN_NEIGHBORS):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise RuntimeError("This OpenCV build has no CascadeClassifier")
+        if cascade_path is None:
+            cascade_path = os.path.join(cv2.data.haarcascades, HAAR_CASCADE_FILENAME)
+        if not os.path.exists(cascade_path):
+            raise FileNotFoundError(f"Haar cascade not found: {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self._classifier = cv2.CascadeClassifier(cascade_path)
+        self._lock = threading.Lock()
+
+    def detect(self, rgb_image):
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        with self._lock:
+            faces = self._classifier.detectMultiScale(gray, self.scale_factor, self.min_neighbors)
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+
+
+class DnnDetector(FaceDetector):
+    """OpenCV DNN face detector (YuNet ONNX model) on CPU"""
+
+    name = 'dnn'
+
+    def __init__(self, model_path=DNN_MODEL_PATH, score_threshold=DNN_SCORE_THRESHOLD,
+                 nms_threshold=DNN_NMS_THRESHOLD):
+        if not hasattr(cv2, 'FaceDetectorYN'):
+            raise RuntimeError("This OpenCV build has no FaceDetectorYN (needs 4.5.4+)")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"DNN face model not found: {model_path}")
+        self._detector = cv2.FaceDetectorYN.create(model_path, '', (320, 320),
+                                                   score_threshold, nms_threshold)
+        self._lock = threading.Lock()
+
+    def detect(self, rgb_image):
+        bgr = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
+        height, width = bgr.shape[:2]
+        with self._lock:
+            self._detector.setInputSize((width, height))
+            _, faces = self._detector.detect(bgr)
+        if faces is None:
+            return []
+        locations = []
+        for x, y, w, h in faces[:, :4]:
+            top, left = max(int(y), 0), max(int(x), 0)
+            bottom, right = min(int(y + h), height), min(int(x + w), width)
+            locations.append((top, right, bottom, left))
+        return locations
+
+
+DETECTORS = {
+    HogDetector.name: HogDetector,
+    CnnDetector.name: CnnDetector,
+    HaarDetector.name: HaarDetector,
+    DnnDetector.name: DnnDetector
+}
+
+
+def create_detector(name=DEFAULT_DETECTOR, **options):
+    try:
+        return DETECTORS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown detector: {name}") from None
+
+
+class RegionOfInterest:
+    """Polygon mask restricting detection to part of a camera's view.
+
+    Frames are cropped to the polygons' bounding box before detection so
+    empty background is never scanned, and faces centred outside the
+    polygons are discarded. Points are ``(x, y)`` in full-frame pixels.
+    """
+
+    def __init__(self, polygons):
+        self.polygons = [np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+                         for polygon in polygons]
+        points = np.vstack(self.polygons)
+        self.left, self.top = points.min(axis=0)
+        self.right, self.bottom = points.max(axis=0) + 1
+        self._mask = None
+
+    def crop(self, frame):
+        """Return the frame cropped to the ROI and the crop's ``(top, left)`` origin"""
+        height, width = frame.shape[:2]
+        top, left = max(int(self.top), 0), max(int(self.left), 0)
+        bottom, right = min(int(self.bottom), height), min(int(self.right), width)
+        return frame[top:bottom, left:right], (top, left)
+
+    def contains(self, box, frame_shape):
+        top, right, bottom, left = box
+        mask = self._mask_for(frame_shape[:2])
+        y = min(max((top + bottom) // 2, 0), mask.shape[0] - 1)
+        x = min(max((left + right) // 2, 0), mask.shape[1] - 1)
+        return bool(mask[y, x])
+
+    def _mask_for(self, shape):
+        if self._mask is None or self._mask.shape != shape:
+            mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(mask, self.polygons, 1)
+            self._mask = mask
+        return self._mask
+
+
+class AdaptiveScaler:
+    """Chooses the detection downscale factor from recently seen face sizes.
+
+    The factor is the smallest one that keeps the smallest recent face at
+    least ``target_face_size`` pixels tall in the detector's input. While no
+    faces are seen, every ``probe_interval``-th frame is tried at
+    ``max_factor`` so small, distant faces are still discovered.
+    """
+
+    def __init__(self, min_factor=MIN_RESIZE_FACTOR, max_factor=MAX_RESIZE_FACTOR,
+                 target_face_size=TARGET_FACE_SIZE, history=SCALE_HISTORY,
+                 probe_interval=SCALE_PROBE_INTERVAL):
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.target_face_size = target_face_size
+        self.probe_interval = probe_interval
+        self._sizes = collections.deque(maxlen=history)
+        self._empty_frames = 0
+        self._lock = threading.Lock()
+
+    def factor(self):
+        with self._lock:
+            if not self._sizes:
+                if self._empty_frames % self.probe_interval == self.probe_interval - 1:
+                    return self.max_factor
+                return self.min_factor
+            factor = self.target_face_size / max(min(self._sizes), 1)
+        factor = np.ceil(factor / SCALE_STEP) * SCALE_STEP
+        return float(min(max(factor, self.min_factor), self.max_factor))
+
+    def observe(self, face_heights):
+        """Record the full-frame heights of the faces found in the last frame"""
+        with self._lock:
+            if face_heights:
+                self._sizes.extend(face_heights)
+                self._empty_frames = 0
+            else:
+                self._empty_frames += 1
+                # Forget faces that have left the scene
+                if self._sizes and self._empty_frames >= self.probe_interval:
+                    self._sizes.clear()
+                    self._empty_frames = 0
+
+
+class Detection:
+    """Faces found in one frame.
+
+    ``rgb_image`` is the (cropped, downscaled) image the detector ran on and
+    ``locations`` are boxes in that image. ``boxes`` are the same faces in
+    full-frame coordinates, which ``encoder.FaceEncoder`` aligns and encodes
+    on the full-resolution frame.
+    """
+
+    __slots__ = ('rgb_image', 'locations', 'boxes', 'factor')
+
+    def __init__(self, rgb_image, locations, boxes, factor):
+        self.rgb_image = rgb_image
+        self.locations = locations
+        self.boxes = boxes
+        self.factor = factor
+
+
+class FaceLocator:
+    """Runs a detector on a BGR frame with optional ROI cropping and adaptive scaling"""
+
+    def __init__(self, detector=None, resize_factor=FRAME_RESIZE_FACTOR, roi=None, scaler=None):
+        self.detector = detector or HogDetector()
+        self.resize_factor = resize_factor
+        self.roi = roi
+        self.scaler = scaler
+
+    def locate(self, frame):
+        factor = self.scaler.factor() if self.scaler is not None else self.resize_factor
+        region, (origin_top, origin_left) = (frame, (0, 0)) if self.roi is None \
+            else self.roi.crop(frame)
+
+        with _RESIZE_LATENCY.time():
+            small_frame = cv2.resize(region, (0, 0), fx=factor, fy=factor)
+            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        with _DETECT_LATENCY.time():
+            found = self.detector.detect(rgb_small_frame)
+
+        locations = []
+        boxes = []
+        for location in found:
+            top, right, bottom, left = location
+            box = (int(top / factor) + origin_top, int(right / factor) + origin_left,
+                   int(bottom / factor) + origin_top, int(left / factor) + origin_left)
+            if self.roi is not None and not self.roi.contains(box, frame.shape):
+                continue
+            locations.append(location)
+            boxes.append(box)
+
+        if self.scaler is not None:
+            self.scaler.observe([bottom - top for top, _, bottom, _ in boxes])
+        return Detection(rgb_small_frame, locations, boxes, factor)
@@ -0,0 +1,151 @@
+import threading
+
+import numpy as np
+
+from metrics import log_event
+
+# Constants
+SMALL_LANDMARKS = 'small'        # dlib 5-point model, face_recognition's default
+LARGE_LANDMARKS = 'large'        # 68-point model; the eye contours also feed liveness
+DEFAULT_LANDMARK_MODEL = LARGE_LANDMARKS
+CHIP_SIZE = 150                  # input size of dlib's face encoder
+CHIP_PADDING = 0.25
+BATCH_SIZE = 32                  # face chips per encoder call
+NUM_JITTERS = 1
+MAX_DETECTION_SIZE = 1024        # px; enrollment photos are searched for faces at most this big
+
+# The models are shared by every encoder in the process and are not safe to
+# run on two threads at once, so each is guarded by its own lock
+_PREDICTOR_LOCK = threading.Lock()
+_ENCODER_LOCK = threading.Lock()
+
+
+def landmark_points(shapes):
+    """``(n, points, 2)`` array of the coordinates in dlib ``full_object_detection``s"""
+    if not shapes:
+        return np.empty((0, 0, 2), dtype=np.float32)
+    return np.array([[(p.x, p.y) for p in shape.parts()] for shape in shapes], dtype=np.float32)
+
+
+class FaceEncoder:
+    """Aligns faces once and runs dlib's 128-d encoder over batches of face chips.
+
+    Encoding is split into landmarks → aligned 150x150 chips → encoder so
+    landmarks can be reused (the 68-point ones drive the blink check) and
+    chips from many faces, frames or gallery images go through the network
+    ``batch_size`` at a time. Gallery and live encodings must use the same
+    ``landmark_model``, since the two models align faces slightly differently.
+    """
+
+    def __init__(self, landmark_model=DEFAULT_LANDMARK_MODEL, batch_size=BATCH_SIZE,
+                 num_jitters=NUM_JITTERS):
+        if landmark_model not in (SMALL_LANDMARKS, LARGE_LANDMARKS):
+            raise ValueError(f"Unknown landmark model: {landmark_model}")
+        self.landmark_model = landmark_model
+        self.batch_size = batch_size
+        self.num_jitters = num_jitters
+
+    @property
+    def predictor(self):
+        # face_recognition loads both predictors and the encoder at import;
+        # reusing them keeps one copy of each model per process
+        from face_recognition import api
+
+        if self.landmark_model == SMALL_LANDMARKS:
+            return api.pose_predictor_5_point
+        return api.pose_predictor_68_point
+
+    def load(self):
+        """Load the landmark and encoder models now rather than on the first face"""
+        return self.predictor
+
+    def shapes(self, rgb_image, boxes):
+        """dlib landmark shapes for ``(top, right, bottom, left)`` boxes in ``rgb_image``"""
+        import dlib
+
+        predictor = self.predictor
+        with _PREDICTOR_LOCK:
+            return [predictor(rgb_image,
+                              dlib.rectangle(int(left), int(top), int(right), int(bottom)))
+                    for top, right, bottom, left in boxes]
+
+    def chips(self, rgb_image, shapes):
+        """Aligned ``CHIP_SIZE`` face chips for ``shapes`` found in ``rgb_image``"""
+        import dlib
+
+        if not shapes:
+            return []
+        detections = dlib.full_object_detections()
+        for shape in shapes:
+            detections.append(shape)
+        return dlib.get_face_chips(rgb_image, detections, size=CHIP_SIZE, padding=CHIP_PADDING)
+
+    def encode_chips(self, chips):
+        """``(n, 128)`` encodings for aligned face chips, ``batch_size`` per network call"""
+        from face_recognition import api
+
+        encodings = np.empty((len(chips), 128), dtype=np.float64)
+        for start in range(0, len(chips), self.batch_size):
+            batch = list(chips[start:start + self.batch_size])
+            with _ENCODER_LOCK:
+                encodings[start:start + len(batch)] = api.face_encoder.compute_face_descriptor(
+                    batch, self.num_jitters)
+        return encodings
+
+    def encode(self, rgb_image, boxes, shapes=None):
+        """Encodings for the faces at ``boxes``; pass ``shapes`` if landmarks are already known"""
+        if shapes is None:
+            shapes = self.shapes(rgb_image, boxes)
+        return self.encode_chips(self.chips(rgb_image, shapes))
+
+    def encode_images(self, paths, detector=None):
+        """First face encoding in each image file, or None where no face is found.
+
+        Files that cannot be decoded also give None, so one bad file never
+        sinks a batch. Detection runs on a copy no larger than
+        ``MAX_DETECTION_SIZE`` and alignment on the full image; the chips of
+        every image are then encoded together in batches.
+        """
+        import cv2
+        import face_recognition
+
+        from detectors import HogDetector
+
+        detector = detector or HogDetector()
+        chips = []
+        owners = []
+        for i, path in enumerate(paths):
+            try:
+                image = face_recognition.load_image_file(path)
+            except (OSError, ValueError) as e:  # PIL.UnidentifiedImageError is an OSError
+                log_event('image_error', path=path, error=str(e))
+                continue
+            scale = min(MAX_DETECTION_SIZE / max(image.shape[:2]), 1.0)
+            small = cv2.resize(image, (0, 0), fx=scale, fy=scale) if scale < 1.0 else image
+            boxes = [tuple(int(v / scale) for v in box) for box in detector.detect(small)]
+            if not boxes:
+                continue
+            chips.extend(self.chips(image, self.shapes(image, boxes[:1])))
+            owners.append(i)
+
+        results = [None] * len(paths)
+        for i, encoding in zip(owners, self.encode_chips(chips)):
+            results[i] = encoding
+        return results
+
+
+_default_encoder = None
+_default_encoder_lock = threading.Lock()
+
+
+def default_encoder():
+    global _default_encoder
+    with _default_encoder_lock:
+        if _default_encoder is None:
+            _default_encoder = FaceEncoder()
+        return _default_encoder
+
+
+def encode_image_files(paths):
+    """``FaceEncoder.encode_images`` with the default encoder (picklable for process pools)"""
+    return default_encoder().encode_images(paths)
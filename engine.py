@@ -0,0 +1,330 @@
+"""The recognition core: detect, encode, match, check liveness and hand results to sinks.
+
+Usage:
+    python engine.py 0 --show                  # webcam, with a preview window
+    python engine.py lecture.mp4 --record      # write attendance to the store
+    python engine.py snapshots/                # every image in a folder
+
+The web app, this CLI, ``batch_process.py`` and ``supervisor.py`` all run
+frames through ``RecognitionEngine.process()``, so detection, matching and
+attendance rules live in one place. Every stage is pluggable: the
+``detectors.FaceLocator`` (detector backend, downscale, ROI), the matcher (a
+``matcher.FaceMatcher`` or a function returning the current one, such as a
+gallery's), an optional ``tracker.FaceTracker`` and
+``liveness.LivenessChecker``, and any number of sinks that receive each
+frame's results.
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+from datetime import datetime
+
+import cv2
+
+from attendance_store import DATE_FORMAT, TIME_FORMAT
+from detectors import FaceLocator
+from encoder import default_encoder
+from face_cache import SUPPORTED_IMAGE_EXTENSIONS
+from metrics import log_event
+from recognition import recognize_faces, recognize_tracked_faces
+
+# Constants
+RECTANGLE_COLOR = (0, 255, 0)  # Green
+RECTANGLE_THICKNESS = 2
+TEXT_COLOR = (255, 255, 255)  # White
+TEXT_SCALE = 0.5
+UNVERIFIED_SUFFIX = ' (blink)'  # known face still waiting for the blink check
+LIVE_TEMPLATE_MIN_DISTANCE = 0.2  # closer than this to a template adds nothing new
+LIVE_TEMPLATE_MAX_DISTANCE = 0.4  # further than this is not confident enough to enroll
+LIVE_TEMPLATE_INTERVAL = 3600    # seconds between live captures of one person
+LIVE_TEMPLATE_MARGIN = 0.5       # face crop padding, as a fraction of the box size
+
+
+class FaceResult(collections.namedtuple('FaceResult',
+                                        ('box', 'match', 'live', 'landmarks', 'encoding'))):
+    """One face found by ``RecognitionEngine.process()``.
+
+    ``box`` is ``(top, right, bottom, left)`` in full-frame coordinates,
+    ``match`` a ``matcher.Match`` and ``live`` whether the face passed the
+    liveness check (always True without one). ``landmarks`` and
+    ``encoding`` are as in ``recognition.RecognizedFace``.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.match.name
+
+    @property
+    def known(self):
+        return self.match.index is not None
+
+    @property
+    def label(self):
+        """Text drawn under the face"""
+        if self.known and not self.live:
+            return self.name + UNVERIFIED_SUFFIX
+        return self.name
+
+
+class RecognitionEngine:
+    """Runs detect → encode → match → liveness → sinks on one stream of BGR frames.
+
+    ``matcher`` is a ``FaceMatcher`` or a zero-argument function returning
+    the one to use for the next frame, so gallery updates apply without
+    rebuilding the engine. With a ``tracker``, faces that continue a
+    verified track skip the encoder; pass one per stream. Each sink is an
+    object with ``handle(frame, results, now)``, called after every frame.
+    """
+
+    def __init__(self, matcher, locator=None, encoder=None, tracker=None, liveness=None,
+                 sinks=()):
+        self.matcher = matcher if callable(matcher) else (lambda: matcher)
+        self.locator = locator or FaceLocator()
+        self.encoder = encoder or default_encoder()
+        self.tracker = tracker
+        self.liveness = liveness
+        self.sinks = list(sinks)
+
+    def process(self, frame, now=None):
+        """``FaceResult`` per face in a BGR frame; ``now`` is the frame time in seconds"""
+        now = time.monotonic() if now is None else now
+        matcher = self.matcher()
+        if self.tracker is not None:
+            recognized = recognize_tracked_faces(frame, matcher, self.tracker, now, self.locator,
+                                                 self.encoder,
+                                                 landmarks=self.liveness is not None)
+        else:
+            recognized = recognize_faces(frame, matcher, self.locator, self.encoder)
+
+        if self.liveness is not None:
+            # Reuses the recognizer's boxes and landmarks; only known faces need a blink
+            live = self.liveness.check(
+                frame, [(face.box, face.match.name if face.match.index is not None else None)
+                        for face in recognized], now, [face.landmarks for face in recognized])
+        else:
+            live = [True] * len(recognized)
+
+        results = [FaceResult(face.box, face.match, is_live, face.landmarks, face.encoding)
+                   for face, is_live in zip(recognized, live)]
+        for sink in self.sinks:
+            sink.handle(frame, results, now)
+        return results
+
+
+def annotations(results):
+    """``[(box, label), ...]`` for ``draw_faces``; cheap to compare between frames"""
+    return [(result.box, result.label) for result in results]
+
+
+def scene_summary(faces):
+    """``(labels in view, whether a known face still awaits its blink)`` for ``annotations``.
+
+    The ``summarize`` function of a ``scheduler.FrameScheduler``: a new
+    label means someone arrived, left or was identified, and faces waiting
+    for a blink need frequent frames to catch it.
+    """
+    labels = tuple(sorted(label for _, label in faces))
+    return labels, any(label.endswith(UNVERIFIED_SUFFIX) for label in labels)
+
+
+def draw_faces(frame, faces):
+    """Draw ``[(box, label), ...]`` onto a BGR frame in place"""
+    for (top, right, bottom, left), label in faces:
+        cv2.rectangle(frame, (left, top), (right, bottom), RECTANGLE_COLOR, RECTANGLE_THICKNESS)
+        cv2.rectangle(frame, (left, bottom - 35), (right, bottom), RECTANGLE_COLOR, cv2.FILLED)
+        font = cv2.FONT_HERSHEY_DUPLEX
+        cv2.putText(frame, label, (left + 6, bottom - 6), font, TEXT_SCALE, TEXT_COLOR, 1)
+
+
+class AttendanceSink:
+    """Queues a check-in on an ``attendance_writer.AttendanceWriter`` for each live, known face"""
+
+    def __init__(self, writer, camera_id=None):
+        self.writer = writer
+        self.camera_id = camera_id
+
+    def handle(self, frame, results, now):
+        for result in results:
+            if result.known and result.live:
+                self.writer.submit(result.name, camera_id=self.camera_id)
+
+
+class AttendanceLog:
+    """Keeps the first sighting of each live, known person per day in memory"""
+
+    def __init__(self):
+        self.records = []
+        self._seen = set()
+
+    def handle(self, frame, results, now):
+        for result in results:
+            if not (result.known and result.live):
+                continue
+            when = datetime.now()
+            key = (result.name, when.strftime(DATE_FORMAT))
+            if key not in self._seen:
+                self._seen.add(key)
+                self.records.append({'name': result.name,
+                                     'time': when.strftime(f'{DATE_FORMAT} {TIME_FORMAT}')})
+
+
+class LiveTemplateSink:
+    """Enrolls confident live matches as extra templates in a ``gallery.FaceGallery``.
+
+    Only faces that passed the liveness check and were encoded in this
+    frame qualify; near-duplicates of an existing template are skipped, and
+    each person is captured at most once per ``interval`` seconds.
+    """
+
+    def __init__(self, gallery, min_distance=LIVE_TEMPLATE_MIN_DISTANCE,
+                 max_distance=LIVE_TEMPLATE_MAX_DISTANCE, interval=LIVE_TEMPLATE_INTERVAL,
+                 margin=LIVE_TEMPLATE_MARGIN):
+        self.gallery = gallery
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.interval = interval
+        self.margin = margin
+        self._last_capture = {}
+
+    def handle(self, frame, results, now):
+        for result in results:
+            if result.known and result.live and result.encoding is not None:
+                self.capture(frame, result, now)
+
+    def capture(self, frame, result, now):
+        match = result.match
+        if match.distance is None or \
+                not self.min_distance <= match.distance <= self.max_distance:
+            return None
+        if now - self._last_capture.get(match.name, now - self.interval) < self.interval:
+            return None
+        self._last_capture[match.name] = now
+        top, right, bottom, left = result.box
+        margin_y = int((bottom - top) * self.margin)
+        margin_x = int((right - left) * self.margin)
+        crop = frame[max(top - margin_y, 0):bottom + margin_y,
+                     max(left - margin_x, 0):right + margin_x].copy()
+        filename = self.gallery.add_live_template(match.name, crop, result.encoding)
+        if filename is not None:
+            log_event('live_template_added', name=match.name, filename=filename,
+                      distance=round(float(match.distance), 4))
+        return filename
+
+
+def iter_frames(source, stride=1):
+    """Yield ``(frame time in seconds, BGR frame, label)`` from a camera, video, image or folder"""
+    if os.path.isdir(source) or source.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+        paths = [source] if os.path.isfile(source) else sorted(
+            os.path.join(source, f) for f in os.listdir(source)
+            if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS))
+        for path in paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"Could not read image: {path}")
+                continue
+            yield time.monotonic(), frame, os.path.basename(path)
+        return
+
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not capture.isOpened():
+        raise SystemExit(f"Could not open video source {source}")
+    is_camera = source.isdigit()
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            if index % stride:
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield time.monotonic() if is_camera else index / fps, frame, f'frame {index}'
+            index += 1
+    finally:
+        capture.release()
+
+
+def main(argv=None):
+    from attendance_store import DEFAULT_STORE_PATH, JSONL_BACKEND, SQLITE_BACKEND, open_attendance_store
+    from detectors import DEFAULT_DETECTOR, DETECTORS, FRAME_RESIZE_FACTOR, create_detector
+    from face_cache import CACHE_DIRECTORY, FaceEncodingCache
+    from gallery import FACES_DIRECTORY, FaceGallery
+    from tracker import FaceTracker
+
+    parser = argparse.ArgumentParser(description='Recognize faces from a camera, video or images')
+    parser.add_argument('source', nargs='?', default='0',
+                        help='camera number, video file, stream URL, image or image folder')
+    parser.add_argument('--stride', type=int, default=1, help='recognize every Nth video frame')
+    parser.add_argument('--resize', type=float, default=FRAME_RESIZE_FACTOR,
+                        help='downscale factor applied before detection')
+    parser.add_argument('--detector', choices=sorted(DETECTORS), default=DEFAULT_DETECTOR)
+    parser.add_argument('--liveness', action='store_true', help='require a blink before check-in')
+    parser.add_argument('--show', action='store_true', help='show annotated frames (q quits)')
+    parser.add_argument('--record', action='store_true', help='write attendance to the store')
+    parser.add_argument('--backend', choices=(SQLITE_BACKEND, JSONL_BACKEND), default=SQLITE_BACKEND)
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--faces', default=FACES_DIRECTORY)
+    parser.add_argument('--cache', default=CACHE_DIRECTORY)
+    args = parser.parse_args(argv)
+
+    gallery = FaceGallery(args.faces, FaceEncodingCache(args.faces, args.cache))
+    print(f"Loaded {len(gallery.load())} known faces")
+    liveness = None
+    if args.liveness:
+        from liveness import LivenessChecker
+
+        liveness = LivenessChecker()
+    log = AttendanceLog()
+    sinks = [log]
+    writer = None
+    if args.record:
+        from attendance_writer import AttendanceWriter
+
+        writer = AttendanceWriter(open_attendance_store(args.backend, args.store))
+        sinks.append(AttendanceSink(writer))
+    engine = RecognitionEngine(lambda: gallery.snapshot().matcher,
+                               FaceLocator(create_detector(args.detector), args.resize),
+                               tracker=FaceTracker(), liveness=liveness, sinks=sinks)
+
+    start = time.perf_counter()
+    frames = 0
+    previous = None
+    try:
+        for now, frame, label in iter_frames(args.source, max(args.stride, 1)):
+            results = engine.process(frame, now)
+            frames += 1
+            faces = annotations(results)
+            labels = [text for _, text in faces]
+            if labels != previous:
+                print(f"{label}: {', '.join(labels) or 'no faces'}")
+                previous = labels
+            if args.show:
+                draw_faces(frame, faces)
+                cv2.imshow('Face Recognition', frame)
+                if cv2.waitKey(1) == ord('q'):
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.show:
+            cv2.destroyAllWindows()
+        if writer is not None:
+            writer.stop()
+    elapsed = time.perf_counter() - start
+
+    for record in log.records:
+        print(f"{record['time']}  {record['name']}")
+    print(f"Processed {frames} frames in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed else 0:.1f} frames/sec)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
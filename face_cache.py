@@ -0,0 +1,291 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from metrics import log_event
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to an unlocked rebuild
+    fcntl = None
+
+# Constants
+FACES_DIRECTORY = 'faces'
+CACHE_DIRECTORY = 'cache'
+ENCODINGS_FILENAME = 'encodings.npy'
+INDEX_FILENAME = 'index.json'
+LOCK_FILENAME = '.lock'
+CACHE_VERSION = 1
+ENCODING_SIZE = 128
+ENCODING_DTYPE = np.float32     # the matcher's own, so it can use the mapped matrix in place
+SUPPORTED_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+HASH_CHUNK_SIZE = 1 << 20
+TEMPLATE_SEPARATOR = '__'   # Dave.jpg, Dave__2.jpg, Dave__live-20250418T0915.jpg are all "Dave"
+
+
+def identity_name(filename):
+    """Person an enrolled image belongs to: the file name up to ``TEMPLATE_SEPARATOR``"""
+    return os.path.splitext(filename)[0].split(TEMPLATE_SEPARATOR, 1)[0]
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def encode_image_file(path):
+    """Return the first face encoding found in an image file, or None"""
+    from encoder import encode_image_files
+
+    return encode_image_files([path])[0]
+
+
+def empty_encodings():
+    return np.empty((0, ENCODING_SIZE), dtype=ENCODING_DTYPE)
+
+
+def prepare_shared_cache(faces_directory=FACES_DIRECTORY, cache_directory=CACHE_DIRECTORY):
+    """Sync the cache before starting worker processes; returns the number of known faces"""
+    # Bring the cache up to date once so workers only have to map it
+    entries, _ = FaceEncodingCache(faces_directory, cache_directory).load()
+    print(f"Loaded {len(entries)} known faces")
+    return len(entries)
+
+
+class FaceEncodingCache:
+    """Persistent store of gallery encodings keyed by image content hash.
+
+    Encodings live in a single ``.npy`` matrix with a JSON index describing
+    which image each row came from. Entries are revalidated by size and
+    mtime first and by SHA-1 only when those differ, so a warm start never
+    decodes an image. The matrix is stored as float32 with each person's
+    rows together, in the order ``matcher.FaceMatcher`` groups them, and is
+    opened memory-mapped and read-only: matchers built on it use the mapped
+    pages in place, so every gunicorn worker shares them. New images are
+    encoded together in batches by ``encoder`` (an ``encoder.FaceEncoder``);
+    a cache built with a different landmark model is re-encoded from scratch.
+    """
+
+    def __init__(self, faces_directory=FACES_DIRECTORY, cache_directory=CACHE_DIRECTORY, encoder=None):
+        self.faces_directory = faces_directory
+        self.cache_directory = cache_directory
+        self._encoder = encoder
+        self.encodings_path = os.path.join(cache_directory, ENCODINGS_FILENAME)
+        self.index_path = os.path.join(cache_directory, INDEX_FILENAME)
+        self.lock_path = os.path.join(cache_directory, LOCK_FILENAME)
+
+    def load(self):
+        """Bring the cache up to date with the faces directory.
+
+        Returns ``(entries, encodings)`` where ``encodings`` is a read-only
+        ``(n, 128)`` array and ``entries[i]`` describes the image row ``i``
+        came from.
+        """
+        with self._locked():
+            entries, encodings = self._read()
+            entries, rows, changed = self._refresh(entries, encodings)
+            # Caches written as float64 are converted once
+            if changed or (encodings is not None and encodings.dtype != ENCODING_DTYPE):
+                self._write(entries, rows)
+        return self.open()
+
+    def open(self):
+        """Map the cache as last written, without scanning the faces directory"""
+        with self._locked(shared=True):
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                return [], empty_encodings()
+            entries = [e for e in index['entries'] if e['row'] is not None]
+            entries.sort(key=lambda e: e['row'])
+
+            if not entries:
+                return entries, empty_encodings()
+            return entries, np.load(self.encodings_path, mmap_mode='r')
+
+    def put(self, items):
+        """Record precomputed encodings for images already in the faces directory.
+
+        ``items`` is an iterable of ``(filename, encoding)``; an encoding of
+        ``None`` marks an image without a detectable face.
+        """
+        with self._locked():
+            cached_entries, cached_encodings = self._read()
+            entries = {}
+            for filename, entry in cached_entries.items():
+                entries[filename] = (entry, self._cached_row(entry, cached_encodings))
+            for filename, encoding in items:
+                entry = self._describe(filename)
+                entries[filename] = (entry, encoding)
+            self._write(*self._flatten(entries))
+
+    def discard(self, filenames):
+        """Forget the encodings for the given image filenames; returns how many had one"""
+        filenames = set(filenames)
+        with self._locked():
+            cached_entries, cached_encodings = self._read()
+            entries = {}
+            for filename, entry in cached_entries.items():
+                if filename not in filenames:
+                    entries[filename] = (entry, self._cached_row(entry, cached_encodings))
+            if len(entries) < len(cached_entries):
+                self._write(*self._flatten(entries))
+        return sum(cached_entries[f].get('row') is not None
+                   for f in filenames if f in cached_entries)
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            from encoder import default_encoder
+
+            self._encoder = default_encoder()
+        return self._encoder
+
+    @property
+    def landmark_model(self):
+        from encoder import DEFAULT_LANDMARK_MODEL
+
+        return self._encoder.landmark_model if self._encoder is not None \
+            else DEFAULT_LANDMARK_MODEL
+
+    def index_mtime_ns(self):
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return None
+
+    @contextlib.contextmanager
+    def _locked(self, shared=False):
+        for directory in (self.faces_directory, self.cache_directory):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        """Return the cached ``{filename: entry}`` map and encoding matrix"""
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            # Caches from before the landmark setting existed used the 5-point model
+            if index.get('version') != CACHE_VERSION or \
+               index.get('landmarks', 'small') != self.landmark_model:
+                return {}, None
+            encodings = np.load(self.encodings_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return {}, None
+
+        entries = {}
+        for entry in index['entries']:
+            row = entry.get('row')
+            if row is not None and row >= len(encodings):
+                return {}, None
+            entries[entry['filename']] = entry
+        return entries, encodings
+
+    def _describe(self, filename):
+        image_path = os.path.join(self.faces_directory, filename)
+        stat = os.stat(image_path)
+        return {
+            'filename': filename,
+            'name': identity_name(filename),
+            'sha1': file_sha1(image_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'row': None
+        }
+
+    @staticmethod
+    def _cached_row(entry, encodings):
+        if entry['row'] is None:
+            return None
+        return encodings[entry['row']]
+
+    def _refresh(self, cached_entries, cached_encodings):
+        entries = {}
+        to_encode = []
+        changed = False
+
+        filenames = [f for f in os.listdir(self.faces_directory)
+                     if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS)]
+        for filename in filenames:
+            image_path = os.path.join(self.faces_directory, filename)
+            stat = os.stat(image_path)
+            cached = cached_entries.get(filename)
+
+            if cached is not None and cached['size'] == stat.st_size and \
+               cached['mtime_ns'] == stat.st_mtime_ns:
+                entries[filename] = (cached, self._cached_row(cached, cached_encodings))
+                continue
+
+            changed = True
+            entry = self._describe(filename)
+            if cached is not None and cached['sha1'] == entry['sha1']:
+                entries[filename] = (entry, self._cached_row(cached, cached_encodings))
+            else:
+                log_event('face_encoding', filename=filename)
+                to_encode.append((filename, entry))
+
+        if to_encode:
+            # New images share encoder batches instead of one network call each
+            encodings = self.encoder.encode_images(
+                [os.path.join(self.faces_directory, f) for f, _ in to_encode])
+            for (filename, entry), encoding in zip(to_encode, encodings):
+                if encoding is None:
+                    log_event('no_face_detected', filename=filename)
+                entries[filename] = (entry, encoding)
+
+        if set(cached_entries) != set(filenames):
+            changed = True
+
+        entries, rows = self._flatten(entries)
+        if any(cached_entries.get(e['filename'], {}).get('row') != e['row'] for e in entries):
+            changed = True  # rows moved, e.g. in a cache written in filename order
+        return entries, rows, changed
+
+    @staticmethod
+    def _flatten(entries):
+        """Assign matrix rows to ``{filename: (entry, encoding)}``, grouped by person"""
+        flat_entries = []
+        rows = []
+        for filename in sorted(entries, key=lambda f: (identity_name(f), f)):
+            entry, encoding = entries[filename]
+            entry = dict(entry, row=None)
+            if encoding is not None:
+                entry['row'] = len(rows)
+                rows.append(np.asarray(encoding, dtype=ENCODING_DTYPE))
+            flat_entries.append(entry)
+        return flat_entries, rows
+
+    def _write(self, entries, rows):
+        if rows:
+            encodings = np.vstack(rows)
+        else:
+            encodings = empty_encodings()
+
+        # Write both files under temporary names and rename them into place
+        # so readers never observe a half-written matrix.
+        fd, tmp_encodings = tempfile.mkstemp(dir=self.cache_directory, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, encodings)
+        fd, tmp_index = tempfile.mkstemp(dir=self.cache_directory, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'landmarks': self.landmark_model,
+                       'entries': entries}, f)
+        os.replace(tmp_encodings, self.encodings_path)
+        os.replace(tmp_index, self.index_path)
@@ -0,0 +1,366 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from encoder import BATCH_SIZE, encode_image_files
+from face_cache import (ENCODING_DTYPE, FACES_DIRECTORY, FaceEncodingCache,
+                        SUPPORTED_IMAGE_EXTENSIONS, TEMPLATE_SEPARATOR, empty_encodings,
+                        identity_name)
+from matcher import MIN_REDUCTION, FaceMatcher
+from metrics import log_event
+
+# Constants
+STALE_CHECK_INTERVAL = 1.0  # seconds between checks for enrollments by other workers
+MAX_TEMPLATES_PER_IDENTITY = 5  # encodings matched per person; bounds matcher memory
+LIVE_TEMPLATE_TAG = 'live-'     # Dave__live-20250418T091500.jpg is a capture from the camera
+
+
+def is_live_template(filename):
+    return TEMPLATE_SEPARATOR + LIVE_TEMPLATE_TAG in filename
+
+
+def select_templates(filenames, names, max_templates):
+    """Rows to match against: at most ``max_templates`` per identity.
+
+    Enrollment photos come first, in filename order, then live captures
+    newest first.
+    """
+    rows_by_name = {}
+    for i, name in enumerate(names):
+        rows_by_name.setdefault(name, []).append(i)
+    keep = []
+    for rows in rows_by_name.values():
+        if len(rows) <= max_templates:
+            keep.extend(rows)
+            continue
+        enrolled = sorted((i for i in rows if not is_live_template(filenames[i])),
+                          key=lambda i: filenames[i])
+        live = sorted((i for i in rows if is_live_template(filenames[i])),
+                      key=lambda i: filenames[i], reverse=True)
+        keep.extend((enrolled + live)[:max_templates])
+    return sorted(keep)
+
+
+class GallerySnapshot:
+    """Immutable view of the enrolled faces.
+
+    Recognition code grabs one snapshot per frame, so an enrollment that
+    swaps in a new snapshot never exposes half-updated lists.
+    """
+
+    def __init__(self, filenames, names, encodings, previous_matcher=None,
+                 reduction=MIN_REDUCTION, max_templates=MAX_TEMPLATES_PER_IDENTITY):
+        self.filenames = tuple(filenames)
+        self.names = tuple(names)
+        self.encodings = encodings
+        self.reduction = reduction
+        self.max_templates = max_templates
+        self._previous_matcher = previous_matcher
+        self._matcher = None
+        self._enrolled = None
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def enrolled(self):
+        """Set of the enrolled filenames, built once per snapshot for listings"""
+        if self._enrolled is None:
+            self._enrolled = frozenset(self.filenames)
+        return self._enrolled
+
+    def templates(self, name):
+        """Filenames enrolled for ``name``"""
+        return [f for f, n in zip(self.filenames, self.names) if n == name]
+
+    @property
+    def matcher(self):
+        """``FaceMatcher`` over this snapshot, built on first use"""
+        if self._matcher is None:
+            rows = select_templates(self.filenames, self.names, self.max_templates)
+            names, encodings = self.names, self.encodings
+            if len(rows) < len(names):
+                names = [names[i] for i in rows]
+                encodings = np.asarray(encodings)[rows]
+            self._matcher = FaceMatcher(names, encodings, previous=self._previous_matcher,
+                                        reduction=self.reduction)
+            self._previous_matcher = None
+        return self._matcher
+
+
+class FaceGallery:
+    """Enrolled faces with incremental add/update/remove backed by the encoding cache.
+
+    A person may have several images (templates): ``Dave.jpg``, ``Dave__2.jpg``
+    and live captures such as ``Dave__live-20250418T091500.jpg``. The matcher
+    reduces each person's templates with ``reduction`` and uses at most
+    ``max_templates`` of them. With ``thumbnails`` (a
+    ``thumbnails.ThumbnailCache``), added photos get their thumbnails built
+    in the background and removed ones lose them.
+    """
+
+    def __init__(self, faces_directory=FACES_DIRECTORY, cache=None, reduction=MIN_REDUCTION,
+                 max_templates=MAX_TEMPLATES_PER_IDENTITY, thumbnails=None):
+        self.faces_directory = faces_directory
+        self.cache = cache or FaceEncodingCache(faces_directory)
+        self.reduction = reduction
+        self.max_templates = max_templates
+        self.thumbnails = thumbnails
+        self._lock = threading.Lock()
+        self._snapshot = self._new_snapshot((), (), empty_encodings())
+        self._cache_mtime_ns = None
+        self._last_stale_check = 0.0
+        self._photos = (None, ())
+
+    def load(self):
+        """Sync the cache with the faces directory and publish the result"""
+        with self._lock:
+            self._publish(*self.cache.load())
+        return self._snapshot
+
+    def open(self):
+        """Publish the cache as last written, without scanning the faces directory"""
+        with self._lock:
+            self._publish(*self.cache.open())
+        return self._snapshot
+
+    def snapshot(self):
+        """Return the current snapshot, picking up enrollments made by other processes"""
+        now = time.monotonic()
+        if now - self._last_stale_check > STALE_CHECK_INTERVAL:
+            self._last_stale_check = now
+            if self.cache.index_mtime_ns() != self._cache_mtime_ns:
+                with self._lock:
+                    self._publish(*self.cache.open())
+        return self._snapshot
+
+    def photos(self):
+        """Sorted image files in the faces directory, with or without an enrolled face.
+
+        Read from disk so photos without a detectable face are listed too and
+        the list does not wait for the gallery to load; the directory is only
+        rescanned when its mtime changes.
+        """
+        try:
+            mtime_ns = os.stat(self.faces_directory).st_mtime_ns
+        except OSError:
+            return ()
+        cached_mtime_ns, photos = self._photos
+        if mtime_ns != cached_mtime_ns:
+            photos = tuple(sorted(f for f in os.listdir(self.faces_directory)
+                                  if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS)))
+            self._photos = (mtime_ns, photos)
+        return photos
+
+    def add(self, filename, encoding):
+        """Add or replace the face stored as ``filename`` using a precomputed encoding"""
+        self.add_many([(filename, encoding)])
+
+    def add_many(self, items):
+        items = [(filename, np.asarray(encoding, dtype=ENCODING_DTYPE))
+                 for filename, encoding in items if encoding is not None]
+        if not items:
+            return
+        with self._lock:
+            self.cache.put(items)
+            # Republish from disk: other workers may have enrolled since our last snapshot
+            self._publish(*self.cache.open())
+        if self.thumbnails is not None:
+            self.thumbnails.submit(filename for filename, _ in items)
+
+    def remove(self, filename):
+        """Drop the face stored as ``filename``; returns False if it was not enrolled"""
+        return self.remove_many([filename]) > 0
+
+    def remove_many(self, filenames):
+        """Drop several enrolled faces in one cache write; returns how many were enrolled"""
+        filenames = set(filenames)
+        with self._lock:
+            removed = self.cache.discard(filenames)
+            if removed:
+                self._publish(*self.cache.open())
+        if removed and self.thumbnails is not None:
+            self.thumbnails.discard(filenames)
+        return removed
+
+    def next_template_filename(self, name, extension='.jpg'):
+        """Free filename for another photo of ``name``, or None once it has ``max_templates``"""
+        return self._free_template_filename(name, extension, self._taken_filenames(name))
+
+    def _taken_filenames(self, name=None):
+        """Enrolled and on-disk filenames, of ``name`` only or of everyone"""
+        filenames = self._snapshot.templates(name) if name is not None else self._snapshot.filenames
+        taken = set(filenames)
+        if os.path.isdir(self.faces_directory):
+            taken.update(f for f in os.listdir(self.faces_directory)
+                         if name is None or identity_name(f) == name)
+        return taken
+
+    def _free_template_filename(self, name, extension, taken):
+        # Dave.png takes the slot of Dave.jpg: names differing only in extension
+        # would share a thumbnail and look like one photo
+        stems = {os.path.splitext(f)[0] for f in taken if identity_name(f) == name}
+        if len([s for s in stems if not is_live_template(s)]) >= self.max_templates:
+            return None
+        candidates = [name] + \
+            [f'{name}{TEMPLATE_SEPARATOR}{i}' for i in range(2, self.max_templates + 1)]
+        return next((stem + extension for stem in candidates if stem not in stems), None)
+
+    def add_live_template(self, name, image, encoding):
+        """Enroll a BGR face crop seen by the camera as another template of ``name``.
+
+        Live captures never displace enrollment photos; once the person has
+        ``max_templates`` templates the oldest live capture is dropped.
+        Returns the new filename, or None if enrollment photos fill the cap.
+        """
+        import cv2
+
+        templates = self._snapshot.templates(name)
+        enrolled = [f for f in templates if not is_live_template(f)]
+        room = self.max_templates - len(enrolled)
+        if room <= 0:
+            return None
+        filename = (f'{name}{TEMPLATE_SEPARATOR}{LIVE_TEMPLATE_TAG}'
+                    f'{datetime.now().strftime("%Y%m%dT%H%M%S")}.jpg')
+        if not cv2.imwrite(os.path.join(self.faces_directory, filename), image):
+            return None
+        self.add(filename, encoding)
+
+        stale = sorted((f for f in templates if is_live_template(f)), reverse=True)[room - 1:]
+        for f in stale:
+            path = os.path.join(self.faces_directory, f)
+            if os.path.exists(path):
+                os.remove(path)
+        self.remove_many(stale)
+        return filename
+
+    def enroll_directory(self, directory, workers=None):
+        """Copy every image in ``directory`` into the gallery, encoding in parallel.
+
+        Returns ``(enrolled, rejected)`` lists of filenames.
+        """
+        filenames = sorted(f for f in os.listdir(directory)
+                           if f.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS))
+        return self._enroll_files([(os.path.join(directory, f), f) for f in filenames], workers)
+
+    def enroll_zip(self, zip_path, workers=None):
+        """Enroll every image in a zip archive; ``a/john.jpg`` and ``b/john.jpg`` are both John.
+
+        Returns ``(enrolled, rejected)``, with rejected images named by their archive path.
+        """
+        with tempfile.TemporaryDirectory() as extract_directory:
+            sources = []
+            with zipfile.ZipFile(zip_path) as archive:
+                for member in archive.infolist():
+                    filename = os.path.basename(member.filename)
+                    if member.is_dir() or filename.startswith('.') or \
+                       not filename.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+                        continue
+                    # Extracted under a numbered name so same-named members never collide
+                    path = os.path.join(extract_directory,
+                                        f'{len(sources)}{os.path.splitext(filename)[1]}')
+                    with archive.open(member) as src, open(path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    sources.append((path, member.filename))
+            return self._enroll_files(sources, workers)
+
+    def _enroll_files(self, sources, workers=None):
+        """Encode ``(path, label)`` images in parallel and enroll those with a face.
+
+        The label's file name gives the person; each photo is stored under
+        the next free template name, so enrolled photos are never
+        overwritten, and photos beyond ``max_templates`` are rejected as
+        ``/register`` does.
+        """
+        if not os.path.exists(self.faces_directory):
+            os.makedirs(self.faces_directory)
+
+        paths = [path for path, _ in sources]
+        # Each worker detects and aligns a chunk of images, then encodes its chips in one batch
+        chunk_size = max(min(BATCH_SIZE, -(-len(paths) // (workers or os.cpu_count() or 1))), 1)
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            encodings = [encoding for chunk in executor.map(encode_image_files, chunks)
+                         for encoding in chunk]
+
+        taken = self._taken_filenames()
+        enrolled = []
+        rejected = []
+        items = []
+        for (path, label), encoding in zip(sources, encodings):
+            if encoding is None:
+                log_event('no_face_detected', filename=label)
+                rejected.append(label)
+                continue
+            basename = os.path.basename(label)
+            name = identity_name(basename)
+            filename = self._free_template_filename(name, os.path.splitext(basename)[1].lower(),
+                                                    taken)
+            if filename is None:
+                log_event('template_limit_reached', name=name, max_templates=self.max_templates,
+                          filename=label)
+                rejected.append(label)
+                continue
+            shutil.copy2(path, os.path.join(self.faces_directory, filename))
+            taken.add(filename)
+            enrolled.append(filename)
+            items.append((filename, encoding))
+
+        self.add_many(items)
+        return enrolled, rejected
+
+    def _new_snapshot(self, filenames, names, encodings, previous_matcher=None):
+        return GallerySnapshot(filenames, names, encodings, previous_matcher,
+                               self.reduction, self.max_templates)
+
+    def _publish(self, entries, encodings):
+        # Names are derived again so caches written before templates existed stay valid
+        self._snapshot = self._new_snapshot([e['filename'] for e in entries],
+                                            [identity_name(e['filename']) for e in entries],
+                                            encodings, self._snapshot._matcher)
+        self._cache_mtime_ns = self.cache.index_mtime_ns()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the enrolled face gallery')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    enroll_parser = subparsers.add_parser('enroll', help='enroll a directory or zip of images')
+    enroll_parser.add_argument('path')
+    enroll_parser.add_argument('--workers', type=int, default=None)
+    remove_parser = subparsers.add_parser('remove', help='remove an enrolled image')
+    remove_parser.add_argument('filename')
+    args = parser.parse_args()
+
+    from thumbnails import ThumbnailCache
+
+    gallery = FaceGallery(thumbnails=ThumbnailCache(FACES_DIRECTORY))
+    gallery.load()
+    if args.command == 'enroll':
+        start = time.perf_counter()
+        if zipfile.is_zipfile(args.path):
+            enrolled, rejected = gallery.enroll_zip(args.path, args.workers)
+        else:
+            enrolled, rejected = gallery.enroll_directory(args.path, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"Enrolled {len(enrolled)} faces ({len(rejected)} rejected) in {elapsed:.1f}s")
+        gallery.thumbnails.stop(timeout=None)
+    elif args.command == 'remove':
+        image_path = os.path.join(gallery.faces_directory, args.filename)
+        if os.path.exists(image_path):
+            os.remove(image_path)
+        if gallery.remove(args.filename):
+            print(f"Removed {args.filename}")
+        else:
+            print(f"{args.filename} is not enrolled")
+
+
+if __name__ == '__main__':
+    main()
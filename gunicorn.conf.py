@@ -0,0 +1,29 @@
+"""gunicorn settings, picked up automatically by ``gunicorn app:app``.
+
+The app is imported once in the master (``preload_app``), which loads dlib's
+models and the face gallery before any worker is forked. Workers then share
+those pages copy-on-write instead of each loading its own copy, and serve
+requests as soon as they start.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))  # /video_feed viewers hold a thread each
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported, before forking
+    if not preload_app:
+        return
+    import app
+
+    if not app.recognition_warmup.run():
+        server.log.warning(f"Warm-up failed: {app.recognition_warmup.error}")
+    # Connections must not cross fork(); each worker reopens its own
+    app.attendance_store.close()
+    app.attendance_seen.close()
+    # Keep the collector from touching (and so copying) the preloaded objects
+    gc.freeze()
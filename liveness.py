@@ -0,0 +1,179 @@
+import bz2
+import collections
+import os
+import shutil
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Constants
+LANDMARK_MODEL_PATH = 'Model/shape_predictor_68_face_landmarks.dat'
+EYE_SLICE = slice(36, 48)        # both eyes in the 68-point layout, six points each
+BLINK_RATIO = 0.7                # eyes are closed below this fraction of the open-eye EAR
+BASELINE_SAMPLES = 30            # recent EARs per identity used as its open-eye baseline
+MIN_BASELINE_SAMPLES = 5
+MIN_CLOSED_FRAMES = 1            # recognition frames per blink; they arrive every ~100 ms
+LIVENESS_WINDOW = 10.0           # seconds a blink keeps an identity verified
+STATE_TTL = 30.0                 # seconds before an unseen identity's state is dropped
+LATENCY_SAMPLES = 200
+
+
+def load_landmark_predictor(model_path=LANDMARK_MODEL_PATH):
+    """Load dlib's 68-point shape predictor, unpacking the bundled ``.bz2`` on first use.
+
+    Falls back to the identical model shipped with ``face_recognition_models``.
+    """
+    import dlib
+
+    if not os.path.exists(model_path) and os.path.exists(model_path + '.bz2'):
+        tmp_path = model_path + '.tmp'
+        try:
+            with bz2.open(model_path + '.bz2', 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, model_path)
+        except (OSError, EOFError) as e:
+            print(f"Could not unpack {model_path}.bz2: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    if not os.path.exists(model_path):
+        import face_recognition_models
+
+        model_path = face_recognition_models.pose_predictor_model_location()
+    return dlib.shape_predictor(model_path)
+
+
+def eye_aspect_ratios(landmarks):
+    """Mean eye aspect ratio of both eyes for an ``(n, 68, 2)`` landmark array"""
+    eyes = np.asarray(landmarks, dtype=np.float32)[:, EYE_SLICE].reshape(-1, 2, 6, 2)
+    vertical = (np.linalg.norm(eyes[:, :, 1] - eyes[:, :, 5], axis=-1) +
+                np.linalg.norm(eyes[:, :, 2] - eyes[:, :, 4], axis=-1))
+    horizontal = 2.0 * np.linalg.norm(eyes[:, :, 0] - eyes[:, :, 3], axis=-1)
+    return (vertical / np.maximum(horizontal, 1e-6)).mean(axis=1)
+
+
+class BlinkState:
+    __slots__ = ('ratios', 'closed_frames', 'blinks', 'last_blink', 'last_seen')
+
+    def __init__(self):
+        self.ratios = collections.deque(maxlen=BASELINE_SAMPLES)
+        self.closed_frames = 0
+        self.blinks = 0
+        self.last_blink = None
+        self.last_seen = None
+
+
+class LivenessChecker:
+    """Blink-based liveness for faces the recognizer has already located.
+
+    Landmarks come from the encoder or are predicted inside the recognizer's
+    boxes on the full frame, so there is no second detection pass, and the eye
+    aspect ratio of every face is computed in one NumPy expression. Each
+    identity keeps its own rolling blink state: eyes count as closed when
+    the EAR drops below ``blink_ratio`` of that person's median recent EAR,
+    a blink is a run of at least ``min_closed_frames`` closed-eye frames
+    followed by an open one, and an identity is live for ``window`` seconds
+    after its last blink.
+    """
+
+    def __init__(self, predictor=None, blink_ratio=BLINK_RATIO,
+                 min_closed_frames=MIN_CLOSED_FRAMES, window=LIVENESS_WINDOW, state_ttl=STATE_TTL):
+        self._predictor = predictor
+        self.blink_ratio = blink_ratio
+        self.min_closed_frames = min_closed_frames
+        self.window = window
+        self.state_ttl = state_ttl
+        self._states = {}
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    @property
+    def predictor(self):
+        if self._predictor is None:
+            self._predictor = load_landmark_predictor()
+        return self._predictor
+
+    def landmarks(self, gray_frame, boxes, predictor=None):
+        """``(n, 68, 2)`` landmark coordinates for ``(top, right, bottom, left)`` boxes"""
+        import dlib
+
+        predictor = predictor or self.predictor
+        points = np.empty((len(boxes), 68, 2), dtype=np.float32)
+        for i, (top, right, bottom, left) in enumerate(boxes):
+            shape = predictor(gray_frame, dlib.rectangle(int(left), int(top),
+                                                         int(right), int(bottom)))
+            points[i] = [(p.x, p.y) for p in shape.parts()]
+        return points
+
+    def check(self, frame, faces, now=None, landmarks=None):
+        """Update blink state for ``[(box, key), ...]`` in a BGR frame.
+
+        ``key`` identifies the person (the matched name); faces with key
+        ``None`` are skipped. ``landmarks`` optionally gives each face's
+        68-point landmarks already computed by the encoder, so the
+        predictor does not run twice. Returns whether each face is
+        currently live.
+        """
+        now = time.monotonic() if now is None else now
+        checked = [i for i, (_, key) in enumerate(faces) if key is not None]
+        live = [False] * len(faces)
+        shared = landmarks is not None and all(
+            landmarks[i] is not None and len(landmarks[i]) == 68 for i in checked)
+        predictor = None if shared else self.predictor  # load the model outside the timing
+        start = time.perf_counter()
+        if checked:
+            if shared:
+                points = np.stack([landmarks[i] for i in checked])
+            else:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                points = self.landmarks(gray, [faces[i][0] for i in checked], predictor)
+            ratios = eye_aspect_ratios(points)
+            with self._lock:
+                for i, ratio in zip(checked, ratios):
+                    live[i] = self._update(faces[i][1], float(ratio), now)
+                self._expire(now)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return live
+
+    def is_live(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get(key)
+            return state is not None and self._recent_blink(state, now)
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            return {
+                'identities': len(self._states),
+                'blinks': sum(state.blinks for state in self._states.values()),
+                'mean_latency_ms': round(float(latencies.mean()) * 1000, 2) if len(latencies) else None,
+                'p95_latency_ms': round(float(np.percentile(latencies, 95)) * 1000, 2)
+                if len(latencies) else None
+            }
+
+    def _update(self, key, ratio, now):
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = BlinkState()
+        state.last_seen = now
+        closed = (len(state.ratios) >= MIN_BASELINE_SAMPLES and
+                  ratio < self.blink_ratio * float(np.median(state.ratios)))
+        state.ratios.append(ratio)
+        if closed:
+            state.closed_frames += 1
+        else:
+            if state.closed_frames >= self.min_closed_frames:
+                state.blinks += 1
+                state.last_blink = now
+            state.closed_frames = 0
+        return self._recent_blink(state, now)
+
+    def _recent_blink(self, state, now):
+        return state.last_blink is not None and now - state.last_blink <= self.window
+
+    def _expire(self, now):
+        for key in [k for k, s in self._states.items() if now - s.last_seen > self.state_ttl]:
+            del self._states[key]
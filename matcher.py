@@ -0,0 +1,230 @@
+import math
+
+import numpy as np
+
+# Constants
+FACE_MATCH_THRESHOLD = 0.6      # same default tolerance as face_recognition.compare_faces
+INDEX_THRESHOLD = 20000         # gallery size at which the approximate index kicks in
+INDEX_PROBES = 8                # partitions scanned per query
+INDEX_TRAINING_ITERATIONS = 10
+INDEX_TRAINING_SAMPLE = 50000
+DISTANCE_CHUNK_SIZE = 8192      # gallery rows scored at a time when assigning partitions
+
+# How an identity's templates (one encoding per enrolled photo) are reduced to one distance
+MIN_REDUCTION = 'min'             # closest template
+MEAN_REDUCTION = 'mean'           # mean distance over the templates
+CENTROID_REDUCTION = 'centroid'   # distance to the templates' mean encoding
+TEMPLATE_REDUCTIONS = (MIN_REDUCTION, MEAN_REDUCTION, CENTROID_REDUCTION)
+
+
+def face_confidence(face_distance, face_match_threshold=FACE_MATCH_THRESHOLD):
+    """Map a face distance to a 0-100 confidence score"""
+    range = (1.0 - face_match_threshold)
+    linear_val = (1.0 - face_distance) / (range * 2.0)
+
+    if face_distance > face_match_threshold:
+        return round(linear_val * 100, 2)
+    else:
+        value = (linear_val + ((1.0 - linear_val) * math.pow((linear_val - 0.5) * 2, 0.2))) * 100
+        return round(value, 2)
+
+
+def squared_distances(queries, gallery, gallery_sq_norms):
+    """Squared euclidean distances between every query and gallery row"""
+    query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+    distances = query_sq_norms[:, None] + gallery_sq_norms[None, :]
+    distances -= 2.0 * (queries @ gallery.T)
+    np.maximum(distances, 0.0, out=distances)
+    return distances
+
+
+class Match:
+    """Best identity for one face; ``index`` is its position in ``FaceMatcher.identities``,
+    or None when the face is unknown"""
+
+    __slots__ = ('index', 'name', 'distance', 'confidence')
+
+    def __init__(self, index, name, distance, confidence):
+        self.index = index
+        self.name = name
+        self.distance = distance
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Match(name={self.name!r}, distance={self.distance}, confidence={self.confidence})"
+
+
+class PartitionIndex:
+    """IVF-style approximate nearest-neighbour index in pure NumPy.
+
+    The gallery is clustered with k-means and stored partition by partition,
+    so a query only scores the rows in its ``probes`` nearest partitions.
+    """
+
+    def __init__(self, gallery, centroids=None, probes=INDEX_PROBES, seed=0):
+        self.probes = probes
+        if centroids is None:
+            centroids = self._train(gallery, int(math.sqrt(len(gallery))), seed)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+        assignments = self._assign(gallery)
+        self.order = np.argsort(assignments, kind='stable')
+        self.offsets = np.searchsorted(assignments[self.order],
+                                       np.arange(len(self.centroids) + 1))
+        self.rows = np.ascontiguousarray(gallery[self.order])
+        self.row_sq_norms = np.einsum('ij,ij->i', self.rows, self.rows)
+
+    def _train(self, gallery, partitions, seed):
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(gallery), INDEX_TRAINING_SAMPLE)
+        sample = gallery[rng.choice(len(gallery), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, partitions, replace=False)].copy()
+        sample_sq_norms = np.einsum('ij,ij->i', sample, sample)
+
+        for _ in range(INDEX_TRAINING_ITERATIONS):
+            nearest = squared_distances(centroids, sample, sample_sq_norms).argmin(axis=0)
+            counts = np.bincount(nearest, minlength=partitions)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    def _assign(self, gallery):
+        assignments = np.empty(len(gallery), dtype=np.int64)
+        for start in range(0, len(gallery), DISTANCE_CHUNK_SIZE):
+            chunk = gallery[start:start + DISTANCE_CHUNK_SIZE]
+            chunk_sq_norms = np.einsum('ij,ij->i', chunk, chunk)
+            distances = squared_distances(self.centroids, chunk, chunk_sq_norms)
+            assignments[start:start + len(chunk)] = distances.argmin(axis=0)
+        return assignments
+
+    def search(self, queries):
+        """Return ``(indices, squared_distances)`` of the nearest gallery row per query"""
+        probes = min(self.probes, len(self.centroids))
+        centroid_distances = squared_distances(queries, self.centroids, self.centroid_sq_norms)
+        nearest_partitions = np.argpartition(centroid_distances, probes - 1, axis=1)[:, :probes]
+
+        indices = np.empty(len(queries), dtype=np.int64)
+        best = np.empty(len(queries), dtype=np.float32)
+        for i, partitions in enumerate(nearest_partitions):
+            candidates = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1])
+                                         for p in partitions])
+            if not len(candidates):
+                # Every probed partition is empty (e.g. centroids reused after
+                # removals): score the whole gallery instead
+                candidates = np.arange(len(self.rows))
+            distances = squared_distances(queries[i:i + 1], self.rows[candidates],
+                                          self.row_sq_norms[candidates])[0]
+            j = distances.argmin()
+            indices[i] = self.order[candidates[j]]
+            best[i] = distances[j]
+        return indices, best
+
+
+class FaceMatcher:
+    """Batched nearest-neighbour matching of face encodings against a gallery.
+
+    The gallery is held as one contiguous float32 matrix and every face in a
+    frame is scored in a single matrix product. Unlike ``compare_faces`` the
+    *closest* identity wins, not the first one under the tolerance.
+
+    ``names`` may repeat: each identity can have several templates. Rows are
+    grouped by identity so ``reduction`` can score identities with one
+    ``reduceat`` over contiguous slices: ``min`` takes the closest template,
+    ``mean`` the mean distance and ``centroid`` the distance to the mean
+    encoding (one row per identity, the cheapest). The approximate index is
+    used for ``min`` and ``centroid``; ``mean`` always scores every template.
+
+    Float32 encodings already grouped by identity, as ``face_cache`` stores
+    them, are used in place, so a ``min`` or ``mean`` matcher over the
+    memory-mapped cache shares its pages with every other process. Centroids,
+    the approximate index and template caps build a private copy.
+    """
+
+    def __init__(self, names, encodings, tolerance=FACE_MATCH_THRESHOLD,
+                 index_threshold=INDEX_THRESHOLD, previous=None, reduction=MIN_REDUCTION):
+        if reduction not in TEMPLATE_REDUCTIONS:
+            raise ValueError(f"Unknown template reduction: {reduction}")
+        self.tolerance = tolerance
+        self.reduction = reduction
+        self.names = tuple(names)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        identities, row_identity = np.unique(np.array(self.names, dtype=object),
+                                             return_inverse=True)
+        self.identities = tuple(identities.tolist())
+        order = np.argsort(row_identity, kind='stable')
+        if np.array_equal(order, np.arange(len(order))):
+            order = slice(None)  # already grouped, e.g. a face_cache matrix: no copy
+        row_identity = row_identity[order]
+        self.starts = np.searchsorted(row_identity, np.arange(len(self.identities)))
+        self.counts = np.diff(np.append(self.starts, len(row_identity)))
+
+        if reduction == CENTROID_REDUCTION and len(encodings):
+            self.gallery = np.add.reduceat(encodings[order], self.starts, axis=0) / \
+                self.counts[:, None].astype(np.float32)
+            self.gallery_identity = np.arange(len(self.identities))
+        else:
+            self.gallery = encodings[order]
+            self.gallery_identity = row_identity
+        self.gallery = np.ascontiguousarray(self.gallery, dtype=np.float32)
+        self.gallery_sq_norms = np.einsum('ij,ij->i', self.gallery, self.gallery)
+        self.index = None
+        if index_threshold is not None and reduction != MEAN_REDUCTION and \
+                len(self.gallery) >= index_threshold:
+            # Reuse the previous partitioning after small gallery edits
+            centroids = None
+            if previous is not None and previous.index is not None:
+                centroids = previous.index.centroids
+            self.index = PartitionIndex(self.gallery, centroids)
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest(self, face_encodings):
+        """Return ``(identity_indices, distances)`` of the closest identity for each encoding"""
+        queries = np.ascontiguousarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        if len(queries) == 0 or len(self.gallery) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.index is not None:
+            rows, best = self.index.search(queries)
+            return self.gallery_identity[rows], np.sqrt(best)
+
+        if self.reduction == MEAN_REDUCTION:
+            scores = self.identity_distances(queries)
+            identities = scores.argmin(axis=1)
+            return identities, scores[np.arange(len(queries)), identities]
+        distances = squared_distances(queries, self.gallery, self.gallery_sq_norms)
+        rows = distances.argmin(axis=1)
+        return self.gallery_identity[rows], np.sqrt(distances[np.arange(len(queries)), rows])
+
+    def identity_distances(self, face_encodings):
+        """``(faces, identities)`` distances after template reduction, scoring every template"""
+        queries = np.ascontiguousarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        if len(queries) == 0 or len(self.gallery) == 0:
+            return np.empty((len(queries), len(self.identities)), dtype=np.float32)
+        distances = squared_distances(queries, self.gallery, self.gallery_sq_norms)
+        np.sqrt(distances, out=distances)
+        if self.reduction == MEAN_REDUCTION:
+            return np.add.reduceat(distances, self.starts, axis=1) / self.counts
+        if self.reduction == MIN_REDUCTION:
+            return np.minimum.reduceat(distances, self.starts, axis=1)
+        return distances
+
+    def match(self, face_encodings):
+        """Return one ``Match`` per encoding; ``name`` is "Unknown" past the tolerance"""
+        face_encodings = list(face_encodings)
+        if len(self.gallery) == 0:
+            return [Match(None, "Unknown", None, None) for _ in face_encodings]
+
+        indices, distances = self.nearest(face_encodings)
+        matches = []
+        for index, distance in zip(indices.tolist(), distances.tolist()):
+            confidence = face_confidence(distance, self.tolerance)
+            if distance <= self.tolerance:
+                matches.append(Match(index, self.identities[index], distance, confidence))
+            else:
+                matches.append(Match(None, "Unknown", distance, confidence))
+        return matches
@@ -0,0 +1,51 @@
+"""Import the legacy per-day attendance JSON files into an attendance store.
+
+Usage: python migrate_attendance.py [--source static/attendance]
+                                    [--backend sqlite] [--target data/attendance.db]
+
+Safe to run more than once: records already in the store are skipped.
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+
+from attendance_store import (AttendanceEvent, DATE_FORMAT, DEFAULT_STORE_PATH, SQLITE_BACKEND,
+                              JSONL_BACKEND, TIME_FORMAT, open_attendance_store)
+
+# Constants
+LEGACY_ATTENDANCE_DIRECTORY = 'static/attendance'
+DEFAULT_TARGET = DEFAULT_STORE_PATH
+
+
+def legacy_events(directory):
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(directory, filename), 'r') as f:
+            for entry in json.load(f):
+                when = datetime.strptime(f"{entry['date']} {entry['time']}",
+                                         f'{DATE_FORMAT} {TIME_FORMAT}')
+                yield AttendanceEvent(entry['name'], when)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate daily attendance JSON files')
+    parser.add_argument('--source', default=LEGACY_ATTENDANCE_DIRECTORY)
+    parser.add_argument('--backend', choices=(SQLITE_BACKEND, JSONL_BACKEND),
+                        default=SQLITE_BACKEND)
+    parser.add_argument('--target', default=DEFAULT_TARGET,
+                        help='database file (sqlite) or directory (jsonl)')
+    args = parser.parse_args()
+
+    events = list(legacy_events(args.source))
+    store = open_attendance_store(args.backend, args.target)
+    try:
+        inserted = sum(store.record_many(events))
+    finally:
+        store.close()
+    print(f"Migrated {inserted} of {len(events)} records into {args.target}")
+
+
+if __name__ == '__main__':
+    main()
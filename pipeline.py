@@ -0,0 +1,394 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from broadcast import BUFFER_SIZE, MAX_BACKLOG, FrameBroadcaster
+from metrics import STAGE_LATENCY, log_event
+
+# Drop policies for a full stage queue
+DROP_OLDEST = 'drop_oldest'   # evict the oldest queued item to make room
+DROP_NEWEST = 'drop_newest'   # discard the incoming item
+BLOCK = 'block'               # wait for the consumer to make room
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+QUEUE_POLL_INTERVAL = 0.1  # seconds; how often blocked stages re-check for shutdown
+CHANGE_THRESHOLD = 2.0     # mean grey-level difference below which a frame counts as unchanged
+CHANGE_SIGNATURE_SIZE = (64, 48)  # px; also the scheduler's motion signature
+UNCHANGED_REFRESH_INTERVAL = 1.0  # seconds; unchanged frames are still published this often
+
+_CAPTURE_LATENCY = STAGE_LATENCY.labels('capture')
+_RECOGNIZE_LATENCY = STAGE_LATENCY.labels('recognize')
+_DRAW_LATENCY = STAGE_LATENCY.labels('draw')
+
+
+class StageQueue:
+    """Bounded hand-off between two pipeline stages with a configurable drop policy"""
+
+    def __init__(self, maxsize=1, drop_policy=DROP_OLDEST):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+
+    def put(self, item, timeout=None):
+        """Queue ``item``; returns False if it was dropped instead"""
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                if self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.drop_policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                elif not self._condition.wait_for(lambda: len(self._items) < self.maxsize,
+                                                  timeout):
+                    self.dropped += 1
+                    return False
+            self._items.append(item)
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Return the next item, or None if nothing arrived within ``timeout``"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items, timeout):
+                return None
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def clear(self):
+        with self._condition:
+            self._items.clear()
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def frame_signature(image, size=CHANGE_SIGNATURE_SIZE, out=None):
+    """Tiny greyscale copy of a BGR frame, which frames are compared by"""
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if out is None:
+        out = np.empty(size[::-1], dtype=np.uint8)
+    cv2.resize(grey, size, dst=out, interpolation=cv2.INTER_AREA)
+    return out
+
+
+class CapturedFrame:
+    """``signature`` is the frame's ``frame_signature``, when capture already computed it"""
+
+    __slots__ = ('seq', 'timestamp', 'image', 'signature')
+
+    def __init__(self, seq, timestamp, image, signature=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self.signature = signature
+
+
+class RateMeter:
+    """Events per second over a sliding window"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+    def mark(self):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append(now)
+            while self._events and now - self._events[0] > self.window:
+                self._events.popleft()
+
+    def rate(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._events and now - self._events[0] > self.window:
+                self._events.popleft()
+            return len(self._events) / self.window
+
+
+class ChangeDetector:
+    """Tells whether a frame differs visibly from the last one accepted.
+
+    Compares tiny greyscale signatures kept in two preallocated buffers, so
+    the check costs a downscale and a subtraction per frame.
+    """
+
+    def __init__(self, threshold=CHANGE_THRESHOLD, size=CHANGE_SIGNATURE_SIZE):
+        self.threshold = threshold
+        self.size = size
+        self._current = np.empty(size[::-1], dtype=np.uint8)
+        self._previous = np.empty(size[::-1], dtype=np.uint8)
+        self._has_previous = False
+
+    def difference(self, image, signature=None):
+        """Mean grey-level difference of ``image`` from the last accepted frame.
+
+        None while there is no accepted frame. Pass the frame's
+        ``signature`` if it is already known.
+        """
+        if signature is not None and signature.shape == self._current.shape:
+            np.copyto(self._current, signature)
+        else:
+            frame_signature(image, self.size, out=self._current)
+        if not self._has_previous:
+            return None
+        return cv2.norm(self._current, self._previous, cv2.NORM_L1) / self._current.size
+
+    def changed(self, image, signature=None):
+        """Whether ``image`` differs from the last accepted frame; accepts it if so"""
+        difference = self.difference(image, signature)
+        if difference is not None and difference < self.threshold:
+            return False
+        self.accept()
+        return True
+
+    def accept(self):
+        """Make the frame last passed to ``changed()`` the reference"""
+        self._current, self._previous = self._previous, self._current
+        self._has_previous = True
+
+    def reset(self):
+        self._has_previous = False
+
+
+class FramePipeline:
+    """Capture, recognition and display running as independent stages.
+
+    A capture thread reads the camera and hands every frame to the display
+    stage, offering frames to a pool of recognition workers: those a
+    ``scheduler.FrameScheduler`` picks, or without one every
+    ``recognition_interval``-th frame. Workers drop frames older than
+    ``max_recognition_age`` and publish their results; the display stage
+    overlays the most recent results on each frame and publishes it to a
+    ``FrameBroadcaster`` shared by every viewer, which JPEG-encodes it once
+    per requested quality and size. Display FPS is therefore set by the
+    camera, not by recognition latency. Frames nobody is watching, and
+    frames whose picture and results did not change, are neither drawn nor
+    published.
+
+    ``open_capture()`` returns a ``cv2.VideoCapture``-like object,
+    ``recognize(frame)`` returns results for a BGR frame and
+    ``draw(frame, results)`` annotates a frame in place.
+    """
+
+    def __init__(self, open_capture, recognize, draw, recognition_workers=1,
+                 recognition_interval=1, max_recognition_age=1.0,
+                 recognition_queue_size=1, recognition_drop_policy=DROP_OLDEST,
+                 display_queue_size=2, display_drop_policy=DROP_OLDEST,
+                 broadcast_buffer_size=BUFFER_SIZE, max_subscriber_backlog=MAX_BACKLOG,
+                 change_threshold=CHANGE_THRESHOLD, scheduler=None):
+        self.open_capture = open_capture
+        self.recognize = recognize
+        self.draw = draw
+        self.recognition_workers = recognition_workers
+        self.recognition_interval = recognition_interval
+        self.scheduler = scheduler
+        self.max_recognition_age = max_recognition_age
+        self.recognition_queue = StageQueue(recognition_queue_size, recognition_drop_policy)
+        self.display_queue = StageQueue(display_queue_size, display_drop_policy)
+        self.broadcaster = FrameBroadcaster(broadcast_buffer_size, max_subscriber_backlog)
+        self.change_detector = ChangeDetector(change_threshold) if change_threshold else None
+
+        self.display_rate = RateMeter()
+        self.recognition_rate = RateMeter()
+        self.stale_frames = 0
+        self.unwatched_frames = 0
+        self.unchanged_frames = 0
+        self.latest_results = []
+        self._latest_results_seq = -1
+        self._results_lock = threading.Lock()
+        self._grab_requests = []
+        self._grab_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._lifecycle_lock = threading.Lock()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads) and \
+            not self._stop_event.is_set()
+
+    def start(self):
+        with self._lifecycle_lock:
+            if self.running:
+                return
+            # Reap threads left over from a capture that ended on its own
+            self._join()
+            self._stop_event.clear()
+            for queue in (self.recognition_queue, self.display_queue):
+                queue.clear()
+            self.broadcaster.open()
+            with self._results_lock:
+                self.latest_results = []
+                self._latest_results_seq = -1
+            if self.scheduler is not None:
+                self.scheduler.reset()
+
+            capture = self.open_capture()
+            self._threads = [threading.Thread(target=self._capture_loop, args=(capture,),
+                                              name='pipeline-capture', daemon=True),
+                             threading.Thread(target=self._encode_loop,
+                                              name='pipeline-encode', daemon=True)]
+            for i in range(self.recognition_workers):
+                self._threads.append(threading.Thread(target=self._recognition_loop,
+                                                      name=f'pipeline-recognize-{i}',
+                                                      daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        with self._lifecycle_lock:
+            self._join()
+
+    def _join(self):
+        self._stop_event.set()
+        self.broadcaster.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def subscribe(self):
+        """Return a new ``Subscriber`` to the annotated frame stream"""
+        return self.broadcaster.subscribe()
+
+    def grab(self, timeout=1.0):
+        """Copy of the next captured frame, before any annotation, or None on timeout"""
+        request = [threading.Event(), None]
+        with self._grab_lock:
+            self._grab_requests.append(request)
+        if not request[0].wait(timeout):
+            with self._grab_lock:
+                if request in self._grab_requests:
+                    self._grab_requests.remove(request)
+        return request[1]
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'display_fps': self.display_rate.rate(),
+            'recognition_fps': self.recognition_rate.rate(),
+            'stale_frames': self.stale_frames,
+            'skipped': {
+                'unwatched': self.unwatched_frames,
+                'unchanged': self.unchanged_frames
+            },
+            'dropped': {
+                'recognition': self.recognition_queue.dropped,
+                'display': self.display_queue.dropped
+            },
+            'broadcast': self.broadcaster.stats(),
+            'scheduler': self.scheduler.stats(history=0) if self.scheduler is not None else None
+        }
+
+    def _capture_loop(self, capture):
+        seq = 0
+        try:
+            while not self._stop_event.is_set() and capture.isOpened():
+                with _CAPTURE_LATENCY.time():
+                    ret, image = capture.read()
+                if not ret:
+                    break
+                # One signature per frame serves the scheduler and the display's change check
+                signature = frame_signature(image, self.scheduler.signature_size) \
+                    if self.scheduler is not None else None
+                frame = CapturedFrame(seq, time.monotonic(), image, signature)
+                if self._grab_requests:
+                    with self._grab_lock:
+                        requests, self._grab_requests = self._grab_requests, []
+                    grabbed = image.copy()
+                    for request in requests:
+                        request[1] = grabbed
+                        request[0].set()
+                if self.scheduler is not None:
+                    offer = self.scheduler.decide(image, frame.timestamp, signature)
+                else:
+                    offer = seq % self.recognition_interval == 0
+                if offer:
+                    # Workers get their own copy since the encoder draws on the original
+                    self.recognition_queue.put(CapturedFrame(seq, frame.timestamp, image.copy()),
+                                               timeout=QUEUE_POLL_INTERVAL)
+                self.display_queue.put(frame, timeout=QUEUE_POLL_INTERVAL)
+                seq += 1
+        finally:
+            capture.release()
+            self._stop_event.set()
+            self.broadcaster.close()
+            log_event('capture_released')
+
+    def _recognition_loop(self):
+        while not self._stop_event.is_set():
+            frame = self.recognition_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            if frame is None:
+                continue
+            if time.monotonic() - frame.timestamp > self.max_recognition_age:
+                self.stale_frames += 1
+                continue
+
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                with _RECOGNIZE_LATENCY.time():
+                    results = self.recognize(frame.image)
+            except Exception as e:
+                log_event('recognition_error', source='camera', error=str(e))
+                continue
+            self.recognition_rate.mark()
+            if self.scheduler is not None:
+                self.scheduler.observe(results, time.perf_counter() - start,
+                                       time.thread_time() - cpu_start, time.monotonic())
+
+            with self._results_lock:
+                # With several workers a slow older frame must not overwrite newer results
+                if frame.seq > self._latest_results_seq:
+                    self.latest_results = results
+                    self._latest_results_seq = frame.seq
+
+    def _encode_loop(self):
+        published_results = None
+        published_at = 0.0
+        if self.change_detector is not None:
+            self.change_detector.reset()
+        while not self._stop_event.is_set():
+            frame = self.display_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            if frame is None:
+                continue
+            if not self.broadcaster.wanted():
+                self.unwatched_frames += 1
+                published_results = None
+                continue
+            results = self.latest_results
+            if self.change_detector is not None:
+                # Check the picture before drawing on it
+                picture_changed = self.change_detector.changed(frame.image, frame.signature)
+                if not picture_changed and _same_results(results, published_results) and \
+                        frame.timestamp - published_at < UNCHANGED_REFRESH_INTERVAL:
+                    self.unchanged_frames += 1
+                    continue
+                if not picture_changed:
+                    self.change_detector.accept()
+            with _DRAW_LATENCY.time():
+                self.draw(frame.image, results)
+            self.broadcaster.publish(frame.image)
+            published_results = results
+            published_at = frame.timestamp
+            self.display_rate.mark()
+
+
+def _same_results(results, other):
+    if results is other:
+        return True
+    try:
+        return bool(results == other)
+    except ValueError:
+        # e.g. numpy arrays in the results; treat them as changed
+        return False
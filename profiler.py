@@ -0,0 +1,98 @@
+import collections
+import sys
+import threading
+import time
+
+# Constants
+SAMPLE_INTERVAL = 0.005    # seconds between stack samples
+MAX_DURATION = 300.0       # seconds; a forgotten profiler switches itself off
+MAX_STACK_DEPTH = 64
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock profiler that can be switched on in a running process.
+
+    A background thread samples every other thread's Python stack via
+    ``sys._current_frames()`` and counts identical stacks. ``report()``
+    returns them in the collapsed ``frame;frame;frame count`` format that
+    flamegraph tools read. Nothing runs while the profiler is stopped.
+    """
+
+    def __init__(self):
+        self.interval = SAMPLE_INTERVAL
+        self.started_at = None
+        self.stopped_at = None
+        self.samples = 0
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=SAMPLE_INTERVAL, duration=MAX_DURATION):
+        """Start sampling, discarding the previous profile; no-op if already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = max(interval, 0.001)
+            self._stacks = collections.Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._sample_loop, args=(duration,),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return False
+        self._stop_event.set()
+        thread.join()
+        return True
+
+    def report(self, limit=None):
+        """Collapsed stacks, most frequent first"""
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return '\n'.join(f'{stack} {count}' for stack, count in stacks) + '\n'
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': len(self._stacks),
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at
+        }
+
+    def _sample_loop(self, duration):
+        own_id = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + duration
+        try:
+            while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+                names.update((t.ident, t.name) for t in threading.enumerate())
+                sampled = []
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    sampled.append(';'.join(reversed(stack)))
+                with self._lock:
+                    self._stacks.update(sampled)
+                    self.samples += 1
+        finally:
+            self.stopped_at = time.time()
@@ -0,0 +1,85 @@
+import collections
+
+import cv2
+
+from detectors import FaceLocator
+from encoder import default_encoder, landmark_points
+from metrics import STAGE_LATENCY
+
+RecognizedFace = collections.namedtuple('RecognizedFace', ('box', 'match', 'landmarks', 'encoding'))
+RecognizedFace.__doc__ = """One face in a frame.
+
+``box`` is ``(top, right, bottom, left)`` in full-frame coordinates,
+``match`` a ``matcher.Match`` and ``landmarks`` the face's ``(points, 2)``
+landmark coordinates in the frame, or None when they were not computed.
+``encoding`` is the 128-d encoding computed for this frame, or None when
+the match was carried over from the face's track.
+"""
+
+_LANDMARKS_LATENCY = STAGE_LATENCY.labels('landmarks')
+_ENCODE_LATENCY = STAGE_LATENCY.labels('encode')
+_MATCH_LATENCY = STAGE_LATENCY.labels('match')
+
+
+def recognize_faces(frame, matcher, locator=None, encoder=None):
+    """Detect, encode and match the faces in a BGR frame.
+
+    ``locator`` is a ``detectors.FaceLocator`` (HOG on a frame downscaled by
+    ``FRAME_RESIZE_FACTOR`` by default) and ``encoder`` an
+    ``encoder.FaceEncoder``. Faces are aligned on the full-resolution frame.
+    Returns a ``RecognizedFace`` per face.
+    """
+    encoder = encoder or default_encoder()
+    detection = (locator or FaceLocator()).locate(frame)
+    if not detection.boxes:
+        return []
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    with _LANDMARKS_LATENCY.time():
+        shapes = encoder.shapes(rgb_frame, detection.boxes)
+    # Every face in the frame goes through the encoder and the matcher in one batch
+    with _ENCODE_LATENCY.time():
+        face_encodings = encoder.encode(rgb_frame, detection.boxes, shapes)
+    with _MATCH_LATENCY.time():
+        matches = matcher.match(face_encodings)
+    return [RecognizedFace(box, match, points, encoding)
+            for box, match, points, encoding in zip(detection.boxes, matches,
+                                                    landmark_points(shapes), face_encodings)]
+
+
+def recognize_tracked_faces(frame, matcher, tracker, now, locator=None, encoder=None,
+                            landmarks=False):
+    """Like ``recognize_faces`` but only encodes faces the tracker cannot vouch for.
+
+    Faces that continue an already verified track reuse that track's match,
+    so in a steady scene each frame costs one detection pass and no
+    encoder calls. ``now`` is the frame time in seconds. With ``landmarks``
+    every face gets landmarks (e.g. for the blink check), and faces that
+    need encoding reuse them.
+    """
+    encoder = encoder or default_encoder()
+    detection = (locator or FaceLocator()).locate(frame)
+    # Tracks live in full-frame coordinates so they survive changes of scale
+    tracks, pending = tracker.update(detection.boxes, now, frame)
+    if not pending and not landmarks:
+        return [RecognizedFace(box, track.match, None, None)
+                for box, track in zip(detection.boxes, tracks)]
+
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    shaped = range(len(detection.boxes)) if landmarks else pending
+    with _LANDMARKS_LATENCY.time():
+        shapes = dict(zip(shaped, encoder.shapes(rgb_frame,
+                                                 [detection.boxes[i] for i in shaped])))
+    encodings = {}
+    if pending:
+        with _ENCODE_LATENCY.time():
+            face_encodings = encoder.encode(rgb_frame, [detection.boxes[i] for i in pending],
+                                            [shapes[i] for i in pending])
+        with _MATCH_LATENCY.time():
+            matches = matcher.match(face_encodings)
+        for i, match in zip(pending, matches):
+            tracker.assign(tracks[i], match, now)
+        encodings = dict(zip(pending, face_encodings))
+
+    points = dict(zip(shapes, landmark_points(list(shapes.values())))) if landmarks else {}
+    return [RecognizedFace(box, track.match, points.get(i), encodings.get(i))
+            for i, (box, track) in enumerate(zip(detection.boxes, tracks))]
@@ -0,0 +1,206 @@
+import concurrent.futures
+import queue
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import STAGE_LATENCY, log_event
+
+# Constants
+DECODE_WORKERS = 2
+RECOGNITION_WORKERS = 1
+MAX_PENDING_FRAMES = 8       # frames admitted but not yet recognized, across all clients
+ADMISSION_TIMEOUT = 0.5      # seconds a request waits for room before it is turned away
+MAX_BATCH_FRAMES = 8         # frames per /recognize request
+MAX_FRAME_BYTES = 4 * 1024 * 1024
+STREAM_WINDOW = 2            # frames one streaming client may have in flight
+STREAM_POLL_INTERVAL = 1.0   # seconds; how often a stream's reader re-checks for shutdown
+FRAME_HEADER = struct.Struct('>I')  # big-endian length in front of each streamed JPEG
+
+_DECODE_LATENCY = STAGE_LATENCY.labels('decode')
+
+
+class Overloaded(Exception):
+    """No room in the recognition queue; the client should retry later"""
+
+
+class InvalidFrame(ValueError):
+    pass
+
+
+def decode_jpeg(data):
+    """BGR image from JPEG (or PNG) bytes"""
+    if not data:
+        raise InvalidFrame("Empty frame")
+    if len(data) > MAX_FRAME_BYTES:
+        raise InvalidFrame(f"Frame larger than {MAX_FRAME_BYTES} bytes")
+    with _DECODE_LATENCY.time():
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise InvalidFrame("Not a JPEG or PNG image")
+    return image
+
+
+def read_frame(stream):
+    """Next length-prefixed frame from a binary stream, or None at the end"""
+    header = stream.read(FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < FRAME_HEADER.size:
+        raise InvalidFrame("Truncated frame header")
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise InvalidFrame(f"Frame larger than {MAX_FRAME_BYTES} bytes")
+    data = stream.read(length)
+    if len(data) < length:
+        raise InvalidFrame("Truncated frame")
+    return data
+
+
+def face_result(face):
+    """JSON-ready dict for a ``recognition.RecognizedFace``"""
+    top, right, bottom, left = (int(v) for v in face.box)
+    match = face.match
+    return {
+        'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+        'name': match.name,
+        'known': match.index is not None,
+        'distance': None if match.distance is None else round(float(match.distance), 4),
+        'confidence': None if match.confidence is None else round(float(match.confidence), 4)
+    }
+
+
+class RecognitionService:
+    """Recognizes JPEG frames pushed by clients, with bounded queueing.
+
+    Frames are decoded in a thread pool (OpenCV releases the GIL) while
+    ``recognition_workers`` threads run ``recognize(image)``, which returns
+    ``recognition.RecognizedFace`` tuples. At most ``max_pending`` frames are
+    admitted at once; beyond that ``submit()`` waits up to ``timeout`` and
+    then raises ``Overloaded``, so a busy server sheds load instead of
+    building an unbounded backlog. The service keeps no per-client state,
+    so any number of instances can sit behind a load balancer.
+    """
+
+    def __init__(self, recognize, decode_workers=DECODE_WORKERS,
+                 recognition_workers=RECOGNITION_WORKERS, max_pending=MAX_PENDING_FRAMES):
+        # A full /recognize batch must fit in the queue, or valid requests could never be admitted
+        if max_pending < MAX_BATCH_FRAMES:
+            raise ValueError(f"max_pending must be at least MAX_BATCH_FRAMES ({MAX_BATCH_FRAMES})")
+        self.recognize = recognize
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+        self._decode_pool = concurrent.futures.ThreadPoolExecutor(
+            decode_workers, thread_name_prefix='recognize-decode')
+        self._recognize_pool = concurrent.futures.ThreadPoolExecutor(
+            recognition_workers, thread_name_prefix='recognize-frame')
+
+    def submit(self, frames, timeout=ADMISSION_TIMEOUT):
+        """Queue JPEG ``frames``; returns a future per frame resolving to a result dict.
+
+        ``timeout`` of None waits for room indefinitely.
+        """
+        frames = list(frames)
+        if len(frames) > self.max_pending:
+            raise ValueError(f"At most {self.max_pending} frames per request")
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self.pending + len(frames) <= self.max_pending, timeout):
+                self.rejected += len(frames)
+                raise Overloaded(f"{self.pending} frames already queued")
+            self.pending += len(frames)
+        submitted_at = time.perf_counter()
+        return [self._recognize_pool.submit(self._recognize,
+                                            self._decode_pool.submit(decode_jpeg, data),
+                                            submitted_at)
+                for data in frames]
+
+    def recognize_batch(self, frames, timeout=ADMISSION_TIMEOUT):
+        """Result dicts for JPEG ``frames``, in order; raises ``Overloaded``"""
+        return [self.result(future) for future in self.submit(frames, timeout)]
+
+    def stream(self, next_frame, window=STREAM_WINDOW):
+        """Yield a result per frame returned by ``next_frame()`` until it returns None.
+
+        A reader thread pulls frames while results are sent back, keeping at
+        most ``window`` frames in flight; the next frame is only read once a
+        result has gone out, so a client pushing faster than the server
+        recognizes is slowed down by TCP flow control rather than queued.
+        """
+        results = queue.Queue()
+        slots = threading.Semaphore(window)
+        stopped = threading.Event()
+
+        def read():
+            try:
+                while not stopped.is_set():
+                    if not slots.acquire(timeout=STREAM_POLL_INTERVAL):
+                        continue
+                    data = next_frame()
+                    if data is None:
+                        break
+                    results.put(self.submit([data], timeout=None)[0])
+            except InvalidFrame as e:
+                results.put(e)
+            except Exception as e:
+                log_event('frame_stream_error', error=str(e))
+            finally:
+                results.put(None)
+
+        reader = threading.Thread(target=read, name='recognize-stream-reader', daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    return
+                if isinstance(item, InvalidFrame):
+                    yield {'error': str(item)}
+                else:
+                    yield self.result(item)
+                slots.release()
+        finally:
+            stopped.set()
+
+    def result(self, future):
+        try:
+            return future.result()
+        except InvalidFrame as e:
+            return {'error': str(e)}
+        except Exception as e:
+            log_event('recognition_error', source='pushed', error=str(e))
+            return {'error': 'Recognition failed'}
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected
+        }
+
+    def shutdown(self):
+        self._decode_pool.shutdown(wait=False)
+        self._recognize_pool.shutdown(wait=False)
+
+    def _recognize(self, decoded, submitted_at):
+        try:
+            image = decoded.result()
+            faces = self.recognize(image)
+            return {
+                'width': image.shape[1],
+                'height': image.shape[0],
+                'faces': [face_result(face) for face in faces],
+                'latency_ms': round((time.perf_counter() - submitted_at) * 1000, 1)
+            }
+        finally:
+            with self._condition:
+                self.pending -= 1
+                self.completed += 1
+                self._condition.notify_all()
@@ -0,0 +1,182 @@
+import collections
+import math
+import threading
+import time
+
+from pipeline import CHANGE_SIGNATURE_SIZE, ChangeDetector
+
+# Constants
+ACTIVE_PERIOD = 0.1           # seconds between recognitions while people move (every 3rd frame at 30 fps)
+IDLE_PERIOD = 2.0             # seconds between recognitions of a still scene
+ACTIVE_HOLD = 2.0             # seconds the active rate is kept after motion or a change of faces
+MOTION_THRESHOLD = 1.5        # mean grey-level change between consecutive frames counted as motion
+MOTION_SIGNATURE_SIZE = CHANGE_SIGNATURE_SIZE
+CPU_BUDGET = 0.6              # share of one core recognition may use on average
+LATENCY_TARGET = 0.5          # seconds per recognized frame before the scheduler backs off
+BACKOFF_FACTOR = 1.5          # period multiplier each time a frame misses the latency target
+RECOVERY_FACTOR = 0.9         # and its decay for each frame within the target
+MAX_BACKOFF = 10.0
+LATENCY_SMOOTHING = 0.2       # weight of the newest frame in the latency and CPU averages
+DECISION_HISTORY = 200
+
+# Decisions, one per captured frame
+RECOGNIZE_MOTION = 'recognize_motion'    # something moved
+RECOGNIZE_FACES = 'recognize_faces'      # faces changed recently or one still awaits its blink
+RECOGNIZE_REFRESH = 'recognize_refresh'  # still scene, periodic check
+SKIP_STILL = 'skip_still'                # still scene, checked recently enough
+SKIP_RATE = 'skip_rate'                  # active, but the rate, CPU budget or backoff says wait
+DECISIONS = (RECOGNIZE_MOTION, RECOGNIZE_FACES, RECOGNIZE_REFRESH, SKIP_STILL, SKIP_RATE)
+
+# Settings that configure() accepts, with their lower bounds
+SETTINGS = {
+    'active_period': 0.001,
+    'idle_period': 0.001,
+    'active_hold': 0.0,
+    'motion_threshold': 0.0,
+    'cpu_budget': 0.01,
+    'latency_target': 0.001
+}
+
+
+def _count_faces(results):
+    return len(results), False
+
+
+class FrameScheduler:
+    """Decides which captured frames are worth recognizing.
+
+    Each frame is shrunk to a tiny greyscale signature and compared with
+    the previous one by a ``pipeline.ChangeDetector``. Motion switches the scheduler to the active period for
+    ``active_hold`` seconds; a still scene is only re-checked every
+    ``idle_period``. Recognition results feed back through ``observe()``:
+    ``summarize(results)`` returns ``(scene, attention)``, and a scene that
+    differs from the last one (someone new, a name resolved) or needs
+    attention (a face awaiting its blink) keeps the active rate too.
+
+    The period never drops below what keeps recognition within
+    ``cpu_budget`` of one core at the measured CPU time per frame, and is
+    stretched by a backoff factor while frames take longer than
+    ``latency_target``. ``decide()`` is called from the capture thread and
+    ``observe()`` from recognition workers.
+    """
+
+    def __init__(self, active_period=ACTIVE_PERIOD, idle_period=IDLE_PERIOD,
+                 active_hold=ACTIVE_HOLD, motion_threshold=MOTION_THRESHOLD,
+                 cpu_budget=CPU_BUDGET, latency_target=LATENCY_TARGET, summarize=None,
+                 history=DECISION_HISTORY, signature_size=MOTION_SIGNATURE_SIZE):
+        self.active_period = active_period
+        self.idle_period = idle_period
+        self.active_hold = active_hold
+        self.motion_threshold = motion_threshold
+        self.cpu_budget = cpu_budget
+        self.latency_target = latency_target
+        self.summarize = summarize or _count_faces
+        self.signature_size = signature_size
+        self.decisions = dict.fromkeys(DECISIONS, 0)
+        self.history = collections.deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._change = ChangeDetector(size=signature_size)
+        self.reset()
+
+    def reset(self):
+        """Forget the scene, e.g. when the camera is reopened; settings and counts are kept"""
+        with self._lock:
+            self._change.reset()
+            self._last_offered = None
+            self._active_until = -math.inf
+            self._active_reason = None
+            self._scene = None
+            self.motion = 0.0
+            self.latency = None
+            self.cpu_seconds = None
+            self.backoff = 1.0
+
+    def configure(self, **settings):
+        """Change settings at run time; raises ValueError for unknown or out-of-range ones"""
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Unknown scheduler setting: {name}")
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or \
+                    not SETTINGS[name] <= value < math.inf:
+                raise ValueError(f"{name} must be a number >= {SETTINGS[name]}")
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, float(value))
+
+    def decide(self, image, now, signature=None):
+        """Whether to recognize the BGR frame captured at ``now`` (seconds, monotonic).
+
+        ``signature`` is the frame's ``pipeline.frame_signature``, if already computed.
+        """
+        # Every frame becomes the reference, so motion is measured frame to frame
+        motion = self._change.difference(image, signature) or 0.0
+        self._change.accept()
+        with self._lock:
+            self.motion = motion
+            if motion >= self.motion_threshold:
+                self._active_until = now + self.active_hold
+                self._active_reason = RECOGNIZE_MOTION
+            active = now < self._active_until
+            period = self._period(active)
+            due = self._last_offered is None or now - self._last_offered >= period
+            if due:
+                decision = self._active_reason if active else RECOGNIZE_REFRESH
+                self._last_offered = now
+            else:
+                decision = SKIP_RATE if active else SKIP_STILL
+            self.decisions[decision] += 1
+            self.history.append((now, decision, round(motion, 2), round(period, 3)))
+        return due
+
+    def observe(self, results, latency, cpu_seconds, now):
+        """Feed back one recognized frame: its results, wall time and CPU time in seconds"""
+        scene, attention = self.summarize(results)
+        with self._lock:
+            if self.latency is None:
+                self.latency, self.cpu_seconds = latency, cpu_seconds
+            else:
+                self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+                self.cpu_seconds += LATENCY_SMOOTHING * (cpu_seconds - self.cpu_seconds)
+            if latency > self.latency_target:
+                self.backoff = min(self.backoff * BACKOFF_FACTOR, MAX_BACKOFF)
+            else:
+                self.backoff = max(self.backoff * RECOVERY_FACTOR, 1.0)
+            if attention or scene != self._scene:
+                if now + self.active_hold > self._active_until:
+                    self._active_until = now + self.active_hold
+                    self._active_reason = RECOGNIZE_FACES
+            self._scene = scene
+
+    def rate(self, now=None):
+        """Recognitions per second currently allowed"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return 1.0 / self._period(now < self._active_until)
+
+    def stats(self, history=20):
+        """Current mode, rate, load estimates, decision counts and the last ``history`` decisions"""
+        now = time.monotonic()
+        with self._lock:
+            active = now < self._active_until
+            period = self._period(active)
+            recent = list(self.history)[-history:] if history > 0 else []
+            return {
+                'mode': 'active' if active else 'idle',
+                'rate': round(1.0 / period, 3),
+                'period': round(period, 3),
+                'motion': round(self.motion, 2),
+                'latency_ms': None if self.latency is None else round(self.latency * 1000, 1),
+                'cpu_ms': None if self.cpu_seconds is None else round(self.cpu_seconds * 1000, 1),
+                'backoff': round(self.backoff, 2),
+                'decisions': dict(self.decisions),
+                'settings': {name: getattr(self, name) for name in SETTINGS},
+                'recent': [{'age': round(now - at, 3), 'decision': decision, 'motion': motion,
+                            'period': period} for at, decision, motion, period in recent]
+            }
+
+    def _period(self, active):
+        period = (self.active_period if active else self.idle_period) * self.backoff
+        if self.cpu_seconds is not None:
+            # At this period recognition uses cpu_budget of a core on average
+            period = max(period, self.cpu_seconds / self.cpu_budget)
+        return period
@@ -0,0 +1,104 @@
+import threading
+
+import cv2
+
+from metrics import STAGE_LATENCY
+
+# Constants
+STREAM_FPS = 15              # default frames per second sent to each viewer
+MAX_STREAM_FPS = 30
+JPEG_QUALITY = 80            # OpenCV's default of 95 roughly doubles the bytes per frame
+MIN_JPEG_QUALITY = 10
+MAX_JPEG_QUALITY = 95
+MIN_STREAM_WIDTH = 80
+THUMBNAIL_WIDTH = 160        # dashboards showing many feeds
+THUMBNAIL_QUALITY = 50
+THUMBNAIL_FPS = 1
+MULTIPART_BOUNDARY = 'frame'
+
+_JPEG_LATENCY = STAGE_LATENCY.labels('jpeg_encode')
+_buffers = threading.local()
+
+
+class StreamSettings:
+    """Frame rate, JPEG quality and output width requested by one viewer.
+
+    Viewers with the same ``key`` (width and quality) share each encoded
+    frame; ``fps`` only decides how many of those frames a viewer is sent.
+    """
+
+    __slots__ = ('fps', 'quality', 'width')
+
+    def __init__(self, fps=STREAM_FPS, quality=JPEG_QUALITY, width=None):
+        self.fps = min(max(float(fps), 0.1), MAX_STREAM_FPS)
+        self.quality = int(min(max(quality, MIN_JPEG_QUALITY), MAX_JPEG_QUALITY))
+        self.width = None if not width else max(int(width), MIN_STREAM_WIDTH)
+
+    @classmethod
+    def thumbnail(cls):
+        return cls(THUMBNAIL_FPS, THUMBNAIL_QUALITY, THUMBNAIL_WIDTH)
+
+    @classmethod
+    def from_args(cls, args, max_width=None, mode='full'):
+        """Settings from request arguments: ``fps``, ``quality``, ``width`` and ``mode``.
+
+        ``mode=thumbnail`` starts from the thumbnail preset instead of the
+        full-size defaults; explicit arguments still override it.
+        """
+        defaults = cls.thumbnail() if args.get('mode', mode) == 'thumbnail' else cls()
+        width = args.get('width', defaults.width, type=int)
+        if width and max_width:
+            width = min(width, max_width)
+        return cls(args.get('fps', defaults.fps, type=float),
+                   args.get('quality', defaults.quality, type=int),
+                   width)
+
+    @property
+    def key(self):
+        return (self.width, self.quality)
+
+    @property
+    def min_interval(self):
+        return 1.0 / self.fps
+
+    def as_dict(self):
+        return {'fps': self.fps, 'quality': self.quality, 'width': self.width}
+
+
+def _resized(image, width):
+    """``image`` scaled to ``width``, written into a per-thread preallocated buffer"""
+    height, image_width = image.shape[:2]
+    if not width or width >= image_width:
+        return image
+    size = (width, max(int(round(height * width / image_width)), 1))
+    key = (size, image.shape[2:], image.dtype.str)
+    buffers = getattr(_buffers, 'resize', None)
+    if buffers is None:
+        buffers = _buffers.resize = {}
+    buffer = buffers.get(key)
+    if buffer is None:
+        buffer = buffers[key] = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return buffer
+    return cv2.resize(image, size, dst=buffer, interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY, width=None):
+    with _JPEG_LATENCY.time():
+        ret, buffer = cv2.imencode('.jpg', _resized(image, width),
+                                   [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return None
+    return buffer.tobytes()
+
+
+def multipart_part(jpeg):
+    return (b'--' + MULTIPART_BOUNDARY.encode() + b'\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+
+def part_renderer(settings):
+    """Callable turning an annotated BGR frame into a ready-to-send multipart part"""
+    def render(image):
+        jpeg = encode_jpeg(image, settings.quality, settings.width)
+        return None if jpeg is None else multipart_part(jpeg)
+    return render
@@ -0,0 +1,375 @@
+"""Run recognition for several cameras, one worker process per camera.
+
+Usage:
+    python supervisor.py cameras.json
+
+The config file lists the cameras and where attendance goes; see
+``cameras.example.json``. Every worker maps the same encoding cache
+read-only and matches against the mapped pages in place, so the gallery
+is in memory once for all of them (see ``matcher.FaceMatcher`` for the
+matching settings that need a private copy), and new enrollments are
+picked up without a restart. Attendance from all
+cameras goes through one ``attendance_writer.AttendanceWriter`` in the
+supervisor, tagged with the camera that saw the person. Workers that crash are restarted with backoff.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+from attendance_store import DEFAULT_STORE_PATH, SQLITE_BACKEND, open_attendance_store
+from attendance_writer import AttendanceWriter, SeenToday, seen_path
+from detectors import (DEFAULT_DETECTOR, FRAME_RESIZE_FACTOR, AdaptiveScaler, FaceLocator,
+                       RegionOfInterest, create_detector)
+from engine import RecognitionEngine, annotations, scene_summary
+from face_cache import CACHE_DIRECTORY, FaceEncodingCache, prepare_shared_cache
+from gallery import FACES_DIRECTORY, FaceGallery
+from pipeline import DROP_OLDEST, CapturedFrame, StageQueue
+from scheduler import FrameScheduler
+from tracker import FaceTracker
+
+# Constants
+FRAME_SKIP_RATE = 3              # for cameras with a fixed "frame_skip"; others use a FrameScheduler
+MAX_RECOGNITION_AGE = 1.0        # seconds; older frames are dropped
+ATTENDANCE_CHECK_INTERVAL = 300  # seconds between repeat events for one person per camera
+MONITOR_INTERVAL = 1.0
+RESTART_BACKOFF = 1.0            # seconds before the first restart of a crashed worker
+MAX_RESTART_BACKOFF = 60.0
+STABLE_RUN_TIME = 60.0           # a worker up this long has its backoff reset
+QUEUE_POLL_INTERVAL = 0.1
+
+# Per-camera counters shared with the supervisor
+CAPTURED, RECOGNIZED, DROPPED, RECOGNITION_SECONDS, EVENTS, SKIPPED, SCHEDULE_RATE = range(7)
+
+
+def load_config(path):
+    """Read a camera config file, filling in defaults"""
+    with open(path, 'r') as f:
+        config = json.load(f)
+    config.setdefault('faces', FACES_DIRECTORY)
+    config.setdefault('cache', CACHE_DIRECTORY)
+    config.setdefault('attendance', {})
+    config['attendance'].setdefault('backend', SQLITE_BACKEND)
+    config['attendance'].setdefault('path', DEFAULT_STORE_PATH)
+    ids = set()
+    for camera in config['cameras']:
+        if 'id' not in camera or 'source' not in camera:
+            raise ValueError(f"Camera entries need an 'id' and a 'source': {camera}")
+        if camera['id'] in ids:
+            raise ValueError(f"Duplicate camera id: {camera['id']}")
+        ids.add(camera['id'])
+        # Raises ValueError for unknown or out-of-range settings
+        FrameScheduler().configure(**camera.get('schedule', {}))
+    return config
+
+
+def open_source(camera):
+    source = camera['source']
+    capture = cv2.VideoCapture(source)
+    if 'width' in camera:
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, camera['width'])
+    if 'height' in camera:
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, camera['height'])
+    return capture
+
+
+def _capture_loop(camera, capture, frames, counters, stop_event, result, scheduler=None):
+    """Read frames, pacing recorded files to their own frame rate like a live camera"""
+    is_file = isinstance(camera['source'], str) and os.path.exists(camera['source'])
+    frame_interval = 1.0 / (capture.get(cv2.CAP_PROP_FPS) or 30.0) if is_file else 0.0
+    skip = camera.get('frame_skip', FRAME_SKIP_RATE)
+    seq = 0
+    next_frame = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            ret, image = capture.read()
+            if not ret:
+                if is_file and camera.get('loop'):
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                # A finished recording is a clean exit; a dead camera is a crash
+                result['error'] = None if is_file else f"Lost video source {camera['source']}"
+                break
+            counters[CAPTURED] += 1
+            now = time.monotonic()
+            if scheduler is not None:
+                offer = scheduler.decide(image, now)
+                counters[SCHEDULE_RATE] = scheduler.rate(now)
+            else:
+                offer = seq % skip == 0
+            if offer:
+                frames.put(CapturedFrame(seq, now, image), timeout=QUEUE_POLL_INTERVAL)
+            else:
+                counters[SKIPPED] += 1
+            seq += 1
+            if frame_interval:
+                next_frame += frame_interval
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.monotonic()
+    finally:
+        stop_event.set()
+
+
+class CameraEventSink:
+    """Engine sink that sends live, known faces to the supervisor, at most once per ``interval``"""
+
+    def __init__(self, events, camera_id, interval, counters):
+        self.events = events
+        self.camera_id = camera_id
+        self.interval = interval
+        self.counters = counters
+        self._last_seen = {}
+
+    def handle(self, frame, results, now):
+        for result in results:
+            if not (result.known and result.live):
+                continue
+            last = self._last_seen.get(result.name)
+            if last is None or now - last > self.interval:
+                self._last_seen[result.name] = now
+                self.events.put((self.camera_id, result.name, datetime.now()))
+                self.counters[EVENTS] += 1
+
+
+def camera_worker(camera, faces_directory, cache_directory, events, counters):
+    """Capture/recognition loop for one camera, run in its own process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor handles Ctrl+C
+    camera_id = camera['id']
+    gallery = FaceGallery(faces_directory, FaceEncodingCache(faces_directory, cache_directory))
+    roi = camera.get('roi')
+    locator = FaceLocator(create_detector(camera.get('detector', DEFAULT_DETECTOR),
+                                          **camera.get('detector_options', {})),
+                          resize_factor=camera.get('resize_factor', FRAME_RESIZE_FACTOR),
+                          roi=RegionOfInterest(roi) if roi else None,
+                          scaler=AdaptiveScaler() if camera.get('adaptive_scaling') else None)
+    liveness = None
+    if camera.get('liveness'):
+        from liveness import LivenessChecker
+
+        liveness = LivenessChecker()
+    interval = camera.get('attendance_interval', ATTENDANCE_CHECK_INTERVAL)
+    engine = RecognitionEngine(lambda: gallery.snapshot().matcher, locator,
+                               tracker=FaceTracker(), liveness=liveness,
+                               sinks=[CameraEventSink(events, camera_id, interval, counters)])
+
+    # Load the models and map the gallery before the first frame, so their
+    # cost does not count as that frame's recognition time
+    engine.encoder.load()
+    gallery.snapshot()
+
+    # Cameras with a fixed "frame_skip" recognize every Nth frame; the rest
+    # follow motion and load, tuned by an optional "schedule" object
+    scheduler = None
+    if 'frame_skip' not in camera:
+        scheduler = FrameScheduler(summarize=scene_summary)
+        scheduler.configure(**camera.get('schedule', {}))
+
+    capture = open_source(camera)
+    if not capture.isOpened():
+        raise SystemExit(f"[{camera_id}] Could not open video source {camera['source']}")
+    frames = StageQueue(1, DROP_OLDEST)
+    stop_event = threading.Event()
+    result = {'error': None}
+    capture_thread = threading.Thread(target=_capture_loop, name=f'capture-{camera_id}',
+                                      args=(camera, capture, frames, counters, stop_event, result,
+                                            scheduler),
+                                      daemon=True)
+    capture_thread.start()
+    print(f"[{camera_id}] Started on {camera['source']} (pid {os.getpid()})")
+
+    stale = 0
+    try:
+        while not stop_event.is_set():
+            frame = frames.get(timeout=QUEUE_POLL_INTERVAL)
+            # Frames replaced in the queue while recognition was busy count as dropped
+            counters[DROPPED] = stale + frames.dropped
+            if frame is None:
+                continue
+            if time.monotonic() - frame.timestamp > MAX_RECOGNITION_AGE:
+                stale += 1
+                continue
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            results = engine.process(frame.image)
+            latency = time.perf_counter() - start
+            if scheduler is not None:
+                scheduler.observe(annotations(results), latency, time.thread_time() - cpu_start,
+                                  time.monotonic())
+            counters[RECOGNITION_SECONDS] += latency
+            counters[RECOGNIZED] += 1
+    finally:
+        stop_event.set()
+        capture_thread.join()
+        capture.release()
+        counters[DROPPED] = stale + frames.dropped
+    if result['error']:
+        raise SystemExit(f"[{camera_id}] {result['error']}")
+    print(f"[{camera_id}] Video source finished")
+
+
+class CameraProcess:
+    """Bookkeeping for one camera's worker process"""
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.process = None
+        self.counters = multiprocessing.Array('d', 7)
+        self.started_at = None
+        self.ended_at = None
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF
+        self.restart_at = None
+        self.finished = False
+
+
+class CameraSupervisor:
+    """Starts one worker process per camera, restarts crashed ones and records their events"""
+
+    def __init__(self, config):
+        self.config = config
+        self.cameras = [CameraProcess(camera) for camera in config['cameras']]
+        self.events = multiprocessing.Queue()
+        self.store = open_attendance_store(config['attendance']['backend'],
+                                           config['attendance']['path'])
+        # Batching and the shared names-seen-today table work as in the app
+        self.writer = AttendanceWriter(self.store,
+                                       SeenToday(seen_path(config['attendance']['path'])))
+        self._stop_event = threading.Event()
+        self._forwarder = threading.Thread(target=self._forward_events, name='camera-events',
+                                           daemon=True)
+
+    def start(self):
+        prepare_shared_cache(self.config['faces'], self.config['cache'])
+        self._forwarder.start()
+        for camera in self.cameras:
+            self._spawn(camera)
+
+    def run(self, duration=None):
+        """Monitor workers until every source has finished, ``duration`` passes or Ctrl+C"""
+        deadline = None if duration is None else time.monotonic() + duration
+        try:
+            while not self._stop_event.is_set():
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                if self.monitor():
+                    break
+                time.sleep(MONITOR_INTERVAL)
+        except KeyboardInterrupt:
+            print("Stopping cameras")
+        finally:
+            self.stop()
+
+    def monitor(self):
+        """Restart crashed workers; returns True once every worker has finished cleanly"""
+        now = time.monotonic()
+        for camera in self.cameras:
+            if camera.finished:
+                continue
+            process = camera.process
+            if process is not None and process.is_alive():
+                if now - camera.started_at >= STABLE_RUN_TIME:
+                    camera.backoff = RESTART_BACKOFF
+                continue
+            if process is not None:
+                process.join()
+                camera.process = None
+                camera.ended_at = now
+                if process.exitcode == 0:
+                    camera.finished = True
+                    continue
+                camera.restart_at = now + camera.backoff
+                print(f"[{camera.camera['id']}] Worker exited with code {process.exitcode}; "
+                      f"restarting in {camera.backoff:.0f}s")
+                camera.backoff = min(camera.backoff * 2, MAX_RESTART_BACKOFF)
+            if camera.restart_at is not None and now >= camera.restart_at:
+                camera.restarts += 1
+                self._spawn(camera)
+        return all(camera.finished for camera in self.cameras)
+
+    def stop(self):
+        self._stop_event.set()
+        for camera in self.cameras:
+            if camera.process is not None and camera.process.is_alive():
+                camera.process.terminate()
+        for camera in self.cameras:
+            if camera.process is not None:
+                camera.process.join()
+                camera.ended_at = time.monotonic()
+        self._forwarder.join()
+        self.writer.stop()
+        self.store.close()
+
+    def stats(self):
+        cameras = {}
+        for camera in self.cameras:
+            captured, recognized, dropped, seconds, events, skipped, rate = camera.counters[:]
+            if camera.started_at is None:
+                elapsed = 0.0
+            elif camera.ended_at is not None and camera.ended_at >= camera.started_at:
+                elapsed = camera.ended_at - camera.started_at
+            else:
+                elapsed = time.monotonic() - camera.started_at
+            cameras[camera.camera['id']] = {
+                'running': camera.process is not None and camera.process.is_alive(),
+                'restarts': camera.restarts,
+                'capture_fps': captured / elapsed if elapsed else 0.0,
+                'recognition_fps': recognized / elapsed if elapsed else 0.0,
+                'mean_recognition_ms': seconds / recognized * 1000 if recognized else None,
+                'dropped_frames': int(dropped),
+                'skipped_frames': int(skipped),
+                'schedule_rate': round(rate, 3) if rate else None,
+                'events': int(events)
+            }
+        return {'cameras': cameras, 'recorded': self.writer.recorded,
+                'attendance': self.writer.stats()}
+
+    def _spawn(self, camera):
+        camera.restart_at = None
+        camera.ended_at = None
+        for i in range(len(camera.counters)):
+            camera.counters[i] = 0
+        camera.process = multiprocessing.Process(
+            target=camera_worker, name=f"camera-{camera.camera['id']}",
+            args=(camera.camera, self.config['faces'], self.config['cache'],
+                  self.events, camera.counters))
+        camera.process.start()
+        camera.started_at = time.monotonic()
+
+    def _forward_events(self):
+        # Camera processes cannot share the writer's thread, so their events come
+        # through one queue and are handed to it here
+        while True:
+            try:
+                camera_id, name, when = self.events.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    break
+                continue
+            self.writer.submit(name, when, camera_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run recognition for several cameras')
+    parser.add_argument('config', help='camera config file (JSON)')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='stop after this many seconds')
+    args = parser.parse_args()
+
+    supervisor = CameraSupervisor(load_config(args.config))
+    supervisor.start()
+    supervisor.run(args.duration)
+    print(json.dumps(supervisor.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
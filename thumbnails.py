@@ -0,0 +1,157 @@
+import os
+import queue
+import tempfile
+import threading
+
+import cv2
+
+from face_cache import CACHE_DIRECTORY, SUPPORTED_IMAGE_EXTENSIONS
+from metrics import log_event
+
+# Constants
+THUMBNAIL_DIRECTORY = os.path.join(CACHE_DIRECTORY, 'thumbnails')
+THUMBNAIL_SIZE = 300        # px, longest side; twice the 150 px cards for high-DPI screens
+THUMBNAIL_QUALITY = 80      # JPEG quality
+THUMBNAIL_SUFFIX = '.jpg'   # Dave.png is cached as Dave.png.jpg
+MAX_QUEUED_THUMBNAILS = 10000
+STOP_TIMEOUT = 10.0         # seconds stop() waits for queued thumbnails
+
+
+class ThumbnailCache:
+    """Small JPEG copies of the gallery photos, kept on disk next to the encoding cache.
+
+    A thumbnail carries its original's mtime, so it is stale exactly when
+    the two differ and ``Last-Modified`` can be sent for either. ``path()``
+    builds a missing or stale thumbnail on the spot; ``submit()`` queues
+    thumbnails for a background thread so enrollment does not wait for
+    them. Files are written next to their final name and renamed into
+    place, so workers sharing the directory never serve half a JPEG. As in
+    ``AttendanceWriter``, the thread is started on first use in each process.
+    """
+
+    def __init__(self, faces_directory, directory=THUMBNAIL_DIRECTORY, size=THUMBNAIL_SIZE,
+                 quality=THUMBNAIL_QUALITY, max_queued=MAX_QUEUED_THUMBNAILS):
+        self.faces_directory = faces_directory
+        self.directory = directory
+        self.size = size
+        self.quality = quality
+        self.max_queued = max_queued
+        self.generated = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._queued = set()
+        self._thread = None
+        self._pid = None
+
+    def thumbnail_path(self, filename):
+        return os.path.join(self.directory, filename + THUMBNAIL_SUFFIX)
+
+    def path(self, filename):
+        """Up-to-date thumbnail of an enrolled photo, or None if the photo does not exist"""
+        if os.path.basename(filename) != filename or \
+                not filename.lower().endswith(SUPPORTED_IMAGE_EXTENSIONS):
+            return None
+        try:
+            source = os.stat(os.path.join(self.faces_directory, filename))
+        except OSError:
+            return None
+        path = self.thumbnail_path(filename)
+        try:
+            if os.stat(path).st_mtime_ns == source.st_mtime_ns:
+                return path
+        except OSError:
+            pass
+        return self._generate(filename, source)
+
+    def submit(self, filenames):
+        """Build thumbnails for ``filenames`` in the background"""
+        with self._lock:
+            self._ensure_started()
+            for filename in filenames:
+                if filename in self._queued:
+                    continue
+                try:
+                    self._queue.put_nowait(filename)
+                except queue.Full:
+                    break  # built on first request instead
+                self._queued.add(filename)
+
+    def discard(self, filenames):
+        for filename in filenames:
+            try:
+                os.remove(self.thumbnail_path(filename))
+            except OSError:
+                pass
+
+    def pending(self):
+        with self._lock:
+            return len(self._queued)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Build what is queued and stop the thread"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._queue = queue.Queue(self.max_queued)
+        self._queued = set()
+        self._thread = threading.Thread(target=self._run, name='thumbnails', daemon=True)
+        self._pid = pid
+        self._thread.start()
+
+    def _run(self):
+        thumbnails = self._queue
+        while True:
+            filename = thumbnails.get()
+            if filename is None:
+                break
+            try:
+                self.path(filename)
+            except Exception as e:
+                self.errors += 1
+                log_event('thumbnail_error', filename=filename, error=str(e))
+            finally:
+                with self._lock:
+                    self._queued.discard(filename)
+
+    def _generate(self, filename, source):
+        image = cv2.imread(os.path.join(self.faces_directory, filename))
+        if image is None:
+            self.errors += 1
+            log_event('thumbnail_error', filename=filename, error='unreadable image')
+            return None
+        scale = self.size / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(image, (max(int(image.shape[1] * scale), 1),
+                                       max(int(image.shape[0] * scale), 1)),
+                               interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            self.errors += 1
+            log_event('thumbnail_error', filename=filename, error='encoding failed')
+            return None
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        path = self.thumbnail_path(filename)
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(jpeg.tobytes())
+            os.utime(temporary_path, ns=(source.st_atime_ns, source.st_mtime_ns))
+            os.replace(temporary_path, path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self.generated += 1
+        return path
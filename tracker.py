@@ -0,0 +1,169 @@
+import itertools
+import threading
+
+import cv2
+import numpy as np
+
+# Constants
+IOU_THRESHOLD = 0.3          # minimum overlap for a detection to continue a track
+MAX_MISSES = 3               # recognition frames a track may go undetected before it is dropped
+REVERIFY_INTERVAL = 5.0      # seconds between re-encoding a recognized track
+UNKNOWN_REVERIFY_INTERVAL = 1.0  # seconds between retries for tracks still unknown
+MAX_BOX_JUMP = 0.25          # size or centre change, as a fraction of the box, that forces re-encoding
+MIN_APPEARANCE_SIMILARITY = 0.5  # correlation of face chips below which the face may be someone else
+APPEARANCE_SIZE = (16, 16)   # face chip compared between frames
+
+
+def appearance(image, box, size=APPEARANCE_SIZE):
+    """Tiny zero-mean, unit-norm greyscale chip of a face, compared between frames by dot product"""
+    top, right, bottom, left = box
+    crop = image[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+    if crop.size == 0:
+        return None
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    chip = cv2.resize(crop, size, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    chip -= chip.mean()
+    norm = np.linalg.norm(chip)
+    return chip / norm if norm > 0 else None
+
+
+def box_jumped(previous, box, max_jump=MAX_BOX_JUMP):
+    """Whether ``box`` moved or resized by more than ``max_jump`` of ``previous``'s size"""
+    top, right, bottom, left = previous
+    width, height = right - left, bottom - top
+    new_width, new_height = box[1] - box[3], box[2] - box[0]
+    size = max(width, height, 1)
+    shift = max(abs((box[1] + box[3]) - (right + left)), abs((box[2] + box[0]) - (bottom + top))) / 2
+    return shift > max_jump * size or \
+        abs(new_width - width) > max_jump * max(width, 1) or \
+        abs(new_height - height) > max_jump * max(height, 1)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise intersection-over-union of ``(top, right, bottom, left)`` boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    __slots__ = ('id', 'box', 'match', 'verified_at', 'misses', 'hits', 'appearance')
+
+    def __init__(self, track_id, box, appearance=None):
+        self.id = track_id
+        self.box = box
+        self.match = None
+        self.verified_at = None
+        self.misses = 0
+        self.hits = 1
+        self.appearance = appearance
+
+
+class FaceTracker:
+    """Keeps face identities across frames so known faces are not re-encoded.
+
+    Detections are associated with existing tracks by greedy IoU matching.
+    Only new tracks, and tracks whose identity is older than the
+    re-verification interval, need the 128-d encoder; every other face
+    reuses its track's last match. Overlap alone cannot tell a person from
+    someone who took their place (a scene cut, a swap at the door), so a
+    track is also re-encoded when it went undetected on the previous
+    frame, when its box jumps by more than ``max_jump``, or, given the
+    frame, when its face chip stops resembling the last one.
+    """
+
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_misses=MAX_MISSES,
+                 reverify_interval=REVERIFY_INTERVAL,
+                 unknown_reverify_interval=UNKNOWN_REVERIFY_INTERVAL,
+                 max_jump=MAX_BOX_JUMP, min_similarity=MIN_APPEARANCE_SIMILARITY):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reverify_interval = reverify_interval
+        self.unknown_reverify_interval = unknown_reverify_interval
+        self.max_jump = max_jump
+        self.min_similarity = min_similarity
+        self.tracks = []
+        self.encodings_skipped = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def update(self, boxes, now, image=None):
+        """Associate this frame's detections with tracks.
+
+        ``image`` is the frame the boxes were found in, for the appearance
+        check. Returns ``(tracks, pending)``: the track for each box, and
+        the indices of boxes whose faces need encoding and ``assign()``.
+        """
+        boxes = [tuple(box) for box in boxes]
+        chips = [appearance(image, box) if image is not None else None for box in boxes]
+        with self._lock:
+            assigned = [None] * len(boxes)
+            unmatched_tracks = set(range(len(self.tracks)))
+            if boxes and self.tracks:
+                overlaps = iou_matrix([t.box for t in self.tracks], boxes)
+                # Greedy association, best overlap first
+                for flat in np.argsort(overlaps, axis=None)[::-1]:
+                    t, b = np.unravel_index(flat, overlaps.shape)
+                    if overlaps[t, b] < self.iou_threshold:
+                        break
+                    if t in unmatched_tracks and assigned[b] is None:
+                        assigned[b] = self.tracks[t]
+                        unmatched_tracks.discard(t)
+
+            for t in unmatched_tracks:
+                self.tracks[t].misses += 1
+            self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+            pending = []
+            for i, box in enumerate(boxes):
+                track = assigned[i]
+                if track is None:
+                    track = Track(next(self._ids), box, chips[i])
+                    self.tracks.append(track)
+                    assigned[i] = track
+                else:
+                    if self._may_differ(track, box, chips[i]):
+                        track.verified_at = None  # encode before trusting the old name
+                    track.box = box
+                    track.appearance = chips[i]
+                    track.misses = 0
+                    track.hits += 1
+                if self._needs_encoding(track, now):
+                    pending.append(i)
+                else:
+                    self.encodings_skipped += 1
+            return assigned, pending
+
+    def assign(self, track, match, now):
+        """Record a fresh match for ``track``"""
+        with self._lock:
+            track.match = match
+            track.verified_at = now
+
+    def reset(self):
+        with self._lock:
+            self.tracks = []
+
+    def _may_differ(self, track, box, chip):
+        if track.misses or box_jumped(track.box, box, self.max_jump):
+            return True
+        return chip is not None and track.appearance is not None and \
+            float(chip @ track.appearance) < self.min_similarity
+
+    def _needs_encoding(self, track, now):
+        if track.match is None or track.verified_at is None:
+            return True
+        if track.match.index is None:
+            interval = self.unknown_reverify_interval
+        else:
+            interval = self.reverify_interval
+        return now - track.verified_at >= interval
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from metrics import log_event
+
+# Warm-up states
+COLD = 'cold'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class Warmup:
+    """Runs a process's expensive start-up steps once, in order, off the request path.
+
+    ``steps`` is a list of ``(name, callable)``. ``start()`` runs them in a
+    background thread and ``run()`` in the caller's thread; either way they
+    run at most once, and again only after a failure. Under gunicorn with
+    ``preload_app`` the master runs them before forking, so workers start
+    ready and share the loaded models copy-on-write.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.state = COLD
+        self.error = None
+        self.timings = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+        self._condition = threading.Condition()
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def start(self):
+        """Warm up in a background thread; returns immediately"""
+        with self._condition:
+            if self.state in (WARMING, READY):
+                return
+            self._begin()
+            self._thread = threading.Thread(target=self._run_steps, name='warmup', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Warm up in this thread (or wait for a warm-up already running); returns ``ready``"""
+        with self._condition:
+            if self.state in (COLD, FAILED):
+                self._begin()
+                owner = True
+            else:
+                owner = False
+        if owner:
+            self._run_steps()
+        return self.wait()
+
+    def wait(self, timeout=None):
+        """Wait up to ``timeout`` seconds for a warm-up in progress; returns ``ready``"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.state != WARMING, timeout)
+            return self.state == READY
+
+    def status(self):
+        with self._condition:
+            return {
+                'state': self.state,
+                'ready': self.state == READY,
+                'error': self.error,
+                'seconds': {name: round(seconds, 3) for name, seconds in self.timings.items()},
+                'total_seconds': round(self.finished_at - self.started_at, 3)
+                if self.finished_at is not None else None
+            }
+
+    def _begin(self):
+        self.state = WARMING
+        self.error = None
+        self.timings = {}
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def _run_steps(self):
+        state = READY
+        for name, step in self.steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.error = f"{name}: {str(e)}"
+                state = FAILED
+                break
+            finally:
+                self.timings[name] = time.perf_counter() - start
+        with self._condition:
+            self.state = state
+            self.finished_at = time.perf_counter()
+            self._condition.notify_all()
+        log_event('warmup_' + state, error=self.error,
+                  seconds=round(self.finished_at - self.started_at, 3),
+                  steps={name: round(seconds, 3) for name, seconds in self.timings.items()})